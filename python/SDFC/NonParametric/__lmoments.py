@@ -86,6 +86,7 @@
 ## Libraries ##
 ###############
 
+import functools
 import numpy         as np
 import scipy.special as scs
 from SDFC.NonParametric.__quantile import quantile
@@ -103,7 +104,14 @@ def lmoments_matrix( size ):##{{{
 		Build a matrix to infer L-Moments in stationary case. If M = lmoments_matrix(Y.size), then
 		the fourth first L-Moments are just M.T @ np.sort(Y)
 		
+		The matrices are cached by size (the 32 last sizes used), so the matrix returned is read-only.
+		
 	"""
+	return _lmoments_matrix_cached( int(size) )
+##}}}
+
+@functools.lru_cache( maxsize = 32 )
+def _lmoments_matrix_cached( size ):##{{{
 	C0 = scs.binom( range( size ) , 1 )
 	C1 = scs.binom( range( size - 1 , -1 , -1 ) , 1 )
 	
@@ -120,23 +128,63 @@ def lmoments_matrix( size ):##{{{
 	M[:,1] = ( C0 - C1 ) / ( 2 * scs.binom( size , 2 ) )
 	M[:,2] = ( C2 - 2 * C0 * C1 + C3 ) / ( 3 * scs.binom( size , 3 ) )
 	M[:,3] = ( C4 - 3 * C2 * C1 + 3 * C0 * C3 - C5 ) / ( 4 * scs.binom( size , 4 ) )
+	M.flags.writeable = False
 	
 	return M
 ##}}}
 
-def _lmoments_stationary( Y ):##{{{
-	Ys = np.sort(Y.squeeze())
-	M = lmoments_matrix( Y.size )
-	return M.T @ Ys
+def _lmoments_stationary( Y , axis = None ):##{{{
+	"""
+	L-Moments from the probability weighted moments b_r = sum_j binom(j-1,r) / binom(n-1,r) Y_(j) / n. The weights of
+	b_{r+1} are those of b_r times (j-1-r) / (n-1-r), so they are built in O(n), without the matrix of lmoments_matrix.
+	If axis is given, the L-Moments are computed along this axis, which is replaced by the 4 L-Moments.
+	"""
+	if axis is None:
+		Y,axis = np.ravel(Y),0
+	Ys = np.moveaxis( np.sort( Y , axis = axis ) , axis , -1 )
+	n  = Ys.shape[-1]
+	j  = np.arange( n , dtype = float )
+	
+	b = np.zeros( Ys.shape[:-1] + (4,) )
+	w = np.zeros(n) + 1. / n
+	with np.errstate( divide = "ignore" , invalid = "ignore" ):
+		for r in range(4):
+			b[...,r] = Ys @ w
+			w = w * ( j - r ) / ( n - 1 - r )
+	
+	P = np.array( [ [1,0,0,0] , [-1,2,0,0] , [1,-6,6,0] , [-1,12,-30,20] ] )
+	return np.moveaxis( b @ P.T , -1 , axis )
 ##}}}
 
-def lmoments( Y , c_Y = None , order = None , lq = np.arange( 0.05 , 0.96 , 0.01 ) ):##{{{
+def _lmoments_stationary_counts( Y , counts ):##{{{
+	"""
+	L-Moments of each bootstrap replicate given by counts, from the probability weighted moments
+	b_r = sum_j binom(j-1,r) / binom(n-1,r) Y_(j) / n. Y is sorted only once: the copies of the i-th sorted value occupy
+	the positions S[i-1]+1 to S[i] of the sorted replicate (S is the cumulative sum of the counts), so their weights sum
+	to binom(S[i],r+1) - binom(S[i-1],r+1). The replicates can have different sizes.
+	"""
+	order = np.argsort( Y.ravel() )
+	Ys    = Y.ravel()[order]
+	C     = counts[:,order]
+	S     = np.cumsum( C , axis = 1 )
+	n     = S[:,-1].reshape(-1,1)
+	
+	b = np.zeros( (C.shape[0],4) )
+	for r in range(4):
+		b[:,r] = ( ( scs.binom( S , r + 1 ) - scs.binom( S - C , r + 1 ) ) / ( n * scs.binom( n - 1 , r ) ) ) @ Ys
+	
+	P = np.array( [ [1,0,0,0] , [-1,2,0,0] , [1,-6,6,0] , [-1,12,-30,20] ] )
+	return b @ P.T
+##}}}
+
+def lmoments( Y , c_Y = None , order = None , lq = np.arange( 0.05 , 0.96 , 0.01 ) , counts = None , axis = None ):##{{{
 	"""
 		SDFC.NonParametric.lmoments
 		===========================
 		
 		Estimate the lmoments of orders 1 to 4. If a covariate is given, a quantile regression is performed
-		and the instantaneous L-Moments are estimated from the quantile fitted.
+		and the instantaneous L-Moments are estimated from the quantile fitted. As the quantiles fitted are
+		linear in the covariate, the L-Moments are computed from the coefficients of the regression.
 		
 		Parameters
 		----------
@@ -148,23 +196,51 @@ def lmoments( Y , c_Y = None , order = None , lq = np.arange( 0.05 , 0.96 , 0.01
 			Integers between 1 and 4
 		lq    : np.array
 			Quantiles for quantile regression, only used if a covariate is given. Default is np.arange(0.05,0.96,0.01)
+		counts: np.array[ shape = (n_replicates,n_samples) ] or None
+			Bootstrap resampling counts, counts[b,i] is the number of times that the observation i is drawn in the
+			replicate b. If given, the L-Moments of all replicates are computed
+			at once, with shape (n_replicates,4). Only in stationary case.
+		axis  : integer or None
+			If given, the L-Moments of each series along this axis of Y are computed at once. In stationary case,
+			this axis is replaced by the 4 L-Moments, e.g. shape (4,n_series) for Y of shape (n_samples,n_series)
+			and axis = 0. With a covariate, shared by all the series, this axis is replaced by the axes
+			(n_samples,4) of the instantaneous L-Moments, e.g. shape (n_samples,4,n_series). Default is None, Y is
+			flattened.
 		
 		Returns
 		-------
 		The lmoments.
 	"""
 	
-	order = order if order is None else np.array( [order] , dtype = np.int ).squeeze() - 1
+	order = order if order is None else np.array( [order] , dtype = int ).squeeze() - 1
 	
-	if c_Y is None:
-		lmom = _lmoments_stationary(Y)
-		return lmom if order is None else lmom[order]
+	if counts is not None:
+		if c_Y is not None:
+			raise ValueError( "SDFC.NonParametric.lmoments: counts is only available in stationary case" )
+		lmom = _lmoments_stationary_counts( Y , counts )
+		return lmom if order is None else lmom[:,order]
+	elif c_Y is None:
+		lmom = _lmoments_stationary( Y , axis )
+		return lmom if order is None else np.take( lmom , order , axis = 0 if axis is None else axis )
+	elif axis is not None:
+		## All the series are fitted at once by the quantile regression, with the same covariates
+		if c_Y.ndim == 1: c_Y = c_Y.reshape(-1,1)
+		axis = axis % Y.ndim
+		Ys   = np.moveaxis( Y , axis , 0 )
+		coef = quantile( Ys.reshape(Ys.shape[0],-1) , lq , c_Y , value = False ).reshape( -1 , lq.size , c_Y.shape[1] + 1 )
+		L    = np.swapaxes( coef , 1 , 2 ) @ lmoments_matrix(lq.size)
+		lmom = L[:,:1,:] + c_Y @ L[:,1:,:]
+		lmom = np.moveaxis( lmom.reshape( Ys.shape[1:] + lmom.shape[1:] ) , [-2,-1] , [axis,axis+1] )
+		return lmom if order is None else np.take( lmom , order , axis = axis + 1 )
 	else:
 		Y = Y.reshape(-1,1)
 		if c_Y.ndim == 1: c_Y = c_Y.reshape(-1,1)
-		Yq = quantile( Y , lq , c_Y )
-		M  = lmoments_matrix(Yq.shape[1])
-		lmom = np.transpose( M.T @ Yq.T )
+		
+		## The quantiles fitted are linear in the covariates, and the L-Moments are linear in the quantiles, so the
+		## L-Moments are given by the coefficients of the quantile regression, without the n_samples x n_tau quantiles
+		coef = quantile( Y , lq , c_Y , value = False )
+		L    = coef.T @ lmoments_matrix(coef.shape[0])
+		lmom = L[0,:] + c_Y @ L[1:,:]
 		if order is None:
 			return lmom
 		else:
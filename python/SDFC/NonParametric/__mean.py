@@ -90,13 +90,14 @@ import numpy          as np
 import scipy.linalg   as scl
 
 from SDFC.tools.__Link import IdLink
+from SDFC.NonParametric.__lstsq import lstsq_counts
 
 
 ###############
 ## Functions ##
 ###############
 
-def mean( Y , c_Y = None , link = IdLink() , value = True ):
+def mean( Y , c_Y = None , link = IdLink() , value = True , counts = None ):
 	"""
 		SDFC.NonParametric.mean
 		=======================
@@ -113,13 +114,28 @@ def mean( Y , c_Y = None , link = IdLink() , value = True ):
 			Link function, default is identity
 		value : bool
 			If true return value fitted, else return coefficients of fit
+		counts : np.array[ shape = (n_replicates,n_samples) ] or None
+			Bootstrap resampling counts, counts[b,i] is the number of times that the observation i is drawn in the
+			replicate b. If given, the estimator is computed for all replicates at once, and a first axis of size
+			n_replicates is added to the output. Y can also be given for each replicate, with shape (n_replicates,n_samples).
 		
 		Returns
 		-------
 		The mean or the coefficients of the regression
 	"""
 	out,coef = None,None
-	if c_Y is None:
+	if counts is not None:
+		Y = Y.reshape(1,-1) if Y.size == counts.shape[1] else Y
+		if c_Y is None:
+			out  = np.sum( counts * Y , axis = 1 ) / np.sum( counts , axis = 1 )
+			coef = link.inverse(out)
+		else:
+			if c_Y.ndim == 1:
+				c_Y = c_Y.reshape(-1,1)
+			design = np.hstack( ( np.ones((c_Y.shape[0],1)) , c_Y ) )
+			coef = lstsq_counts( design , link.inverse(Y) , counts )
+			out  = link( coef @ design.T )
+	elif c_Y is None:
 		out = np.mean(Y)
 		coef = link.inverse(out)
 	else:
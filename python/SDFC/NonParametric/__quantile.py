@@ -87,13 +87,14 @@
 ###############
 
 import numpy as np
+import scipy.sparse as ssp
 from SDFC.NonParametric.__NonParametric_cpp  import QuantileRegression
 
 ###############
 ## Functions ##
 ###############
 
-def quantile( Y , ltau , c_Y = None , value = True ):
+def quantile( Y , ltau , c_Y = None , value = True , preprocessing = False ):
 	"""
 		SDFC.NonParametric.quantile
 		===========================
@@ -103,15 +104,25 @@ def quantile( Y , ltau , c_Y = None , value = True ):
 		Parameters
 		----------
 		Y       : np.array
-			Dataset to fit the quantile
+			Dataset to fit the quantile. With a covariate, Y can be of shape
+			(n_samples,n_series), the series are then fitted at once with the
+			same covariate, the coefficients are of shape
+			(n_series,n_tau,n_features+1) and the quantiles of shape
+			(n_series,n_samples,n_tau).
 		ltau    : np.array
 			The quantile to fit, between 0 and 1
-		c_Y   : np.array or None
-			Covariate(s)
+		c_Y   : np.array, scipy.sparse matrix or None
+			Covariate(s). A sparse matrix (e.g. with indicator covariates) is
+			read in place in CSC or CSR format, and the fit uses a sparse
+			factorization.
 		link  : class based on SDFC.tools.Link
 			Link function, default is identity
 		value : bool
 			If true return value fitted, else return coefficients of fit
+		preprocessing : bool
+			If true, the quantile regression is fitted with the preprocessing
+			of Portnoy and Koenker (fit on a subsample, then on a reduced
+			problem), much faster for large datasets. Default is False.
 		
 		Returns
 		-------
@@ -127,9 +138,17 @@ def quantile( Y , ltau , c_Y = None , value = True ):
 		coef = q.copy()
 	else:
 		reg  = QuantileRegression( ltau = ltau )
-		reg.fit( Y , c_Y )
-		q    = reg.quantiles
-		coef = reg.coef_
+		reg.set_fit_params( preprocessing = bool(preprocessing) )
+		if np.ndim(Y) == 2 and Y.shape[1] > 1:
+			reg.fit_many( Y , c_Y )
+			coef = reg.coef_
+			if value:
+				X = c_Y if ssp.issparse(c_Y) else np.reshape( c_Y , (Y.shape[0],-1) )
+				q = np.stack( [ X @ c[:,1:].T + c[:,0] for c in coef ] )
+		else:
+			reg.fit( Y , c_Y , quantiles = value )
+			q    = reg.quantiles if value else None
+			coef = reg.coef_
 	return q if value else coef
 
 
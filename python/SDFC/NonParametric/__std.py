@@ -91,13 +91,14 @@ import scipy.linalg as scl
 
 from SDFC.NonParametric.__var import var
 from SDFC.tools.__Link        import IdLink
+from SDFC.NonParametric.__lstsq import lstsq_counts
 
 
 ###############
 ## Functions ##
 ###############
 
-def std( Y , c_Y = None , m_Y = None , link = IdLink() , value = True ):
+def std( Y , c_Y = None , m_Y = None , link = IdLink() , value = True , counts = None ):
 	"""
 		SDFC.NonParametric.std
 		======================
@@ -116,15 +117,23 @@ def std( Y , c_Y = None , m_Y = None , link = IdLink() , value = True ):
 			Link function, default is identity
 		value : bool
 			If true return value fitted, else return coefficients of fit
+		counts : np.array[ shape = (n_replicates,n_samples) ] or None
+			Bootstrap resampling counts, counts[b,i] is the number of times that the observation i is drawn in the
+			replicate b. If given, the estimator is computed for all replicates at once, and a first axis of size
+			n_replicates is added to the output. Y can also be given for each replicate, with shape (n_replicates,n_samples).
 		
 		Returns
 		-------
 		The standard deviation
 	"""
-	out = np.sqrt( var( Y , c_Y , m_Y , link ) )
+	out = np.sqrt( var( Y , c_Y , m_Y , link , counts = counts ) )
 	if not value:
 		if c_Y is None:
 			coef = link.inverse(out)
+		elif counts is not None:
+			if c_Y.ndim == 1: c_Y = c_Y.reshape(-1,1)
+			design = np.hstack( ( np.ones((c_Y.shape[0],1)) , c_Y ) )
+			coef = lstsq_counts( design , link.inverse( out ) , counts )
 		else:
 			if c_Y.ndim == 1: c_Y = c_Y.reshape(-1,1)
 			design = np.hstack( ( np.ones((Y.size,1)) , c_Y ) )
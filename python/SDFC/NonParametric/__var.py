@@ -90,13 +90,14 @@ import numpy        as np
 import scipy.linalg as scl
 
 from SDFC.tools.__Link import IdLink
+from SDFC.NonParametric.__lstsq import lstsq_counts
 
 
 ###############
 ## Functions ##
 ###############
 
-def var( Y , c_Y = None , m_Y = None , link = IdLink() , value = True ):
+def var( Y , c_Y = None , m_Y = None , link = IdLink() , value = True , counts = None ):
 	"""
 		SDFC.NonParametric.var
 		======================
@@ -115,13 +116,35 @@ def var( Y , c_Y = None , m_Y = None , link = IdLink() , value = True ):
 			Link function, default is identity
 		value : bool
 			If true return value fitted, else return coefficients of fit
+		counts : np.array[ shape = (n_replicates,n_samples) ] or None
+			Bootstrap resampling counts, counts[b,i] is the number of times that the observation i is drawn in the
+			replicate b. If given, the estimator is computed for all replicates at once, and a first axis of size
+			n_replicates is added to the output. Y can also be given for each replicate, with shape (n_replicates,n_samples).
 		
 		Returns
 		-------
 		The variance
 	"""
 	out,coef = None,None
-	if c_Y is None:
+	if counts is not None:
+		Y = Y.reshape(1,-1) if Y.size == counts.shape[1] else Y
+		n_counts = np.sum( counts , axis = 1 ).reshape(-1,1)
+		if c_Y is None:
+			m_Y  = np.sum( counts * Y , axis = 1 ).reshape(-1,1) / n_counts
+			out  = np.sum( counts * ( Y - m_Y )**2 , axis = 1 ) / n_counts.squeeze()
+			coef = link.inverse(out)
+		else:
+			if m_Y is None:
+				m_Y = np.sum( counts * Y , axis = 1 ).reshape(-1,1) / n_counts
+			else:
+				m_Y = np.array(m_Y)
+				m_Y = m_Y.reshape(1,-1) if m_Y.size in [1,counts.shape[1]] else m_Y
+			Yres = ( Y - m_Y )**2
+			if c_Y.ndim == 1: c_Y = c_Y.reshape(-1,1)
+			design = np.hstack( ( np.ones((c_Y.shape[0],1)) , c_Y ) )
+			coef = lstsq_counts( design , link.inverse( Yres ) , counts )
+			out  = np.abs( link( coef @ design.T ) )
+	elif c_Y is None:
 		out  = np.var(Y)
 		coef = link.inverse(out)
 	else:
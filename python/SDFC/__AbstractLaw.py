@@ -86,11 +86,171 @@
 ## Libraries ##
 ###############
 
+import os
+import copy
+import concurrent.futures as cf
 import numpy          as np
 import scipy.stats    as sc
 import scipy.optimize as sco
 import texttable      as tt
 from SDFC.tools.__LawParams import LawParams
+from SDFC.tools.__streaming import RunningMoments
+from SDFC.tools.__streaming import P2Quantile
+from SDFC.tools.__grid      import _init_worker
+from SDFC.tools.__grid      import _to_shared
+from SDFC.tools.__grid      import _split_kwargs
+from SDFC.tools.__grid      import _worker_arrays
+
+
+###############
+## Functions ##
+###############
+
+def _bootstrap_replicates( law , Y , seeds , kind , kwargs , n_newton = None ):##{{{
+	"""
+	Fit law on one bootstrap replicate per seed, and return the list of coef_. This function is defined at the module
+	level so that it can be sent to the workers of a process pool. The global numpy random state (used by some
+	initializations) is drawn from the seed and restored at the end, so that each replicate only depends on its seed.
+	
+	If kind is "resample" (and n_newton is None), the dataset is resampled and the law params are rebuilt for each
+	replicate. Otherwise law.params and law._Y must be already built on the full dataset, the replicate is given by the
+	observation weights (resampling counts, or drawn from a multinomial or a Poisson law), or for kind "parametric" by
+	the row of Y (shape = (len(seeds),n_samples)) drawn from the fitted law, and the fit is started from the coef_ of
+	law. If n_newton is given, the fit is replaced by n_newton Newton steps, see AbstractLaw._fit_newton.
+	"""
+	state    = np.random.get_state()
+	coefs    = []
+	weighted = kind != "resample" or n_newton is not None
+	if weighted:
+		coef_ = law.coef_.copy()
+		Y_    = law._Y
+	for i,seed in enumerate(seeds):
+		rng = np.random.default_rng(seed)
+		np.random.seed( rng.integers( 2**32 ) )
+		if not weighted:
+			idx = rng.choice( Y.size , Y.size , replace = True )
+			law.params = LawParams( kinds = law.kinds_params )
+			law.params.add_params( n_samples = Y.size , resample = idx , **kwargs )
+			law._Y = Y.reshape(-1,1)[idx,:]
+		else:
+			if kind == "parametric":
+				law._Y = Y[i,:].reshape(-1,1)
+			elif kind == "resample":
+				law._weights = np.bincount( rng.choice( Y.size , Y.size , replace = True ) , minlength = Y.size ).reshape(-1,1)
+			elif kind == "multinomial":
+				law._weights = rng.multinomial( Y.size , np.repeat( 1. / Y.size , Y.size ) ).reshape(-1,1)
+			else:
+				law._weights = rng.poisson( size = Y.size ).reshape(-1,1)
+			law.coef_ = coef_
+		if law.method not in [ "mle" , "bayesian" ]:
+			law._fit()
+		elif law.method == "bayesian":
+			law._fit_bayesian(**kwargs)
+		elif n_newton is not None:
+			law._fit_newton( n_newton )
+		else:
+			law._fit_mle( warm_start = weighted )
+		coefs.append( law.coef_ )
+	if weighted:
+		law._weights = None
+		law._Y       = Y_
+		law.coef_    = coef_
+	np.random.set_state(state)
+	return coefs
+##}}}
+
+def _bootstrap_blb( law , Y , seed , n_samples , n_bootstrap , kwargs , n_newton , coef_ ):##{{{
+	"""
+	Fit the n_bootstrap replicates of one subset of the Bag of Little Bootstraps. Y and kwargs are the subset, and each
+	replicate is given by multinomial counts of the subset summing to n_samples. Likelihood fits use the counts as
+	weights and start from coef_. Other methods use the batched estimator of the law, or, if not available, fit the
+	resample rebuilt from the counts.
+	"""
+	state = np.random.get_state()
+	rng   = np.random.default_rng(seed)
+	np.random.seed( rng.integers( 2**32 ) )
+	
+	law.params = LawParams( kinds = law.kinds_params )
+	law.params.add_params( n_samples = Y.size , resample = None , **kwargs )
+	law._Y = Y.reshape(-1,1)
+	counts = rng.multinomial( n_samples , np.repeat( 1. / Y.size , Y.size ) , size = n_bootstrap )
+	
+	coefs = None if law.method in ["mle","bayesian"] else law._fit_batch(counts)
+	if coefs is None:
+		coefs = []
+		for c in counts:
+			if law.method in ["mle","bayesian"]:
+				law._weights = c.reshape(-1,1)
+				law.coef_    = coef_
+			else:
+				idx = np.repeat( np.arange(Y.size) , c )
+				law.params = LawParams( kinds = law.kinds_params )
+				law.params.add_params( n_samples = idx.size , resample = idx , **kwargs )
+				law._Y = Y.reshape(-1,1)[idx,:]
+			if law.method not in [ "mle" , "bayesian" ]:
+				law._fit()
+			elif law.method == "bayesian":
+				law._fit_bayesian(**kwargs)
+			elif n_newton is not None:
+				law._fit_newton( n_newton )
+			else:
+				law._fit_mle( warm_start = True )
+			coefs.append( law.coef_ )
+	np.random.set_state(state)
+	return np.array(coefs)
+##}}}
+
+def _subset_kwargs( kwargs , idx , n_samples ):##{{{
+	"""
+	Restrict the covariates and the fixed values of kwargs (arrays of length n_samples) to the observations idx
+	"""
+	out = {}
+	for k in kwargs:
+		v = kwargs[k]
+		if k[:2] in ["c_","f_"] and np.ndim(v) > 0 and np.shape(v)[0] == n_samples:
+			v = np.asarray(v)[idx]
+		out[k] = v
+	return out
+##}}}
+
+## Law of the replicates and arguments of the fit, kept by each worker of the bootstrap pool
+_worker_bootstrap = {}
+
+def _init_bootstrap_worker( law , descriptions , static_kwargs ):##{{{
+	"""
+	Initializer of the workers of the bootstrap pool: attach the dataset and the array arguments of the fit from the
+	shared memory, and keep the law of the replicates, so that the tasks only carry the seeds.
+	"""
+	_init_worker( descriptions , None )
+	kwargs = dict(static_kwargs)
+	for key in _worker_arrays:
+		if key != "Y":
+			kwargs[key] = _worker_arrays[key]
+	_worker_bootstrap["law"]    = law
+	_worker_bootstrap["kwargs"] = kwargs
+##}}}
+
+def _bootstrap_worker( seeds , kind , n_newton , Y = None ):##{{{
+	"""
+	Task of a worker of the bootstrap pool, see _bootstrap_replicates. The law and the data are those attached by
+	_init_bootstrap_worker, for the parametric bootstrap Y is the array of the datasets drawn for the seeds.
+	"""
+	Y = _worker_arrays["Y"] if Y is None else Y
+	return _bootstrap_replicates( _worker_bootstrap["law"] , Y , seeds , kind , _worker_bootstrap["kwargs"] , n_newton )
+##}}}
+
+def _bootstrap_counts( seeds , size ):##{{{
+	"""
+	Resampling counts, with shape (len(seeds),size), of the same resamples as the ones drawn by _bootstrap_replicates
+	with kind = "resample".
+	"""
+	counts = np.zeros( (len(seeds),size) )
+	for i,seed in enumerate(seeds):
+		rng = np.random.default_rng(seed)
+		rng.integers( 2**32 )
+		counts[i,:] = np.bincount( rng.choice( size , size , replace = True ) , minlength = size )
+	return counts
+##}}}
 
 
 ###########
@@ -109,19 +269,71 @@ class AbstractLaw:
 		method used to fit
 	coef_  : numpy.ndarray
 		Coefficients fitted
-	coefs_bootstrap: numpy.ndarray
-		coef_ for each bootstrap
+	coefs_bootstrap: numpy.ndarray or None
+		coef_ for each bootstrap, None if store_bootstrap is False
+	mean_bootstrap : numpy.ndarray
+		Mean of the coef_ of the bootstrap
+	cov_bootstrap  : numpy.ndarray
+		Covariance matrix of the coef_ of the bootstrap
 	confidence interval: numpy.ndarray[ shape = (2,coef_.size) ]
 		Confidence interval, first line is the alpha/2 quantile, and second line the 1 - alpha/2 quantile
 	alpha          : float
 		Level of confidence interval
 	
+	Optional arguments for bootstrap
+	--------------------------------
+	Given at the initialization of the law, with n_bootstrap and alpha.
+	n_jobs   : None or integer
+		Numbers of processes used to fit the bootstrap replicates, default is 1 (sequential). If -1, all cpus are used.
+	executor : None or concurrent.futures.Executor
+		Executor used to fit the bootstrap replicates, replace n_jobs if given.
+	seed     : None, integer or numpy.random.SeedSequence
+		Seed of the bootstrap. Each replicate draws its resampling from its own numpy.random.Generator, spawned from
+		this seed, so coefs_bootstrap does not depend of n_jobs.
+	bootstrap: None or string
+		Kind of bootstrap, default is "resample", i.e. the dataset is resampled, and the design matrices are rebuilt,
+		for each replicate. For the "mle" and "bayesian" methods, "multinomial" and "poisson" express each replicate as
+		weights of the observations (drawn from a multinomial or a Poisson(1) law) in the likelihood, the design
+		matrices are built only once and each fit starts from the coef_ fitted on the full dataset.
+		"parametric" draws the datasets of the replicates from the fitted law, at the observed covariates (all datasets
+		of a batch in one draw), and refits them, starting from the coef_ fitted for the "mle" and "bayesian" methods.
+		For the closed-form methods ("moments", "lmoments"), the resamples are expressed as counts of the observations,
+		and all replicates are fitted at once with batched estimators (if available for the law and its configuration).
+		"blb" is the Bag of Little Bootstraps, for very large datasets: blb_subsets subsets of size n_samples**blb_gamma
+		are drawn, n_bootstrap replicates are fitted on each subset with multinomial weights summing to n_samples, and
+		the confidence interval is the mean of the confidence intervals of the subsets. The memory and the time of each
+		replicate scale with the size of the subsets.
+	blb_gamma   : None or float
+		Size of the subsets of the Bag of Little Bootstraps is n_samples**blb_gamma, default is 0.7.
+	blb_subsets : None or integer
+		Numbers of subsets of the Bag of Little Bootstraps, default is 10.
+	n_newton : None or integer
+		Only for the "mle" method. If given, the fit of each replicate is approximated by n_newton Newton steps on its
+		likelihood, started from the coef_ fitted on the full dataset, with the inverse Hessian law.cov of the full
+		dataset. Default is None, i.e. each replicate is fully refitted (use it to validate the approximation).
+	store_bootstrap : None or bool
+		If False, the coef_ of the replicates are not kept (coefs_bootstrap is None), only running summaries are
+		updated: mean_bootstrap and cov_bootstrap with the Welford algorithm, and the confidence interval with the P²
+		streaming quantile estimator (the BLB uses the exact quantiles of each subset). Default is True, and the
+		confidence interval is given by numpy.quantile.
+	callback : None or function
+		Called as callback( n , confidence_interval ) each time a chunk of replicates is fitted, n being the numbers of
+		replicates already fitted. The attribute confidence_interval of the law is also updated after each chunk.
+	bootstrap_tol   : None or float
+		Adaptive bootstrap (not for "blb"). If given, the replicates are fitted by batches of bootstrap_batch (default
+		100), until the Monte Carlo error of each bound of the confidence interval is lower than bootstrap_tol times the
+		standard deviation of the replicates; n_bootstrap is then the maximal numbers of replicates. The numbers of
+		replicates used and the Monte Carlo error of the confidence interval are given by law.info.n_bootstrap and
+		law.info.mc_error. Default is None, i.e. n_bootstrap replicates are fitted.
+	bootstrap_batch : None or integer
+		Size of the batches of the adaptive bootstrap, default is 100.
 	
 	Fit method
 	==========
 	
 	The method <law>.fit is generic, and takes arguments of the form <type for param>_<name of param>, see below.
 	In case of Bayesian fit, some others optional parameters are available.
+	The method <law>.fit_many fits by MLE many series sharing the same covariates at once, see its documentation.
 	
 	Arguments
 	---------
@@ -136,6 +348,13 @@ class AbstractLaw:
 	
 	Optional arguments for MLE fit
 	------------------------------
+	optimizer : None or string
+		Optimizer of the likelihood, "BFGS" (default), "trust-exact" or "Newton-CG". The two last use the analytic
+		Hessian of the negative log-likelihood. In all cases, law.cov is the inverse of the analytic Hessian at the
+		fitted coef_ (if it is available for the law and the links), otherwise the BFGS approximation.
+	init      : None or numpy.ndarray
+		Initial coef_ of the optimizer (warm start), e.g. the coef_ of a previous fit on close data. It is ignored
+		if the likelihood is not finite at init.
 	
 	Optional arguments for Bayesian fit
 	-----------------------------------
@@ -181,33 +400,276 @@ class AbstractLaw:
 	#####################################################################
 	
 	class _Bootstrap:##{{{
-		def __init__( self , n_bootstrap , alpha ):##{{{
+		def __init__( self , n_bootstrap , alpha , **kwargs ):##{{{
 			self.n_bootstrap         = n_bootstrap
 			self.coefs_bootstrap     = None
 			self.confidence_interval = None
 			self.alpha               = alpha
+			self.n_jobs              = 1 if kwargs.get("n_jobs") is None else kwargs.get("n_jobs")
+			self.executor            = kwargs.get("executor")
+			self.seed                = kwargs.get("seed")
+			self.kind                = "resample" if kwargs.get("bootstrap") is None else kwargs.get("bootstrap").lower()
+			if self.kind not in ["resample","multinomial","poisson","parametric","blb"]:
+				raise ValueError( "SDFC: bootstrap must be 'resample', 'multinomial', 'poisson', 'parametric' or 'blb'" )
+			self.n_newton            = kwargs.get("n_newton")
+			self.blb_gamma           = 0.7 if kwargs.get("blb_gamma")   is None else kwargs.get("blb_gamma")
+			self.blb_subsets         = 10  if kwargs.get("blb_subsets") is None else kwargs.get("blb_subsets")
+			self.store               = True if kwargs.get("store_bootstrap") is None else kwargs.get("store_bootstrap")
+			self.callback            = kwargs.get("callback")
+			self.tol                 = kwargs.get("bootstrap_tol")
+			self.batch               = 100 if kwargs.get("bootstrap_batch") is None else kwargs.get("bootstrap_batch")
+			self.moments             = None
+			self._pool               = None
+			self._shm                = None
+			self._batched            = None
+			self._quantiles          = None
+			self._n_fitted           = 0
+		##}}}
+		
+		def _reset( self ):##{{{
+			self.coefs_bootstrap     = [] if self.store else None
+			self.confidence_interval = None
+			self.moments             = RunningMoments()
+			self._quantiles          = [ P2Quantile( self.alpha / 2. ) , P2Quantile( 1 - self.alpha / 2. ) ]
+			self._n_fitted           = 0
+			self._batched            = None
+		##}}}
+		
+		def _update( self , coefs ):##{{{
+			"""
+			Add a chunk of replicates to the running summaries, and update the (partial) confidence interval
+			"""
+			for c in coefs:
+				self.moments.update(c)
+				if not self.store:
+					for q in self._quantiles:
+						q.update(c)
+			self._n_fitted += len(coefs)
+			if self.store:
+				self.coefs_bootstrap.extend(coefs)
+				self.confidence_interval = np.quantile( np.array(self.coefs_bootstrap) , [ self.alpha / 2. , 1 - self.alpha / 2.] , axis = 0 )
+			else:
+				self.confidence_interval = np.array( [ q.quantile for q in self._quantiles ] )
+			if self.callback is not None:
+				self.callback( self._n_fitted , self.confidence_interval )
+		##}}}
+		
+		def _n_workers( self ):##{{{
+			n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+			if self.executor is not None and n_jobs < 2:
+				n_jobs = os.cpu_count()
+			return max( n_jobs , 1 )
+		##}}}
+		
+		def _map( self , func , *iterables ):##{{{
+			"""
+			Generator of map(func,*iterables), sequentially or with the pool of workers opened by run. Results are yielded
+			in order, as soon as they are available.
+			"""
+			if self._pool is None:
+				yield from map( func , *iterables )
+			else:
+				yield from self._pool.map( func , *iterables )
+		##}}}
+		
+		def _mc_error( self ):##{{{
+			"""
+			Monte Carlo error (standard error) of the two bounds of the confidence interval, shape (2,coef_.size). If the
+			replicates are stored, it is the half width of the distribution free interval given by the order statistics
+			B*p -+ sqrt( B*p*(1-p) ), otherwise the normal approximation sqrt( p*(1-p) / B ) / density, scaled by the
+			standard deviation of the replicates, is used.
+			"""
+			B   = self._n_fitted
+			err = []
+			for p in [ self.alpha / 2. , 1 - self.alpha / 2.]:
+				if self.store:
+					X  = np.sort( np.array(self.coefs_bootstrap) , axis = 0 )
+					h  = np.sqrt( B * p * (1 - p) )
+					lo = min( max( int(np.floor( B * p - h )) , 0 ) , B - 1 )
+					up = min( max( int(np.ceil(  B * p + h )) , 0 ) , B - 1 )
+					err.append( ( X[up,:] - X[lo,:] ) / 2 )
+				else:
+					err.append( np.sqrt( p * (1 - p) / B ) / sc.norm.pdf( sc.norm.ppf(p) ) * np.sqrt(np.diag(self.moments.cov)) )
+			return np.array(err)
+		##}}}
+		
+		def _converged( self ):##{{{
+			"""
+			True if the Monte Carlo error of all bounds is lower than tol times the standard deviation of the replicates
+			"""
+			if self._n_fitted < 2:
+				return False
+			sd = np.sqrt(np.diag(self.moments.cov))
+			return bool(np.all( self._mc_error() <= self.tol * sd ))
+		##}}}
+		
+		def _fit_replicates( self , replicate , Y , seeds , kind , n_newton , kwargs ):##{{{
+			"""
+			Fit the replicates given by seeds, and add them to the summaries. For the parametric bootstrap, Y is the array
+			of the datasets drawn, one row per seed.
+			"""
+			## Closed-form methods, all replicates at once (by blocks to bound the memory)
+			a = 0
+			if kind == "resample" and replicate.method in ["moments","lmoments"] and self._batched is not False:
+				block = max( 1 , int(1e7) // Y.size )
+				while a < len(seeds):
+					batch = replicate._fit_batch( _bootstrap_counts( seeds[a:a+block] , Y.size ) )
+					self._batched = batch is not None
+					if batch is None:
+						break
+					self._update( list(batch) )
+					a += block
+			
+			## Otherwise remaining replicates are split in chunks, sent to the workers. With the pool opened by _open_pool,
+			## the law and the data are already in the workers, and the tasks only carry the seeds (and the drawn datasets
+			## of the parametric bootstrap)
+			if a < len(seeds):
+				n_chunks = min( len(seeds) - a , max( 20 , 4 * self._n_workers() ) )
+				bounds   = np.linspace( a , len(seeds) , n_chunks + 1 ).astype(int)
+				chunks   = [ seeds[a:b] for a,b in zip(bounds[:-1],bounds[1:]) ]
+				l_Y      = [ Y[a:b,:] for a,b in zip(bounds[:-1],bounds[1:]) ] if kind == "parametric" else [Y] * n_chunks
+				if self._shm is not None:
+					l_Y   = l_Y if kind == "parametric" else [None] * n_chunks
+					tasks = self._map( _bootstrap_worker , chunks , [kind] * n_chunks , [n_newton] * n_chunks , l_Y )
+				else:
+					tasks = self._map( _bootstrap_replicates , [replicate] * n_chunks , l_Y , chunks , [kind] * n_chunks , [kwargs] * n_chunks , [n_newton] * n_chunks )
+				for c in tasks:
+					self._update(c)
+		##}}}
+		
+		def run( self , law , Y , **kwargs ):##{{{
+			
+			## Replicates are fitted with a copy of the law, without bootstrap
+			replicate = type(law)( method = law.method )
+			replicate._info.cov  = law.cov
+			replicate._optimizer = law._optimizer
+			n_newton = self.n_newton if law.method == "mle" else None
+			self._reset()
+			
+			## The pool of workers is opened by _run or _run_blb, and kept open for all the batches
+			self._pool = self.executor
+			try:
+				if self.kind == "blb":
+					self._run_blb( law , replicate , Y , n_newton , **kwargs )
+				else:
+					self._run( law , replicate , Y , n_newton , **kwargs )
+			finally:
+				self._close_pool()
+			
+			if self.store:
+				self.coefs_bootstrap = np.array( self.coefs_bootstrap )
+			law._info.n_bootstrap = self._n_fitted
+			law._info.mc_error    = None if self.kind == "blb" or self._n_fitted < 2 else self._mc_error()
+		##}}}
+		
+		def _open_pool( self , replicate = None , Y = None , kwargs = None ):##{{{
+			"""
+			Open the pool of workers if n_jobs > 1 and no executor is given. If replicate is given, the dataset Y and the
+			arrays of kwargs are placed in shared memory, and sent once to each worker with the law replicate by the
+			initializer of the pool, instead of with each task.
+			"""
+			if self.executor is not None or self._n_workers() < 2:
+				return
+			if replicate is None:
+				self._pool = cf.ProcessPoolExecutor( max_workers = self._n_workers() )
+				return
+			arrays,static_kwargs = _split_kwargs(kwargs)
+			arrays["Y"] = Y
+			self._shm,descriptions = [],{}
+			for key in arrays:
+				shm,descriptions[key] = _to_shared(arrays[key])
+				self._shm.append(shm)
+			self._pool = cf.ProcessPoolExecutor( max_workers = self._n_workers() , initializer = _init_bootstrap_worker , initargs = (replicate,descriptions,static_kwargs) )
+		##}}}
+		
+		def _close_pool( self ):##{{{
+			"""
+			Shutdown the pool opened by _open_pool, and release the shared memory
+			"""
+			if self._pool is not None and self._pool is not self.executor:
+				self._pool.shutdown( cancel_futures = True )
+			self._pool = None
+			if self._shm is not None:
+				for shm in self._shm:
+					shm.close()
+					shm.unlink()
+			self._shm = None
+		##}}}
+		
+		def _run( self , law , replicate , Y , n_newton , **kwargs ):##{{{
+			"""
+			Resampling bootstrap. If tol is given, the replicates are fitted by batches of size batch, until the Monte Carlo
+			error of the confidence interval is lower than tol (relatively to the standard deviation of the replicates), or
+			until n_bootstrap replicates are fitted.
+			"""
+			
+			## One independent stream per replicate, the draws do not depend of the number of workers
+			seeds = np.random.SeedSequence(self.seed).spawn(self.n_bootstrap)
+			
+			kind = self.kind if law.method in ["mle","bayesian"] or self.kind == "parametric" else "resample"
+			if kind != "resample" or n_newton is not None or law.method in ["moments","lmoments"]:
+				replicate.params = copy.deepcopy(law.params)
+				replicate._Y     = Y.reshape(-1,1)
+			self._open_pool( replicate , Y , kwargs )
+			
+			## Parametric bootstrap, the datasets are drawn from the fitted law, in one draw by batch (or by block of
+			## the batch to bound the memory)
+			rng   = np.random.default_rng( np.random.SeedSequence(self.seed) ) if kind == "parametric" else None
+			block = max( 1 , int(1e7) // Y.size )
+			
+			batch = self.n_bootstrap if self.tol is None else self.batch
+			for a in range(0,self.n_bootstrap,batch):
+				if kind == "parametric":
+					for b in range(a,min(a+batch,self.n_bootstrap),block):
+						e = min( b + block , a + batch , self.n_bootstrap )
+						self._fit_replicates( replicate , replicate._rvs( rng , e - b ) , seeds[b:e] , kind , n_newton , kwargs )
+				else:
+					self._fit_replicates( replicate , Y , seeds[a:a+batch] , kind , n_newton , kwargs )
+				if self.tol is not None and self._converged():
+					break
+		##}}}
+		
+		def _run_blb( self , law , replicate , Y , n_newton , **kwargs ):##{{{
+			"""
+			Bag of Little Bootstraps: blb_subsets subsets of size n_samples**blb_gamma are drawn without replacement, and
+			n_bootstrap replicates are fitted on each subset, with multinomial weights summing to n_samples. The confidence
+			interval is the mean of the confidence intervals of the subsets.
+			"""
+			n_samples = Y.size
+			size      = max( 2 , int( n_samples**self.blb_gamma ) )
+			
+			## Only the subsets are sent to the workers
+			self._open_pool()
+			l_Y,l_kwargs,l_seeds = [],[],[]
+			for seed in np.random.SeedSequence(self.seed).spawn(self.blb_subsets):
+				seed_idx,seed_fit = seed.spawn(2)
+				idx = np.random.default_rng(seed_idx).choice( n_samples , size , replace = False )
+				l_Y.append( Y.ravel()[idx] )
+				l_kwargs.append( _subset_kwargs( kwargs , idx , n_samples ) )
+				l_seeds.append( seed_fit )
+			
+			## The confidence interval is the running mean of the confidence intervals of the subsets
+			n_sub = self.blb_subsets
+			ci    = RunningMoments()
+			for coefs in self._map( _bootstrap_blb , [replicate] * n_sub , l_Y , l_seeds , [n_samples] * n_sub , [self.n_bootstrap] * n_sub , l_kwargs , [n_newton] * n_sub , [law.coef_] * n_sub ):
+				for c in coefs:
+					self.moments.update(c)
+				self._n_fitted += len(coefs)
+				if self.store:
+					self.coefs_bootstrap.extend(coefs)
+				ci.update( np.quantile( coefs , [ self.alpha / 2. , 1 - self.alpha / 2.] , axis = 0 ) )
+				self.confidence_interval = ci.mean.reshape(2,-1)
+				if self.callback is not None:
+					self.callback( self._n_fitted , self.confidence_interval )
 		##}}}
 		
 		def _bootstrap_method(func):##{{{
 			def wrapper(*args,**kwargs):
 				self,Y = args
+				out = func(*args,**kwargs)
 				if self.n_bootstrap > 0:
-					self.coefs_bootstrap = []
-					for _ in range(self.n_bootstrap):
-						idx = np.random.choice( Y.size , Y.size , replace = True )
-						self.params = LawParams( kinds = self.kinds_params )
-						self.params.add_params( n_samples = Y.size , resample = idx , **kwargs )
-						self._Y = Y.reshape(-1,1)[idx,:]
-						if self.method not in [ "mle" , "bayesian" ]:
-							self._fit()
-						elif self.method == "bayesian":
-							self._fit_bayesian()
-						else:
-							self._fit_mle()
-						self.coefs_bootstrap.append( self.coef_ )
-					self.coefs_bootstrap = np.array( self.coefs_bootstrap )
-					self.confidence_interval = np.quantile( self.coefs_bootstrap , [ self.alpha / 2. , 1 - self.alpha / 2.] , axis = 0 )
-				return func(*args,**kwargs)
+					self._bootstrap.run( self , Y , **kwargs )
+				return out
 			return wrapper
 		##}}}
 	##}}}
@@ -232,6 +694,16 @@ class AbstractLaw:
 		self._bootstrap.coefs_bootstrap = coefs_bootstrap
 	##}}}
 	
+	@property
+	def mean_bootstrap(self):##{{{
+		return None if self._bootstrap.moments is None else self._bootstrap.moments.mean
+	##}}}
+	
+	@property
+	def cov_bootstrap(self):##{{{
+		return None if self._bootstrap.moments is None else self._bootstrap.moments.cov
+	##}}}
+	
 	@property
 	def confidence_interval(self):##{{{
 		return self._bootstrap.confidence_interval
@@ -257,7 +729,9 @@ class AbstractLaw:
 	
 	class _Info:##{{{
 		def __init__( self ):
-			self.cov = None
+			self.cov         = None
+			self.n_bootstrap = None
+			self.mc_error    = None
 	##}}}
 	
 	@property
@@ -272,7 +746,7 @@ class AbstractLaw:
 	
 	#####################################################################
 	
-	def __init__( self , kinds_params , method , n_bootstrap , alpha ):##{{{
+	def __init__( self , kinds_params , method , n_bootstrap , alpha , **kwargs ):##{{{
 		"""
 		Initialization of AbstractLaw
 		
@@ -284,15 +758,19 @@ class AbstractLaw:
 			Numbers of bootstrap for confidence interval, default = 0 (no bootstrap)
 		alpha          : float
 			Level of confidence interval, default = 0.05
-		
+		**kwargs       :
+			Optional arguments for bootstrap, see the documentation of the class
 		
 		"""
 		self.method    = method.lower()
 		self.params    = {}
 		self._kinds_params = kinds_params
 		
-		self._bootstrap = AbstractLaw._Bootstrap( n_bootstrap , alpha )
+		self._bootstrap = AbstractLaw._Bootstrap( n_bootstrap , alpha , **kwargs )
 		self._info      = AbstractLaw._Info()
+		self._weights   = None
+		self._optimizer = "bfgs"
+		self._batched   = False
 		
 	##}}}
 	
@@ -361,6 +839,58 @@ class AbstractLaw:
 		return p.value
 	##}}}
 	
+	def _weighted( self , x , idx = None ):##{{{
+		"""
+		Multiply the per-observation terms x by the bootstrap weights (restricted to idx if given). Terms of observations
+		with a zero weight are set to 0, even if they are not finite.
+		"""
+		if self._weights is None:
+			return x
+		w = self._weights if idx is None else self._weights[idx,:]
+		return np.where( w > 0 , w * x , 0. )
+	##}}}
+	
+	def _all( self , x , idx = None ):##{{{
+		"""
+		np.all restricted to the observations with a positive bootstrap weight (restricted to idx if given), used to check
+		the support of the law. In a batched fit (fit_many), the support of each series is checked with the finiteness of
+		its likelihood, and True is returned.
+		"""
+		if self._batched:
+			return True
+		if self._weights is None:
+			return np.all(x)
+		w = self._weights if idx is None else self._weights[idx,:]
+		return np.all( x[ np.broadcast_to( w > 0 , x.shape ) ] )
+	##}}}
+	
+	def _fit_batch( self , counts ):##{{{
+		"""
+		Fit all the bootstrap replicates given by counts (shape = (n_replicates,n_samples)) at once, and return their
+		coef_ with shape (n_replicates,n_coef). The laws override this method for their closed-form methods, None means
+		that no batched estimator is available, and the replicates are fitted one by one.
+		"""
+		return None
+	##}}}
+	
+	def _rvs( self , rng , size ):##{{{
+		"""
+		Draw size datasets from the fitted law, at the observed covariates, with the numpy.random.Generator rng. Return
+		an array with shape (size,n_samples). Used by the parametric bootstrap, the laws override this method.
+		"""
+		raise NotImplementedError( "SDFC: parametric bootstrap is not available for this law" )
+	##}}}
+	
+	def _batch_intercept( self , kind , intercept ):##{{{
+		"""
+		coef_ of the param kind for each replicate of a batched fit, when only the intercept is fitted
+		"""
+		intercept = np.array( [intercept] ).ravel()
+		coef = np.zeros( (intercept.size,self.params._dparams[kind].n_features) )
+		coef[:,0] = intercept
+		return coef
+	##}}}
+	
 	def _update_coef(func):##{{{
 		def wrapper(*args):
 			args[0].params.update_coef(args[1])
@@ -372,6 +902,9 @@ class AbstractLaw:
 	def fit( self , Y , **kwargs ): ##{{{
 		
 		## Fit part
+		self._optimizer = "bfgs" if kwargs.get("optimizer") is None else kwargs.get("optimizer").lower()
+		if self._optimizer not in ["bfgs","trust-exact","newton-cg"]:
+			raise ValueError( "SDFC: optimizer must be 'BFGS', 'trust-exact' or 'Newton-CG'" )
 		self.params = LawParams( kinds = self.kinds_params )
 		self.params.add_params( n_samples = Y.size , resample = None , **kwargs )
 		self._Y = Y.reshape(-1,1)
@@ -380,10 +913,175 @@ class AbstractLaw:
 		elif self.method == "bayesian":
 			self._fit_bayesian(**kwargs)
 		else:
-			self._fit_mle()
+			init = kwargs.get("init")
+			if init is not None:
+				self.coef_ = np.array( init , dtype = float ).ravel()
+			self._fit_mle( warm_start = init is not None and np.isfinite( self._negloglikelihood(self.coef_) ) )
 		del self._Y
 	##}}}
 	
+	def fit_many( self , Y , **kwargs ):##{{{
+		"""
+		Fit by maximum likelihood each column of Y (n_series independent series), all series sharing the same covariates,
+		fixed values and link functions. The likelihoods, gradients and Hessians of all series are evaluated together
+		with array operations, and all series are advanced together with a damped Newton method (the Hessian of each
+		series is made positive definite by clipping its eigenvalues, and each step is halved until the negative
+		log-likelihood of the series decreases). The law itself is not modified.
+		
+		Parameters
+		----------
+		Y         : numpy.ndarray[ shape = (n_samples,n_series) ]
+			Data to fit
+		c_<param>, f_<param>, l_<param> :
+			Covariates, fixed values and link functions, as in fit, common to all series
+		init      : None or numpy.ndarray[ shape = (n_coef,) or (n_series,n_coef) ]
+			Starting point. If None, the initialization of the MLE of the law is used for each series (this is the only
+			loop on the series).
+		maxiter   : None or integer
+			Maximal numbers of Newton iterations, default is 100
+		tol       : None or float
+			Tolerance on the Newton decrement g.T @ H^{-1} @ g / 2 of each series, default is 1e-8
+		
+		Returns
+		-------
+		coef_   : numpy.ndarray[ shape = (n_series,n_coef) ]
+			Coefficients fitted
+		cov     : numpy.ndarray[ shape = (n_series,n_coef,n_coef) ]
+			Inverse of the Hessian of the negative log-likelihood at coef_
+		success : numpy.ndarray[ shape = (n_series,) , dtype = bool ]
+			True if the fit of the series has converged
+		"""
+		if not self._has_nlll_derivatives():
+			raise NotImplementedError( "SDFC: fit_many is not available for this law" )
+		maxiter = 100  if kwargs.get("maxiter") is None else kwargs.get("maxiter")
+		tol     = 1e-8 if kwargs.get("tol")     is None else kwargs.get("tol")
+		Y       = Y.reshape(Y.shape[0],-1)
+		n_series = Y.shape[1]
+		
+		## The law is used as a workspace, its state is restored at the end
+		state = { k : getattr(self,k) for k in ["params","_Y","_weights"] if hasattr(self,k) }
+		try:
+			self.params = LawParams( kinds = self.kinds_params )
+			self.params.add_params( n_samples = Y.shape[0] , resample = None , **kwargs )
+			self._weights = None
+			
+			## Starting points
+			init = kwargs.get("init")
+			if init is None:
+				C = []
+				for s in range(n_series):
+					self._Y = Y[:,s].reshape(-1,1)
+					self._initialization_mle()
+					C.append( self.coef_.copy() )
+				C = np.array(C)
+			else:
+				n_coef = sum( p.n_features for p in self.params._dparams.values() if not p.is_fix() )
+				C = np.array( np.broadcast_to( init , (n_series,n_coef) ) , dtype = float )
+			
+			## Batched damped Newton
+			self._batched = True
+			value,grad,hess = self._batch_derivatives( C , Y , order = 2 )
+			success = np.zeros( n_series , dtype = bool )
+			active  = np.isfinite(value) & np.all( np.isfinite(grad) , axis = 1 )
+			for _ in range(maxiter):
+				act = np.flatnonzero(active)
+				if act.size == 0:
+					break
+				
+				## Newton directions, with eigenvalues of the Hessians clipped to be positive
+				eva,eve = np.linalg.eigh( hess[act] )
+				eva     = np.maximum( np.abs(eva) , 1e-8 * np.max( np.abs(eva) , axis = 1 , initial = 1e-300 ).reshape(-1,1) )
+				gr      = np.einsum( "sji,sj->si" , eve , grad[act] )
+				step    = - np.einsum( "sij,sj->si" , eve , gr / eva )
+				decr    = np.sum( gr**2 / eva , axis = 1 ) / 2
+				
+				## Converged series
+				conv = decr < tol
+				success[act[conv]] = True
+				active[act[conv]]  = False
+				act,step,decr = act[~conv],step[~conv],decr[~conv]
+				
+				## Halve the steps until the negative log-likelihood decreases
+				t = np.ones(act.size)
+				for _ in range(30):
+					if act.size == 0:
+						break
+					v,_,_ = self._batch_derivatives( C[act] + t.reshape(-1,1) * step , Y[:,act] , order = 0 )
+					ok = np.isfinite(v) & ( v <= value[act] - 1e-4 * t * decr )
+					if np.any(ok):
+						C[act[ok]] += t[ok].reshape(-1,1) * step[ok]
+						vo,go,ho = self._batch_derivatives( C[act[ok]] , Y[:,act[ok]] , order = 2 )
+						value[act[ok]],grad[act[ok]],hess[act[ok]] = vo,go,ho
+					act,step,decr,t = act[~ok],step[~ok],decr[~ok],t[~ok] / 2
+				
+				## No decrease found, the series can not be improved
+				active[act] = False
+			
+			## Covariance matrices
+			cov = np.zeros_like(hess) + np.nan
+			fin = np.all( np.isfinite(hess) , axis = (1,2) )
+			try:
+				cov[fin] = np.linalg.inv( hess[fin] )
+			except np.linalg.LinAlgError:
+				for s in np.flatnonzero(fin):
+					try:
+						cov[s] = np.linalg.inv(hess[s])
+					except np.linalg.LinAlgError:
+						pass
+		finally:
+			self._batched = False
+			for k in ["params","_Y","_weights"]:
+				if k in state:
+					setattr( self , k , state[k] )
+				elif hasattr(self,k):
+					delattr( self , k )
+		
+		return C,cov,success
+	##}}}
+	
+	def _batch_derivatives( self , C , Y , order ):##{{{
+		"""
+		Negative log-likelihood (shape (n_series,)), gradient (shape (n_series,n_coef)) if order > 0 and Hessian (shape
+		(n_series,n_coef,n_coef)) if order > 1 of the series Y (shape (n_samples,n_series)) at the coef C (one row by
+		series). The values of the params are set for all series at once (shape (n_samples,n_series)), and the
+		derivatives of the law are evaluated with array operations. The negative log-likelihood is inf for the series
+		outside the support.
+		"""
+		n_series = C.shape[0]
+		
+		## Values of the params of all series
+		a = 0
+		l_p = [ self.params._dparams[k] for k in self.params._dparams if not self.params._dparams[k].is_fix() ]
+		for p in l_p:
+			p.fit_ = p.design_ @ C[:,a:a+p.n_features].T
+			a += p.n_features
+		self._Y = Y
+		
+		with np.errstate( all = "ignore" ):
+			nlll,d1,d2,idx = self._nlll_derivatives( order = max(order,1) )
+			sub   = slice(None) if idx is None else idx
+			value = np.sum( nlll , axis = 0 )
+			value[ ~np.isfinite(value) ] = np.inf
+			grad,hess = None,None
+			if order > 0:
+				X = { p.kind : p.design_[sub,:] for p in l_p }
+				G = { p.kind : p.gradient()[sub,:] for p in l_p }
+				grad = np.hstack( [ ( d1[p.kind] * G[p.kind] ).T @ X[p.kind] for p in l_p ] )
+			if order > 1:
+				kinds  = [ p.kind for p in l_p ]
+				H      = { p.kind : p.hessian()[sub,:] for p in l_p }
+				blocks = {}
+				for i,k0 in enumerate(kinds):
+					for k1 in kinds[i:]:
+						w = d2[(k0,k1)] * G[k0] * G[k1]
+						if k0 == k1:
+							w = w + d1[k0] * H[k0]
+						blocks[(k0,k1)] = np.einsum( "ni,ns,nj->sij" , X[k0] , np.broadcast_to( w , (X[k0].shape[0],n_series) ) , X[k1] , optimize = True )
+						blocks[(k1,k0)] = np.transpose( blocks[(k0,k1)] , (0,2,1) )
+				hess = np.concatenate( [ np.concatenate( [ blocks[(k0,k1)] for k1 in kinds ] , axis = 2 ) for k0 in kinds ] , axis = 1 )
+		return value,grad,hess
+	##}}}
+	
 	def _fit_bayesian( self , **kwargs ):##{{{
 		
 		## Find numbers of features
@@ -455,11 +1153,142 @@ class AbstractLaw:
 		self._info.cov          = np.cov(draw.T)
 	##}}}
 	
-	def _fit_mle( self ):##{{{
-		self._initialization_mle()
-		self._info.optim_result = sco.minimize( self._negloglikelihood , self.coef_ , jac = self._gradient_nlll , method = "BFGS" )
+	def _nlll_derivatives( self , order = 1 ):##{{{
+		"""
+		Negative log-likelihood of each observation, and its derivatives with respect to the params of the law (not to
+		the coef_) up to order (1 or 2), computed together to share the intermediate values. Return None if the current
+		coef_ is outside the support, otherwise a tuple nlll,d1,d2,idx: nlll, d1[kind] and d2[(kind0,kind1)] (kind0 before
+		kind1 in kinds_params, None if order < 2) are arrays of shape (n_samples,1), restricted to the observations idx
+		if idx is not None. The laws override this method, otherwise the likelihood is only given by _negloglikelihood
+		and _gradient_nlll.
+		"""
+		raise NotImplementedError
+	##}}}
+	
+	def _has_nlll_derivatives( self ):##{{{
+		return type(self)._nlll_derivatives is not AbstractLaw._nlll_derivatives
+	##}}}
+	
+	def _free_params( self , idx ):##{{{
+		"""
+		Design matrices and gradients of the links of the params to fit, restricted to idx if not None
+		"""
+		sub = slice(None) if idx is None else idx
+		l_p = [ self.params._dparams[k] for k in self.params._dparams if not self.params._dparams[k].is_fix() ]
+		return [ ( p.kind , p.design_[sub,:] , p.gradient()[sub,:] ) for p in l_p ]
+	##}}}
+	
+	@_update_coef
+	def _value_and_grad( self , coef ):##{{{
+		"""
+		Negative log-likelihood and its gradient in one pass, the coef is updated once and the values of the params are
+		shared. Used as jac = True by the optimizers.
+		"""
+		der = self._nlll_derivatives( order = 1 )
+		if der is None:
+			return np.inf,np.zeros(coef.size) + np.nan
+		nlll,d1,_,idx = der
+		
+		value = np.sum( self._weighted( nlll , idx ) )
+		grad  = np.empty( coef.size )
+		a     = 0
+		for kind,X,G in self._free_params(idx):
+			grad[a:a+X.shape[1]] = X.T @ self._weighted( d1[kind] * G , idx ).ravel()
+			a += X.shape[1]
+		
+		return ( value , grad ) if np.isfinite(value) else ( np.inf , grad )
+	##}}}
+	
+	@_update_coef
+	def _hessian_nlll( self , coef ):##{{{
+		"""
+		Analytic Hessian of the negative log-likelihood (observed information), built from the derivatives with respect to
+		the params, the gradient and the second derivative of the links, and the design matrices. Return None if the law
+		(or a link) gives no second derivatives, and a matrix of nan if coef is outside the support.
+		"""
+		if not self._has_nlll_derivatives():
+			return None
+		der = self._nlll_derivatives( order = 2 )
+		if der is None:
+			return np.zeros( (coef.size,coef.size) ) + np.nan
+		_,d1,d2,idx = der
+		sub = slice(None) if idx is None else idx
+		
+		params = self._free_params(idx)
+		kinds  = [ kind for kind,_,_ in params ]
+		X      = { kind : X for kind,X,_ in params }
+		G      = { kind : G for kind,_,G in params }
+		if not all( k in d1 for k in kinds ):
+			return None
+		H = {}
+		for k in kinds:
+			H[k] = self.params._dparams[k].hessian()
+			if H[k] is None:
+				return None
+			H[k] = H[k][sub,:]
+		
+		blocks = {}
+		for i,k0 in enumerate(kinds):
+			for k1 in kinds[i:]:
+				w = d2[(k0,k1)] * G[k0] * G[k1]
+				if k0 == k1:
+					w = w + d1[k0] * H[k0]
+				blocks[(k0,k1)] = X[k0].T @ ( self._weighted( w , idx ) * X[k1] )
+				blocks[(k1,k0)] = blocks[(k0,k1)].T
+		return np.block( [ [ blocks[(k0,k1)] for k1 in kinds ] for k0 in kinds ] )
+	##}}}
+	
+	def _fit_mle( self , warm_start = False ):##{{{
+		if not warm_start:
+			self._initialization_mle()
+		
+		## The negative log-likelihood and its gradient are computed together if the law allows it
+		if self._has_nlll_derivatives():
+			fun,jac = self._value_and_grad,True
+		else:
+			fun,jac = self._negloglikelihood,self._gradient_nlll
+		
+		optimizer = self._optimizer
+		if optimizer == "bfgs":
+			self._info.optim_result = sco.minimize( fun , self.coef_ , jac = jac , method = "BFGS" )
+		else:
+			if self._hessian_nlll(self.coef_) is None:
+				raise ValueError( "SDFC: no analytic Hessian available for optimizer '{}'".format(optimizer) )
+			self._info.optim_result = sco.minimize( fun , self.coef_ , jac = jac , hess = self._hessian_nlll , method = optimizer )
 		self.coef_ = self._info.optim_result.x
-		self._info.cov = self._info.optim_result.hess_inv
+		
+		## Covariance matrix, from the Hessian if available (BFGS only gives an approximation)
+		self._info.cov = getattr( self._info.optim_result , "hess_inv" , None )
+		hess = self._hessian_nlll(self.coef_)
+		if hess is not None and np.all(np.isfinite(hess)):
+			try:
+				self._info.cov = np.linalg.inv(hess)
+			except np.linalg.LinAlgError:
+				pass
+		if self._info.cov is not None and not isinstance(self._info.cov,np.ndarray):
+			self._info.cov = self._info.cov.todense()
+	##}}}
+	
+	def _fit_newton( self , n_newton ):##{{{
+		"""
+		Approximation of the MLE by n_newton Newton steps started from the current coef_, with the fixed inverse Hessian
+		self._info.cov. Used by the bootstrap: the MLE of each replicate is close to the MLE of the full dataset, and so
+		are their Hessians. Each step is halved until the negative log-likelihood decreases.
+		"""
+		coef_ = self.coef_.copy()
+		nlll  = self._negloglikelihood(coef_)
+		for _ in range(n_newton):
+			step = - self._info.cov @ self._gradient_nlll(coef_)
+			for _ in range(10):
+				nlll_next = self._negloglikelihood( coef_ + step )
+				if nlll_next < nlll:
+					break
+				step /= 2
+			else:
+				break
+			coef_ = coef_ + step
+			nlll  = nlll_next
+		self.coef_ = coef_
 	##}}}
 
 
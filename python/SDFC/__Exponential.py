@@ -112,7 +112,7 @@ class Exponential(AbstractLaw):
 	"""
 	__doc__ += AbstractLaw.__doc__
 	
-	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 ): ##{{{
+	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 , **kwargs ): ##{{{
 		"""
 		Initialization of Exponential law
 		
@@ -124,9 +124,11 @@ class Exponential(AbstractLaw):
 			Numbers of bootstrap for confidence interval, default = 0 (no bootstrap)
 		alpha          : float
 			Level of confidence interval, default = 0.05
+		**kwargs       :
+			Optional arguments for bootstrap, see the documentation of the class
 		
 		"""
-		AbstractLaw.__init__( self , ["scale"] , method , n_bootstrap , alpha )
+		AbstractLaw.__init__( self , ["scale"] , method , n_bootstrap , alpha , **kwargs )
 	##}}}
 	
 	def __str__(self):##{{{
@@ -181,12 +183,23 @@ class Exponential(AbstractLaw):
 			self._fit_moments()
 	##}}}
 	
+	def _fit_batch( self , counts ):##{{{
+		pscale = self.params._dparams["scale"]
+		if not self.method == "moments" or pscale.is_fix():
+			return None
+		return mean( self._Y , pscale.design_wo1() , value = False , link = pscale.link , counts = counts ).reshape(counts.shape[0],-1)
+	##}}}
+	
+	def _rvs( self , rng , size ):##{{{
+		return rng.exponential( scale = self.scale.reshape(1,-1) , size = (size,self.scale.size) )
+	##}}}
+	
 	@AbstractLaw._update_coef
 	def _negloglikelihood( self , coef ): ##{{{
-		if not np.all(self.scale > 0):
+		if not self._all(self.scale > 0):
 			return np.Inf
 		
-		return np.sum( np.log(self.scale) - self._Y / self.scale )
+		return np.sum( self._weighted( np.log(self.scale) + self._Y / self.scale ) )
 	##}}}
 	
 	@AbstractLaw._update_coef
@@ -194,10 +207,24 @@ class Exponential(AbstractLaw):
 		grad_scale = np.zeros_like(coef) + np.nan
 		
 		pscale = self.params._dparams["scale"]
-		if np.all(self.scale > 0):
-			grad_scale = pscale.design_.T @ ( ( 1. / self.scale - self._Y / self.scale**2 ) * pscale.gradient() )
+		if self._all(self.scale > 0):
+			grad_scale = pscale.design_.T @ self._weighted( ( 1. / self.scale - self._Y / self.scale**2 ) * pscale.gradient() )
 		
 		return grad_scale.squeeze()
 	##}}}
+	
+	def _nlll_derivatives( self , order = 1 ):##{{{
+		scale = self.scale
+		if not self._all( scale > 0 ):
+			return None
+		Ys = self._Y / scale
+		
+		nlll = np.log(scale) + Ys
+		d1   = { "scale" : ( 1. - Ys ) / scale }
+		d2   = None
+		if order > 1:
+			d2 = { ("scale","scale") : ( 2. * Ys - 1. ) / scale**2 }
+		return nlll,d1,d2,None
+	##}}}
 
 
@@ -88,14 +88,48 @@
 
 import numpy          as np
 import scipy.special  as scs
-import scipy.optimize as sco
 
 from SDFC.__AbstractLaw            import AbstractLaw
 from SDFC.NonParametric.__mean     import mean
+from SDFC.NonParametric.__std      import std
 from SDFC.NonParametric.__quantile import quantile
 from SDFC.NonParametric.__lmoments import lmoments
 
 
+###############
+## Functions ##
+###############
+
+def _shape_from_tau3( tau3 , maxiter = 50 , tol = 1e-12 ):##{{{
+	"""
+	Shape of the GEV with the L-skewness tau3, i.e. the root x of ( 1 - 3**x ) / ( 1 - 2**x ) = ( 3 + tau3 ) / 2,
+	solved for all the values of tau3 at once. Newton steps on the log of the equation, started from the rational
+	approximation of Hosking et al. (1985), which is kept where tau3 is not in ]-1,1[ or where Newton fails.
+	"""
+	tau3 = np.asarray( tau3 , dtype = float )
+	co   = 2. / ( 3. + tau3 ) - np.log(2) / np.log(3)
+	init = - 7.8590 * co - 2.9554 * co**2
+	
+	## F(x) = log( expm1(a*x) / expm1(b*x) ) - log( (3+tau3)/2 ) is increasing, and F'(x) -> (a-b)/2 in 0
+	a,b   = np.log(3),np.log(2)
+	valid = np.isfinite(tau3) & ( np.abs(tau3) < 1 )
+	logt  = np.log( ( 3. + np.where( valid , tau3 , 0. ) ) / 2 )
+	x     = np.where( valid & np.isfinite(init) , init , 0. )
+	with np.errstate( all = "ignore" ):
+		for _ in range(maxiter):
+			small = np.abs(x) < 1e-8
+			xs    = np.where( small , 1. , x )
+			F     = np.where( small , np.log( a / b ) + ( a - b ) / 2 * x , np.log( np.expm1( a * xs ) / np.expm1( b * xs ) ) ) - logt
+			dF    = np.where( small , ( a - b ) / 2 , b / np.expm1( - b * xs ) - a / np.expm1( - a * xs ) )
+			step  = F / dF
+			x     = np.minimum( x - step , ( 1 + x ) / 2 ) ## The root is lower than 1 for tau3 < 1
+			if not np.any( np.abs(step[valid]) > tol * ( 1 + np.abs(x[valid]) ) ):
+				break
+	ok = valid & np.isfinite(x) & ( np.abs(step) <= 1e-6 * ( 1 + np.abs(x) ) )
+	return np.where( ok , x , init )
+##}}}
+
+
 #############
 ## Classes ##
 #############
@@ -122,7 +156,7 @@ class GEV(AbstractLaw):
 	"""
 	__doc__ += AbstractLaw.__doc__
 	
-	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 ): ##{{{
+	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 , **kwargs ): ##{{{
 		"""
 		Initialization of Normal law
 		
@@ -134,9 +168,11 @@ class GEV(AbstractLaw):
 			Numbers of bootstrap for confidence interval, default = 0 (no bootstrap)
 		alpha          : float
 			Level of confidence interval, default = 0.05
+		**kwargs       :
+			Optional arguments for bootstrap, see the documentation of the class
 		
 		"""
-		AbstractLaw.__init__( self , ["loc","scale","shape"] , method , n_bootstrap , alpha )
+		AbstractLaw.__init__( self , ["loc","scale","shape"] , method , n_bootstrap , alpha , **kwargs )
 	##}}}
 	
 	def __str__(self):##{{{
@@ -295,21 +331,8 @@ class GEV(AbstractLaw):
 		lmom = lmoments( self._Y , c_Y )
 		
 		## Find shape
-		def uni_shape_solver(tau):
-			bl,bu=-1,1
-			fct = lambda x : 3 / 2 + tau / 2 - ( 1 - 3**x ) / (1 - 2**x )
-			while fct(bl) * fct(bu) > 0:
-				bl *= 2
-				bu *= 2
-			opt = sco.root_scalar( fct , method = "brenth" , bracket = [bl , bu] )
-			return opt.root
-		shape_solver = np.vectorize(uni_shape_solver)
-		tau3 = lmom[:,2] / lmom[:,1]
-		try:
-			shape = shape_solver(tau3)
-		except:
-			co    = 2. / ( 3. + tau3 ) - np.log(2) / np.log(3)
-			shape = - 7.8590 * co - 2.9554 * co**2
+		tau3  = lmom[:,2] / lmom[:,1]
+		shape = _shape_from_tau3(tau3)
 		
 		## Find scale
 		gshape = scs.gamma( 1 - shape )
@@ -412,6 +435,59 @@ class GEV(AbstractLaw):
 			self._fit_quantiles()
 	##}}}
 	
+	def _fit_batch( self , counts ):##{{{
+		
+		ploc   = self.params._dparams["loc"]
+		pscale = self.params._dparams["scale"]
+		pshape = self.params._dparams["shape"]
+		n_rep  = counts.shape[0]
+		
+		## Same estimators than _fit_moments and _fit_lmoments, for each replicate
+		if self.method == "moments":
+			m = mean( self._Y , counts = counts )
+			s = np.sqrt(6) * std( self._Y , counts = counts ) / np.pi
+			
+			iloc   = m - 0.57722 * s
+			iscale = np.log(s)
+			ishape = np.repeat( 1e-8 , n_rep )
+			if pscale.is_fix():
+				iloc = m.reshape(-1,1) - 0.57722 * np.exp(pscale.value).reshape(1,-1)
+		elif self.method == "lmoments":
+			lmom = lmoments( self._Y , counts = counts )
+			
+			tau3  = lmom[:,2] / lmom[:,1]
+			co    = 2. / ( 3. + tau3 ) - np.log(2) / np.log(3)
+			kappa = 7.8590 * co + 2.9554 * co**2
+			g     = scs.gamma( 1. + kappa )
+			
+			iscale = lmom[:,1] * kappa / ( (1 - np.power( 2 , - kappa )) * g )
+			iloc   = lmom[:,0] - iscale * (1 - g) / kappa
+			ishape = - kappa
+			if pscale.is_fix():
+				iloc = lmom[:,0].reshape(-1,1) - pscale.value.reshape(1,-1) * ( (1 - g) / kappa ).reshape(-1,1)
+		else:
+			return None
+		
+		coefs = []
+		
+		## Fit loc
+		if not ploc.is_fix():
+			if pscale.is_fix():
+				coefs.append( mean( iloc , ploc.design_wo1() , value = False , link = ploc.link , counts = counts ).reshape(n_rep,-1) )
+			else:
+				coefs.append( self._batch_intercept( "loc" , ploc.link.inverse(iloc) ) )
+		
+		## Fit scale
+		if not pscale.is_fix():
+			coefs.append( self._batch_intercept( "scale" , pscale.link.inverse(iscale) ) )
+		
+		## Fit shape
+		if not pshape.is_fix():
+			coefs.append( self._batch_intercept( "shape" , pshape.link.inverse(ishape) ) )
+		
+		return np.hstack(coefs) if len(coefs) > 0 else None
+	##}}}
+	
 	
 	def _logZafun( self, Z , alpha ):##{{{
 		return alpha * np.log( 1. + self.shape * Z )
@@ -421,10 +497,22 @@ class GEV(AbstractLaw):
 		return np.exp( self._logZafun( Z , alpha ) )
 	##}}}
 	
+	def _rvs( self , rng , size ):##{{{
+		loc   = self.loc.reshape(1,-1)
+		scale = self.scale.reshape(1,-1)
+		shape = self.shape.reshape(1,-1)
+		
+		## Inverse of the cdf, the limit -log(-log(U)) is used for the Gumbel case
+		L = - np.log( rng.uniform( size = (size,loc.size) ) )
+		zero_shape = np.abs(shape) < 1e-10
+		shape = np.where( zero_shape , 1. , shape )
+		return loc + scale * np.where( zero_shape , - np.log(L) , ( np.power( L , - shape ) - 1. ) / shape )
+	##}}}
+	
 	@AbstractLaw._update_coef
 	def _negloglikelihood( self , coef ): ##{{{
 		## Impossible scale
-		if not np.all( self.scale > 0 ):
+		if not self._all( self.scale > 0 ):
 			return np.inf
 		
 		## Fuck exponential case
@@ -436,10 +524,10 @@ class GEV(AbstractLaw):
 		##
 		Z = 1 + shape * ( self._Y - self.loc ) / self.scale
 		
-		if not np.all(Z > 0):
+		if not self._all(Z > 0):
 			return np.inf
 		
-		res = np.sum( ( 1. + 1. / shape ) * np.log(Z) + np.power( Z , - 1. / shape ) + np.log(self.scale) )
+		res = np.sum( self._weighted( ( 1. + 1. / shape ) * np.log(Z) + np.power( Z , - 1. / shape ) + np.log(self.scale) ) )
 		
 		
 		return res if np.isfinite(res) else np.inf
@@ -455,7 +543,7 @@ class GEV(AbstractLaw):
 			shape[zero_shape] = 1e-10
 		
 		## Impossible
-		if not np.all(self.scale > 0) or not np.all( 1. + shape * ( self._Y - self.loc ) / self.scale > 0 ):
+		if not self._all(self.scale > 0) or not self._all( 1. + shape * ( self._Y - self.loc ) / self.scale > 0 ):
 			return np.zeros( coef.size ) + np.nan
 		
 		## Usefull values
@@ -470,22 +558,59 @@ class GEV(AbstractLaw):
 		ploc = self.params._dparams["loc"]
 		if not ploc.is_fix():
 			loc_vect   = ploc.gradient()   * ( Zamsi - 1 - shape ) / ( self.scale * Za1 )
-			grad_loc   = np.dot( ploc.design_.T   , loc_vect   )
+			grad_loc   = np.dot( ploc.design_.T   , self._weighted(loc_vect)   )
 			grad = np.hstack( (grad,grad_loc.squeeze()) )
 		
 		pscale = self.params._dparams["scale"]
 		if not pscale.is_fix():
 			scale_vect = pscale.gradient() * ( 1. + Z * ( Zamsi - 1 - shape ) / Za1 ) / self.scale
-			grad_scale = np.dot( pscale.design_.T , scale_vect )
+			grad_scale = np.dot( pscale.design_.T , self._weighted(scale_vect) )
 			grad = np.hstack( (grad,grad_scale.squeeze()) )
 		
 		pshape = self.params._dparams["shape"]
 		if not pshape.is_fix():
 			shape_vect = pshape.gradient() * ( ( Zamsi - 1. ) * np.log(Za1) * ishape**2 + ( 1. + ishape - ishape * Zamsi ) * Z / Za1 )
-			grad_shape = np.dot( pshape.design_.T , shape_vect )
+			grad_shape = np.dot( pshape.design_.T , self._weighted(shape_vect) )
 			grad = np.hstack( (grad,grad_shape.squeeze()) )
 		return grad
 
 
 
 	##}}}
+	
+	def _nlll_derivatives( self , order = 1 ):##{{{
+		scale = self.scale
+		shape = self.shape
+		shape = np.where( np.abs(shape) < 1e-10 , 1e-10 , shape )
+		Yc    = self._Y - self.loc
+		W     = scale + shape * Yc ## scale * Z
+		if not self._all(scale > 0) or not self._all(W > 0):
+			return None
+		
+		## Usefull values
+		ishape = 1. / shape
+		Z      = Yc / scale
+		Za1    = W / scale
+		ZZa1   = Z / Za1
+		logZa1 = np.log(Za1)
+		Zamsi  = np.exp( - logZa1 * ishape ) ## Za of Minus Shape Inverse
+		g      = Zamsi - 1. - shape
+		
+		nlll = ( 1. + ishape ) * logZa1 + Zamsi + np.log(scale)
+		d1   = { "loc"   : g / W,
+		         "scale" : ( 1. + ZZa1 * g ) / scale,
+		         "shape" : ( Zamsi - 1. ) * logZa1 * ishape**2 + ( 1. + ( 1. - Zamsi ) * ishape ) * ZZa1
+		       }
+		d2   = None
+		if order > 1:
+			dlZ         = ( logZa1 * ishape - ZZa1 ) * ishape ## Derivative of log(Zamsi) with respect to shape
+			d_loc_shape = ( Zamsi * dlZ - 1. ) / W - g * Yc / W**2
+			d2 = { ("loc","loc")     : ( Zamsi + shape * g ) / W**2,
+			       ("loc","scale")   : ( Zamsi * Z - g ) / W**2,
+			       ("loc","shape")   : d_loc_shape,
+			       ("scale","scale") : - 1. / scale**2 + Yc * ( Zamsi * Yc - g * ( W + scale ) ) / ( scale * W )**2,
+			       ("scale","shape") : Z * d_loc_shape,
+			       ("shape","shape") : Zamsi * dlZ**2 - 2. * ( Zamsi - 1. ) * dlZ * ishape - ( 1. + ( 1. - Zamsi ) * ishape ) * ZZa1**2
+			     }
+		return nlll,d1,d2,None
+	##}}}
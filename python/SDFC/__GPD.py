@@ -123,7 +123,7 @@ class GPD(AbstractLaw):
 	"""
 	__doc__ += AbstractLaw.__doc__
 	
-	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 ): ##{{{
+	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 , **kwargs ): ##{{{
 		"""
 		Initialization of Normal law
 		
@@ -135,9 +135,12 @@ class GPD(AbstractLaw):
 			Numbers of bootstrap for confidence interval, default = 0 (no bootstrap)
 		alpha          : float
 			Level of confidence interval, default = 0.05
+		**kwargs       :
+			Optional arguments for bootstrap, see the documentation of the class
 		
 		"""
-		AbstractLaw.__init__( self , ["loc","scale","shape"] , method , n_bootstrap , alpha )
+		AbstractLaw.__init__( self , ["loc","scale","shape"] , method , n_bootstrap , alpha , **kwargs )
+		self._compact = False
 	##}}}
 	
 	def __str__(self):##{{{
@@ -336,6 +339,34 @@ class GPD(AbstractLaw):
 		
 	##}}}
 	
+	def _exceedances( self ):##{{{
+		"""
+		Index of the exceedances of loc, all observations if the fit is compacted to the exceedances
+		"""
+		return slice(None) if self._compact else (self._Y > self.loc).squeeze()
+	##}}}
+	
+	def _fit_mle( self , warm_start = False ):##{{{
+		## loc is fixed, so the exceedances do not change during the fit, the MLE is done on the exceedances only
+		idx = (self._Y > self.loc).squeeze()
+		if self._compact or self._batched or np.all(idx):
+			AbstractLaw._fit_mle( self , warm_start )
+			return
+		
+		params,Y,weights = self.params,self._Y,self._weights
+		self.params   = params.restrict(idx)
+		self._Y       = Y[idx,:]
+		self._weights = None if weights is None else weights[idx,:]
+		self._compact = True
+		try:
+			AbstractLaw._fit_mle( self , warm_start )
+		finally:
+			coef_ = self.coef_
+			self.params,self._Y,self._weights = params,Y,weights
+			self._compact = False
+			self.params.update_coef(coef_)
+	##}}}
+	
 	def _fit( self ):##{{{
 		
 		## Fit itself
@@ -347,11 +378,60 @@ class GPD(AbstractLaw):
 			self._fit_lmoments_experimental()
 	##}}}
 	
+	def _fit_batch( self , counts ):##{{{
+		
+		pscale = self.params._dparams["scale"]
+		pshape = self.params._dparams["shape"]
+		n_rep  = counts.shape[0]
+		
+		## Exceedances, loc is fixed so they are the same for all replicates
+		idx    = (self._Y > self.loc).squeeze()
+		Y      = (self._Y[idx] - self.loc[idx]).reshape(-1,1)
+		counts = counts[:,idx]
+		
+		coefs = []
+		if self.method == "moments":
+			if not pscale.is_fix():
+				c_scale = pscale.design_wo1()
+				if c_scale is not None:
+					c_scale = c_scale.reshape(-1,pscale.n_features-1)[idx]
+				coefs.append( std( Y , c_scale , m_Y = 0 , value = False , link = pscale.link , counts = counts ).reshape(n_rep,-1) )
+			if not pshape.is_fix():
+				coefs.append( self._batch_intercept( "shape" , np.repeat( -1e-8 , n_rep ) ) )
+		elif self.method == "lmoments" and not pscale.is_fix() and not pshape.is_fix():
+			lmom     = lmoments( Y , counts = counts )
+			itau     = lmom[:,0] / lmom[:,1]
+			scale_lm = lmom[:,0] * ( itau - 1 )
+			scale_lm[ np.logical_not(scale_lm > 0) ] = 1e-8
+			shape_lm = 2 - itau
+			coefs.append( self._batch_intercept( "scale" , scale_lm ) )
+			coefs.append( self._batch_intercept( "shape" , shape_lm ) )
+		
+		return np.hstack(coefs) if len(coefs) > 0 else None
+	##}}}
+	
+	
+	def _rvs( self , rng , size ):##{{{
+		
+		## Only the exceedances are drawn, other observations are kept (they are not used by the fit)
+		idx   = (self._Y > self.loc).squeeze()
+		loc   = self.loc[idx,:].reshape(1,-1)
+		scale = self.scale[idx,:].reshape(1,-1)
+		shape = self.shape[idx,:].reshape(1,-1)
+		
+		## Inverse of the cdf, the limit -log(U) is used for the exponential case
+		L = - np.log( rng.uniform( size = (size,loc.size) ) )
+		zero_shape = np.abs(shape) < 1e-10
+		shape = np.where( zero_shape , 1. , shape )
+		Y = np.repeat( self._Y.reshape(1,-1) , size , axis = 0 )
+		Y[:,idx] = loc + scale * np.where( zero_shape , L , ( np.exp( shape * L ) - 1. ) / shape )
+		return Y
+	##}}}
 	
 	@AbstractLaw._update_coef
 	def _negloglikelihood( self , coef ): ##{{{
 		## Impossible scale
-		if not np.all( self.scale > 0 ):
+		if not self._all( self.scale > 0 ):
 			return np.inf
 		
 		## Remove exponential case
@@ -362,15 +442,15 @@ class GPD(AbstractLaw):
 		
 		
 		##
-		idx   = (self._Y > self.loc).squeeze()
+		idx   = self._exceedances()
 		loc   = self.loc[idx,:]
 		scale = self.scale[idx,:]
 		shape = shape[idx,:]
 		Z = 1. + shape * ( self._Y[idx,:] - loc ) / scale
 		
-		if not np.all(Z > 0):
+		if not self._all( Z > 0 , idx ):
 			return np.inf
-		res = np.sum( np.log( scale ) + np.log(Z) * ( 1 + 1. / shape ) )
+		res = np.sum( self._weighted( np.log( scale ) + np.log(Z) * ( 1 + 1. / shape ) , idx ) )
 		return res
 	##}}}
 	
@@ -385,7 +465,7 @@ class GPD(AbstractLaw):
 		
 		
 		##
-		idx   = (self._Y > self.loc).squeeze()
+		idx   = self._exceedances()
 		Y      = self._Y[idx,:]
 		loc   = self.loc[idx,:]
 		scale = self.scale[idx,:]
@@ -402,14 +482,59 @@ class GPD(AbstractLaw):
 			gr_scale   = pscale.gradient()[idx,:]
 			A = gr_scale * ( - exponent * shape * Z / ZZ / scale + 1. / scale )
 			B = pscale.design_[idx,:].T
-			grad_scale =  B @ A
+			grad_scale =  B @ self._weighted( A , idx )
 			grad       = np.hstack( (grad,grad_scale.squeeze()) )
 		
 		pshape = self.params._dparams["shape"]
 		if not pshape.is_fix():
 			gr_shape   = pshape.gradient()[idx,:].reshape(-1,1)
-			grad_shape = pshape.design_[idx,:].T @ ( gr_shape * ( - np.log(ZZ) / shape**2 + exponent * Z / ZZ ) ) if np.all( ZZ > 0 ) else np.repeat(np.nan,pshape.n_features)
+			grad_shape = pshape.design_[idx,:].T @ self._weighted( gr_shape * ( - np.log(ZZ) / shape**2 + exponent * Z / ZZ ) , idx ) if self._all( ZZ > 0 , idx ) else np.repeat(np.nan,pshape.n_features)
 			grad       = np.hstack( (grad,grad_shape.squeeze()) )
 		return grad
 	##}}}
+	
+	def _nlll_derivatives( self , order = 1 ):##{{{
+		if not self._all( self.scale > 0 ):
+			return None
+		
+		## Only the exceedances are used. The MLE is compacted to them (see _fit_mle), otherwise they are selected, or
+		## masked in a batched fit (fit_many) where they differ between series
+		idx,mask = None,None
+		if self._compact:
+			Yc    = self._Y - self.loc
+			scale = self.scale
+			shape = self.shape
+		elif self._batched:
+			exceed = self._Y > self.loc
+			mask   = exceed.astype(float)
+			Yc     = np.where( exceed , self._Y - self.loc , 0. )
+			scale  = self.scale
+			shape  = self.shape
+		else:
+			idx   = (self._Y > self.loc).squeeze()
+			Yc    = self._Y[idx,:] - self.loc[idx,:]
+			scale = self.scale[idx,:]
+			shape = self.shape[idx,:]
+		shape = np.where( np.abs(shape) < 1e-10 , -1e-10 , shape )
+		W     = scale + shape * Yc ## scale * Z
+		if not self._all( W > 0 , idx ):
+			return None
+		ishape   = 1. / shape
+		logZ     = np.log( W / scale )
+		exponent = 1. + ishape
+		
+		nlll = np.log(scale) + exponent * logZ
+		d1   = { "scale" : exponent / W - ishape / scale , "shape" : exponent * Yc / W - logZ * ishape**2 }
+		d2   = None
+		if order > 1:
+			d2 = { ("scale","scale") : ishape / scale**2 - exponent / W**2,
+			       ("scale","shape") : ishape**2 * ( 1. / scale - 1. / W ) - exponent * Yc / W**2,
+			       ("shape","shape") : 2. * ( logZ * ishape - Yc / W ) * ishape**2 - exponent * Yc**2 / W**2
+			     }
+		if mask is not None:
+			nlll = nlll * mask
+			d1   = { k : d1[k] * mask for k in d1 }
+			d2   = None if d2 is None else { k : d2[k] * mask for k in d2 }
+		return nlll,d1,d2,idx
+	##}}}
 
@@ -118,7 +118,7 @@ class Gamma(AbstractLaw):
 	"""
 	__doc__ += AbstractLaw.__doc__
 	
-	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 ): ##{{{
+	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 , **kwargs ): ##{{{
 		"""
 		Initialization of Gamma law
 		
@@ -130,8 +130,10 @@ class Gamma(AbstractLaw):
 			Numbers of bootstrap for confidence interval, default = 0 (no bootstrap)
 		alpha          : float
 			Level of confidence interval, default = 0.05
+		**kwargs       :
+			Optional arguments for bootstrap, see the documentation of the class
 		"""
-		AbstractLaw.__init__( self , ["scale","shape"] , method , n_bootstrap , alpha )
+		AbstractLaw.__init__( self , ["scale","shape"] , method , n_bootstrap , alpha , **kwargs )
 	##}}}
 	
 	def __str__(self):##{{{
@@ -187,19 +189,30 @@ class Gamma(AbstractLaw):
 	##}}}
 	
 	
+	def _moments_design(self):##{{{
+		"""
+		Design matrices of the regressions of the mean and of the variance, when scale and shape are fitted
+		"""
+		pscale = self.params._dparams["scale"]
+		pshape = self.params._dparams["shape"]
+		n_samples = pscale.n_samples
+		
+		mX = np.ones( (n_samples,1) )
+		vX = np.ones( (n_samples,1) )
+		for i in range(1,pscale.n_features):
+			for j in range(pshape.n_features):
+				mX = np.hstack( (mX,np.reshape( pscale.design_[:,i]    * pshape.design_[:,j] , (n_samples,1) ) ) )
+				vX = np.hstack( (vX,np.reshape( pscale.design_[:,i]**2 * pshape.design_[:,j] , (n_samples,1) ) ) )
+		return mX,vX
+	##}}}
+	
 	def _fit_moments(self):##{{{
 		
 		pscale = self.params._dparams["scale"]
 		pshape = self.params._dparams["shape"]
-		n_samples = pscale.n_samples
 		
 		if not pscale.is_fix() and not pshape.is_fix():
-			mX = np.ones( (n_samples,1) )
-			vX = np.ones( (n_samples,1) )
-			for i in range(1,pscale.n_features):
-				for j in range(pshape.n_features):
-					mX = np.hstack( (mX,np.reshape( pscale.design_[:,i]    * pshape.design_[:,j] , (n_samples,1) ) ) )
-					vX = np.hstack( (vX,np.reshape( pscale.design_[:,i]**2 * pshape.design_[:,j] , (n_samples,1) ) ) )
+			mX,vX = self._moments_design()
 			m = mean( self._Y , mX[:,1:] )
 			v = var(  self._Y , vX[:,1:] )
 			
@@ -241,12 +254,39 @@ class Gamma(AbstractLaw):
 			self._fit_moments()
 	##}}}
 	
+	def _fit_batch( self , counts ):##{{{
+		pscale = self.params._dparams["scale"]
+		pshape = self.params._dparams["shape"]
+		
+		if not self.method == "moments" or pscale.is_fix() or pshape.is_fix():
+			return None
+		
+		## Same estimator than _fit_moments, for each replicate
+		mX,vX = self._moments_design()
+		m = mean( self._Y , mX[:,1:] , counts = counts )
+		v = var(  self._Y , vX[:,1:] , counts = counts )
+		
+		idx   = np.logical_or( np.abs(m) < 1e-8 , v < 1e-8 )
+		scale = np.where( idx , np.inf , v / np.where( idx , 1. , m ) )
+		shape = np.where( idx , np.inf , m**2 / np.where( idx , 1. , v ) )
+		scale = np.where( idx , scale.min( axis = 1 , keepdims = True ) , scale )
+		shape = np.where( idx , shape.min( axis = 1 , keepdims = True ) , shape )
+		
+		coef_scale = mean( scale , pscale.design_wo1() , value = False , link = pscale.link , counts = counts ).reshape(counts.shape[0],-1)
+		coef_shape = mean( shape , pshape.design_wo1() , value = False , link = pshape.link , counts = counts ).reshape(counts.shape[0],-1)
+		return np.hstack( (coef_scale,coef_shape) )
+	##}}}
+	
+	def _rvs( self , rng , size ):##{{{
+		return rng.gamma( shape = self.shape.reshape(1,-1) , scale = self.scale.reshape(1,-1) , size = (size,self.scale.size) )
+	##}}}
+	
 	@AbstractLaw._update_coef
 	def _negloglikelihood( self , coef ): ##{{{
-		if not np.all(self.scale > 0) or not np.all(self.shape > 0) or not np.all(self._Y > 0):
+		if not self._all(self.scale > 0) or not self._all(self.shape > 0) or not self._all(self._Y > 0):
 			return np.Inf
 		
-		return np.sum( self._Y / self.scale + scp.loggamma(self.shape) + self.shape * np.log(self.scale) - (self.shape-1) * np.log(self._Y) )
+		return np.sum( self._weighted( self._Y / self.scale + scp.loggamma(self.shape) + self.shape * np.log(self.scale) - (self.shape-1) * np.log(self._Y) ) )
 	##}}}
 	
 	@AbstractLaw._update_coef
@@ -256,17 +296,34 @@ class Gamma(AbstractLaw):
 		pscale = self.params._dparams["scale"]
 		pshape = self.params._dparams["shape"]
 		
-		if np.all(self.scale > 0) and np.all(self.shape > 0) and np.all(self._Y > 0):
+		if self._all(self.scale > 0) and self._all(self.shape > 0) and self._all(self._Y > 0):
 			if not pscale.is_fix():
-				grad_scale = pscale.design_.T @ ( ( self.shape / self.scale - self._Y / self.scale**2 ) * pscale.gradient() )
+				grad_scale = pscale.design_.T @ self._weighted( ( self.shape / self.scale - self._Y / self.scale**2 ) * pscale.gradient() )
 				grad = np.hstack( (grad,grad_scale.squeeze()) )
 			if not pshape.is_fix():
-				grad_shape = pshape.design_.T @ ( ( scp.digamma(self.shape) + np.log(self.scale) - np.log(self._Y) ) * pshape.gradient() )
+				grad_shape = pshape.design_.T @ self._weighted( ( scp.digamma(self.shape) + np.log(self.scale) - np.log(self._Y) ) * pshape.gradient() )
 				grad = np.hstack( (grad,grad_shape.squeeze()) )
 		else:
 			grad = np.zeros( coef.size ) + np.nan
 		return grad
 	##}}}
+	
+	def _nlll_derivatives( self , order = 1 ):##{{{
+		scale = self.scale
+		shape = self.shape
+		if not ( self._all(scale > 0) and self._all(shape > 0) and self._all(self._Y > 0) ):
+			return None
+		Ys     = self._Y / scale
+		lscale = np.log(scale)
+		lY     = np.log(self._Y)
+		
+		nlll = Ys + scp.loggamma(shape) + shape * lscale - (shape - 1) * lY
+		d1   = { "scale" : ( shape - Ys ) / scale , "shape" : scp.digamma(shape) + lscale - lY }
+		d2   = None
+		if order > 1:
+			d2 = { ("scale","scale") : ( 2. * Ys - shape ) / scale**2 , ("scale","shape") : 1. / scale , ("shape","shape") : scp.polygamma( 1 , shape ) }
+		return nlll,d1,d2,None
+	##}}}
 
 
 
@@ -114,7 +114,7 @@ class Normal(AbstractLaw):
 	"""
 	__doc__ += AbstractLaw.__doc__
 	
-	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 ): ##{{{
+	def __init__( self , method = "MLE" , n_bootstrap = 0 , alpha = 0.05 , **kwargs ): ##{{{
 		"""
 		Initialization of Normal law
 		
@@ -126,9 +126,11 @@ class Normal(AbstractLaw):
 			Numbers of bootstrap for confidence interval, default = 0 (no bootstrap)
 		alpha          : float
 			Level of confidence interval, default = 0.05
+		**kwargs       :
+			Optional arguments for bootstrap, see the documentation of the class
 		
 		"""
-		AbstractLaw.__init__( self , ["loc","scale"] , method , n_bootstrap , alpha )
+		AbstractLaw.__init__( self , ["loc","scale"] , method , n_bootstrap , alpha , **kwargs )
 	##}}}
 	
 	def __str__(self):##{{{
@@ -209,10 +211,37 @@ class Normal(AbstractLaw):
 			self._fit_moments()
 	##}}}
 	
+	def _fit_batch( self , counts ):##{{{
+		if not self.method == "moments":
+			return None
+		
+		ploc   = self.params._dparams["loc"]
+		pscale = self.params._dparams["scale"]
+		n_rep  = counts.shape[0]
+		coefs  = []
+		
+		## Fit loc
+		loc = self.loc.reshape(1,-1)
+		if not ploc.is_fix():
+			coef = mean( self._Y , ploc.design_wo1() , value = False , link = ploc.link , counts = counts ).reshape(n_rep,-1)
+			loc  = ploc.link( coef @ ploc.design_.T )
+			coefs.append(coef)
+		
+		## Fit scale
+		if not pscale.is_fix():
+			coefs.append( std( self._Y , pscale.design_wo1() , m_Y = loc , value = False , link = pscale.link , counts = counts ).reshape(n_rep,-1) )
+		
+		return np.hstack(coefs) if len(coefs) > 0 else None
+	##}}}
+	
+	def _rvs( self , rng , size ):##{{{
+		return rng.normal( loc = self.loc.reshape(1,-1) , scale = self.scale.reshape(1,-1) , size = (size,self.loc.size) )
+	##}}}
+	
 	@AbstractLaw._update_coef
 	def _negloglikelihood( self , coef ): ##{{{
 		scale2 = np.power( self.scale , 2 )
-		return np.Inf if not np.all( self.scale > 0 ) else np.sum( np.log( scale2 ) ) / 2. + np.sum( np.power( self._Y - self.loc , 2 ) / scale2 ) / 2.
+		return np.Inf if not self._all( self.scale > 0 ) else np.sum( self._weighted( np.log( scale2 ) + np.power( self._Y - self.loc , 2 ) / scale2 ) ) / 2.
 	##}}}
 	
 	@AbstractLaw._update_coef
@@ -222,12 +251,28 @@ class Normal(AbstractLaw):
 		
 		ploc = self.params._dparams["loc"]
 		if not ploc.is_fix():
-			grad_loc   = - ploc.design_.T @ (Yc / self.scale**2 * ploc.gradient() )
+			grad_loc   = - ploc.design_.T @ self._weighted( Yc / self.scale**2 * ploc.gradient() )
 			grad = np.hstack( (grad,grad_loc.squeeze()) )
 		
 		pscale = self.params._dparams["scale"]
 		if not pscale.is_fix():
-			grad_scale = pscale.design_.T @ ( ( 1. / self.scale - Yc**2 / self.scale**3 ) * pscale.gradient() )
+			grad_scale = pscale.design_.T @ self._weighted( ( 1. / self.scale - Yc**2 / self.scale**3 ) * pscale.gradient() )
 			grad = np.hstack( (grad,grad_scale.squeeze()) )
 		return grad
 	##}}}
+	
+	def _nlll_derivatives( self , order = 1 ):##{{{
+		scale = self.scale
+		if not self._all( scale > 0 ):
+			return None
+		Yc  = self._Y - self.loc
+		Yc2 = Yc**2
+		is2 = 1. / scale**2
+		
+		nlll = np.log(scale) + Yc2 * is2 / 2.
+		d1   = { "loc" : - Yc * is2 , "scale" : ( 1. - Yc2 * is2 ) / scale }
+		d2   = None
+		if order > 1:
+			d2 = { ("loc","loc") : is2 , ("loc","scale") : 2. * Yc * is2 / scale , ("scale","scale") : ( 3. * Yc2 * is2 - 1. ) * is2 }
+		return nlll,d1,d2,None
+	##}}}
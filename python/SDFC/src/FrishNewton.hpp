@@ -105,9 +105,11 @@
 #include <limits>
 #include <cmath>
 #include <random>
+#include <memory>
 
 #include <Eigen/Dense>
 #include <Eigen/Core>
+#include <Eigen/Sparse>
 
 
 //=======//
@@ -160,6 +162,189 @@ struct Xi //{{{
 } ;
 // }}}
 
+struct Design //{{{
+{
+	// View on the covariates X (n_samples x n_features, without the intercept) stored in a buffer, row major (C
+	// order) or column major (Fortran order), with a unit stride along the rows or the columns. The buffer is not
+	// copied, and the products are done by apply with the Eigen map of the storage order. The column of the
+	// intercept is a column of 1, or the vector intercept if it is given.
+	// X can also be a sparse matrix in compressed format, CSR (row major) or CSC (column major), given by its values,
+	// outer and inner indexes. The products are then done by apply_sparse.
+	
+	typedef Eigen::Index value_index ;
+	typedef Eigen::Matrix<double,Eigen::Dynamic,Eigen::Dynamic,Eigen::RowMajor> RowMatrix ;
+	typedef Eigen::Map<const Eigen::MatrixXd,0,Eigen::OuterStride<>> ColMap ;
+	typedef Eigen::Map<const RowMatrix,0,Eigen::OuterStride<>>       RowMap ;
+	typedef Eigen::Map<const Eigen::VectorXd>                        IMap   ;
+	typedef Eigen::Map<const Eigen::SparseMatrix<double,Eigen::ColMajor,int>> SColMap ;
+	typedef Eigen::Map<const Eigen::SparseMatrix<double,Eigen::RowMajor,int>> SRowMap ;
+	
+	Design():
+		data(nullptr),
+		rows(0),
+		cols(0),
+		stride(0),
+		row_major(false),
+		intercept(nullptr),
+		sparse(false),
+		outer(nullptr),
+		inner(nullptr),
+		nnz(0)
+	{}
+	
+	Design( const double* data_ , value_index rows_ , value_index cols_ , value_index stride_ , bool row_major_ , const double* intercept_ = nullptr ):
+		data(data_),
+		rows(rows_),
+		cols(cols_),
+		stride(stride_),
+		row_major(row_major_),
+		intercept(intercept_),
+		sparse(false),
+		outer(nullptr),
+		inner(nullptr),
+		nnz(0)
+	{}
+	
+	Design( const double* values_ , const int* outer_ , const int* inner_ , value_index rows_ , value_index cols_ , value_index nnz_ , bool row_major_ ):
+		data(values_),
+		rows(rows_),
+		cols(cols_),
+		stride(0),
+		row_major(row_major_),
+		intercept(nullptr),
+		sparse(true),
+		outer(outer_),
+		inner(inner_),
+		nnz(nnz_)
+	{}
+	
+	~Design()
+	{}
+	
+	template<typename F>
+	void apply( F f ) const
+	{
+		if( row_major )
+			f( RowMap( data , rows , cols , Eigen::OuterStride<>(stride) ) ) ;
+		else
+			f( ColMap( data , rows , cols , Eigen::OuterStride<>(stride) ) ) ;
+	}
+	
+	template<typename F>
+	void apply_sparse( F f ) const
+	{
+		if( row_major )
+			f( SRowMap( rows , cols , nnz , outer , inner , data ) ) ;
+		else
+			f( SColMap( rows , cols , nnz , outer , inner , data ) ) ;
+	}
+	
+	IMap intercept_col() const
+	{
+		return IMap( intercept , rows ) ;
+	}
+	
+	const double* data      ;
+	value_index   rows      ;
+	value_index   cols      ;
+	value_index   stride    ;
+	bool          row_major ;
+	const double* intercept ;
+	bool          sparse    ;
+	const int*    outer     ;
+	const int*    inner     ;
+	value_index   nnz       ;
+} ;
+// }}}
+
+struct SparseLDLT //{{{
+{
+	// Sparse LDLT factorization of a symmetric matrix M. The Eigen solver can not be copied, so a copy is a new solver
+	// which factorizes M again. The pattern of M is analyzed at the first factorization only. The sparse LDLT does not
+	// pivot, so if a pivot is numerically zero (A^T Q A is ill conditioned close to the solution), M + delta I is
+	// factorized, with delta small relatively to the diagonal of M.
+	
+	typedef Eigen::SparseMatrix<double>     SpMatrix ;
+	typedef Eigen::SimplicialLDLT<SpMatrix> Solver   ;
+	
+	SparseLDLT():
+		M(),
+		solver( new Solver() ),
+		analyzed(false),
+		shifted(false),
+		ok(false)
+	{}
+	
+	SparseLDLT( const SparseLDLT& other ):
+		M(other.M),
+		solver( new Solver() ),
+		analyzed(false),
+		shifted(false),
+		ok(false)
+	{
+		if( other.ok )
+			factorize() ;
+	}
+	
+	SparseLDLT& operator=( const SparseLDLT& other )
+	{
+		M        = other.M ;
+		solver.reset( new Solver() ) ;
+		analyzed = false ;
+		shifted  = false ;
+		ok       = other.ok && factorize() ;
+		return *this ;
+	}
+	
+	~SparseLDLT()
+	{}
+	
+	bool compute( const SpMatrix& M_ )
+	{
+		M = M_ ;
+		return factorize() ;
+	}
+	
+	bool factorize()
+	{
+		if( !analyzed )
+		{
+			solver->analyzePattern(M) ;
+			analyzed = true ;
+		}
+		shifted = false ;
+		solver->setShift(0) ;
+		solver->factorize(M) ;
+		ok = ( solver->info() == Eigen::Success ) && solver->vectorD().minCoeff() > 0 ;
+		if( ok )
+			return ok ;
+		
+		shifted = true ;
+		solver->setShift( std::sqrt( std::numeric_limits<double>::epsilon() ) * M.diagonal().cwiseAbs().maxCoeff() ) ;
+		solver->factorize(M) ;
+		ok = ( solver->info() == Eigen::Success ) && solver->vectorD().minCoeff() > 0 ;
+		return ok ;
+	}
+	
+	double rcond() const
+	{
+		// Ratio of the smallest and the largest pivots
+		return solver->vectorD().minCoeff() / solver->vectorD().maxCoeff() ;
+	}
+	
+	Eigen::VectorXd solve( const Eigen::VectorXd& rhs ) const
+	{
+		return solver->solve(rhs) ;
+	}
+	
+	SpMatrix                M        ;
+	std::unique_ptr<Solver> solver   ;
+	bool                    analyzed ;
+	bool                    shifted  ;
+	bool                    ok       ;
+} ;
+// }}}
+
 struct QuantileRegression ;
 
 class FrishNewton
@@ -178,6 +363,10 @@ class FrishNewton
 	typedef Eigen::VectorXd Vector             ;
 	typedef Eigen::MatrixXd Matrix             ;
 	typedef Eigen::FullPivLU<Matrix> PLUMatrix ;
+	typedef Eigen::LLT<Matrix>       LLTMatrix ;
+	typedef Eigen::LDLT<Matrix>      LDLTMatrix ;
+	typedef Eigen::SparseMatrix<value_type> SpMatrix ;
+	typedef Eigen::Map<const Vector,0,Eigen::InnerStride<>> YMap ;
 	//}}}
 	
 	//=============//
@@ -191,9 +380,21 @@ class FrishNewton
 		m_beta(beta),
 		m_p(),
 		m_n(),
-		m_A(),
+		m_X(),
+		m_W(),
 		m_lu(),
 		m_iAQA(),
+		m_iAtA(),
+		m_AQA(),
+		m_llt(),
+		m_ldlt(),
+		m_use_ldlt(false),
+		m_cholesky(true),
+		m_sparse(false),
+		m_S(),
+		m_sAQA(),
+		m_sldlt(),
+		m_sldlt0(),
 		m_xi(),
 		m_dxi(),
 		m_alphaP(),
@@ -206,6 +407,10 @@ class FrishNewton
 		m_dr(),
 		m_rhs(),
 		m_coef(),
+		m_sA(),
+		m_y0(),
+		m_design_ok(false),
+		m_nit(0),
 		m_state(not_fitted)
 	{} //}}}
 	
@@ -224,6 +429,12 @@ class FrishNewton
 	qrstate_t state() //{{{
 	{ return m_state ; } //}}}
 	
+	const Array& coef() //{{{
+	{ return m_coef ; } //}}}
+	
+	size_type n_iter() //{{{
+	{ return m_nit ; } //}}}
+	
 	
 	//=======//
 	// State //
@@ -243,31 +454,82 @@ class FrishNewton
 	// Methods //
 	//=========//
 	
-	void fit( Vector& Y , Matrix& X ) //{{{
+	void fit( const YMap& Y , const Design& X ) //{{{
 	{
-		
-		initialize( Y , X ) ;
-		if( m_state == unfeasible )
+		set_design( X ) ;
+		fit( Y ) ;
+	} //}}}
+	
+	void fit( const YMap& Y ) //{{{
+	{
+		// Fit on the design given by the last call of set_design, only the response Y is new
+		if( !m_design_ok )
+		{
+			m_state = unfeasible ;
 			return ;
+		}
+		set_response( Y ) ;
+		initialize() ;
+		solve() ;
+	} //}}}
+	
+	void set_design( const Design& X ) //{{{
+	{
+		// Design matrix and inverse of A^T A (for the least squares starting point), shared by all the responses and
+		// all the tau
+		m_n = X.rows ;
+		m_p = X.cols + 1 ;
+		m_xi  = Xi(m_p,m_n) ;
+		m_dxi = Xi(m_p,m_n) ;
+		m_c   = Array(m_n) ;
+		m_iq  = Array(m_n) ;
+		m_u   = Array(m_n) ;
+		m_dr  = Array(m_n) ;
+		m_rhs = Array(m_p) ;
 		
-		size_type nit = 0 ;
-		while( m_mu > m_tol && ++nit < m_maxit )
+		// The design matrix A = [1,X] is not built, the intercept is handled in A_mul, At_mul and build_AQA. If X is
+		// sparse, A is built as a sparse matrix, and A^T Q A is factorized by a sparse LDLT.
+		m_X      = X ;
+		m_sparse = X.sparse ;
+		m_S      = SpMatrix() ;
+		m_sldlt  = SparseLDLT() ;
+		m_sldlt0 = SparseLDLT() ;
+		if( m_sparse )
+			set_sparse() ;
+		m_sA = At_mul( Vector::Ones(m_n) ).array() ;
+		
+		m_iq = 1. ;
+		m_design_ok = factorize() ;
+		m_state     = m_design_ok ? not_fitted : unfeasible ;
+		if( !m_design_ok )
+			return ;
+		if( m_sparse )
 		{
-			predictor_step() ;
-			if( m_state == unfeasible )
-				return ;
-			infer_gap() ;
-			corrector_step() ;
-			update() ;
+			m_design_ok = !m_sldlt.shifted && m_sldlt.rcond() > std::numeric_limits<value_type>::epsilon() * m_p && m_sldlt0.compute( m_sAQA ) ;
+			m_state     = m_design_ok ? not_fitted : unfeasible ;
 		}
-		m_state = success ;
-		m_coef = - m_xi.y ;
-		
+		else if( !m_cholesky )
+			m_iAtA = m_iAQA ;
+		else if( m_use_ldlt )
+			m_iAtA = m_ldlt.solve( Matrix::Identity(m_p,m_p) ) ;
+		else
+			m_iAtA = m_llt.solve( Matrix::Identity(m_p,m_p) ) ;
+	} //}}}
+	
+	void fit_next( value_type tau ) //{{{
+	{
+		// Fit a new tau on the data of the previous fit, started from its solution
+		m_tau = tau ;
+		if( m_state == success )
+			initialize_warm() ;
+		else
+			initialize() ;
+		solve() ;
 	} //}}}
 	
 	Array predict() //{{{
 	{
-		return m_A * m_coef.matrix() ;
+		return A_mul( m_coef.matrix() ).array() ;
 	} //}}}
 	
 	
@@ -277,39 +539,38 @@ class FrishNewton
 	// Methods //
 	//=========//
 	
-	void initialize( Vector& Y , Matrix& X ) //{{{
+	void set_response( const YMap& Y ) //{{{
 	{
-		m_n = Y.size() ;
-		m_p = X.cols() + 1 ;
-		m_xi  = Xi(m_p,m_n) ;
-		m_dxi = Xi(m_p,m_n) ;
-		m_c   = -Y ;
-		m_iq  = Array(m_n) ;
-		m_u   = Array(m_n) ;
-		m_dr  = Array(m_n) ;
-		m_rhs = Array(m_p) ;
-		
-		// Design matrix
-		m_A = Matrix(m_n,m_p) ;
-		m_A.col(0).array() = 1. ;
-		m_A.block( 0 , 1 , m_n , m_p - 1 ) = X ;
-		
-		//
-		m_b = ( 1. - m_tau ) * m_A.colwise().sum() ;
-		m_lu = PLUMatrix(m_A.transpose() * m_A) ;
-		if( !m_lu.isInvertible() )
-		{
-			m_state = unfeasible ;
-			return ;
-		}
-		m_iAQA = m_lu.inverse() ;
-		m_iq = 1. ;
-		m_u  = 1. ;
+		// Response and least squares starting point
+		m_c  = -Y ;
+		m_y0 = m_sparse ? m_sldlt0.solve( At_mul( m_c.matrix() ) ) : Vector( m_iAtA * At_mul( m_c.matrix() ) ) ;
+		m_state = not_fitted ;
+	} //}}}
+	
+	void initialize() //{{{
+	{
+		m_b = ( 1. - m_tau ) * m_sA ;
+		m_u = 1. ;
 		m_xi.x = 1. - m_tau ;
-		m_xi.y = m_A.transpose() * m_c.matrix() ;
-		m_xi.y = m_iAQA * m_xi.y.matrix() ;
-		m_xi.s = m_c - (m_A * m_xi.y.matrix()).array() ;
-		
+		m_xi.y = m_y0.array() ;
+		init_slacks() ;
+	} //}}}
+	
+	void initialize_warm() //{{{
+	{
+		// The dual point y (the coefficients) of the previous tau is kept, it is close to the solution. The primal
+		// point x of the previous solution is on the bounds 0 and 1, where the interior point method is stuck, so x is
+		// restarted at the center 1/2 of the box. The constraint A^T x = b is then not verified, but the predictor
+		// step corrects the residual b - A^T x.
+		m_b = ( 1. - m_tau ) * m_sA ;
+		m_u = 1. ;
+		m_xi.x = 0.5 ;
+		init_slacks() ;
+	} //}}}
+	
+	void init_slacks() //{{{
+	{
+		m_xi.s = m_c - A_mul( m_xi.y.matrix() ).array() ;
 		for( size_type i = 0 ; i < m_n ; ++i )
 		{
 			m_xi.z[i] = std::max(  m_xi.s[i] , 0. ) + ( (std::abs(m_xi.s[i]) < m_tol) ? m_tol : 0 ) ;
@@ -319,6 +580,134 @@ class FrishNewton
 		m_mu = m_xi.mu() ;
 	} //}}}
 	
+	void solve() //{{{
+	{
+		m_nit = 0 ;
+		while( m_mu > m_tol && ++m_nit < m_maxit )
+		{
+			predictor_step() ;
+			if( m_state == unfeasible )
+				return ;
+			infer_gap() ;
+			corrector_step() ;
+			update() ;
+		}
+		m_state = success ;
+		m_coef = - m_xi.y ;
+	} //}}}
+	
+	void set_sparse() //{{{
+	{
+		// Sparse A = [1,X] in column major order, the intercept is the first column
+		SpMatrix X ;
+		m_X.apply_sparse( [&]( const auto& Xs ) { X = Xs ; } ) ;
+		Eigen::VectorXi nnz(m_p) ;
+		nnz[0] = m_n ;
+		for( size_type j = 1 ; j < m_p ; ++j )
+			nnz[j] = X.outerIndexPtr()[j] - X.outerIndexPtr()[j-1] ;
+		m_S.resize( m_n , m_p ) ;
+		m_S.reserve( nnz ) ;
+		for( size_type i = 0 ; i < m_n ; ++i )
+			m_S.insert( i , 0 ) = ( m_X.intercept == nullptr ) ? 1. : m_X.intercept[i] ;
+		for( size_type j = 1 ; j < m_p ; ++j )
+			for( SpMatrix::InnerIterator it( X , j - 1 ) ; it ; ++it )
+				m_S.insert( it.row() , j ) = it.value() ;
+		m_S.makeCompressed() ;
+	} //}}}
+	
+	Vector A_mul( const Vector& v ) //{{{
+	{
+		// A v, with A = [1,X]
+		if( m_sparse )
+			return m_S * v ;
+		Vector Av(m_n) ;
+		m_X.apply( [&]( const auto& X ) { Av.noalias() = X * v.tail(m_p-1) ; } ) ;
+		if( m_X.intercept == nullptr )
+			return Av.array() + v[0] ;
+		Av.noalias() += v[0] * m_X.intercept_col() ;
+		return Av ;
+	} //}}}
+	
+	Vector At_mul( const Vector& u ) //{{{
+	{
+		// A^T u, with A = [1,X]
+		if( m_sparse )
+			return m_S.transpose() * u ;
+		Vector v(m_p) ;
+		v[0] = ( m_X.intercept == nullptr ) ? u.sum() : m_X.intercept_col().dot(u) ;
+		m_X.apply( [&]( const auto& X ) { v.tail(m_p-1).noalias() = X.transpose() * u ; } ) ;
+		return v ;
+	} //}}}
+	
+	bool factorize() //{{{
+	{
+		// Factorization of the normal matrix A^T Q A, with Q = diag(m_iq). It is symmetric positive definite, so a
+		// Cholesky factorization (LDLT if LLT fails numerically) is used, and the systems are solved with triangular
+		// solves. If m_cholesky is false, the former path (full pivoting LU and explicit inverse) is used. If A is
+		// sparse, A^T Q A is sparse, and is factorized by a sparse LDLT (with the same pattern at each iteration).
+		if( m_sparse )
+		{
+			m_sAQA = m_S.transpose() * ( m_iq.matrix().asDiagonal() * m_S ) ;
+			return m_sldlt.compute( m_sAQA ) ;
+		}
+		build_AQA() ;
+		if( !m_cholesky )
+		{
+			m_AQA.triangularView<Eigen::StrictlyUpper>() = m_AQA.transpose() ;
+			m_lu.compute( m_AQA ) ;
+			if( !m_lu.isInvertible() )
+				return false ;
+			m_iAQA = m_lu.inverse() ;
+			return true ;
+		}
+		
+		m_llt.compute( m_AQA ) ;
+		m_use_ldlt = ( m_llt.info() != Eigen::Success ) ;
+		if( !m_use_ldlt )
+			return true ;
+		m_ldlt.compute( m_AQA ) ;
+		if( m_ldlt.info() != Eigen::Success )
+			return false ;
+		value_type dmax = m_ldlt.vectorD().cwiseAbs().maxCoeff() ;
+		return dmax > 0 && m_ldlt.vectorD().cwiseAbs().minCoeff() > dmax * std::numeric_limits<value_type>::epsilon() * m_p ;
+	} //}}}
+	
+	void build_AQA() //{{{
+	{
+		// Lower part of A^T Q A. The intercept gives the first row and column, and X^T Q X is built by rank updates
+		// with the blocks of rows of Q^1/2 X, so that no n x p matrix is allocated
+		const size_type block = 1024 ;
+		m_AQA.setZero( m_p , m_p ) ;
+		m_X.apply( [&]( const auto& X ) {
+			if( m_X.intercept == nullptr )
+			{
+				m_AQA(0,0) = m_iq.sum() ;
+				m_AQA.col(0).tail(m_p-1).noalias() = X.transpose() * m_iq.matrix() ;
+			}
+			else
+			{
+				Vector qc = m_iq.matrix().cwiseProduct( m_X.intercept_col() ) ;
+				m_AQA(0,0) = qc.dot( m_X.intercept_col() ) ;
+				m_AQA.col(0).tail(m_p-1).noalias() = X.transpose() * qc ;
+			}
+			for( size_type a = 0 ; a < m_n ; a += block )
+			{
+				size_type m = std::min( block , m_n - a ) ;
+				m_W = X.middleRows(a,m).array().colwise() * m_iq.segment(a,m).sqrt() ;
+				m_AQA.bottomRightCorner(m_p-1,m_p-1).template selfadjointView<Eigen::Lower>().rankUpdate( m_W.transpose() ) ;
+			}
+		} ) ;
+	} //}}}
+	
+	Vector solve_normal( const Vector& rhs ) //{{{
+	{
+		if( m_sparse )
+			return m_sldlt.solve(rhs) ;
+		if( !m_cholesky )
+			return m_iAQA * rhs ;
+		return m_use_ldlt ? Vector(m_ldlt.solve(rhs)) : Vector(m_llt.solve(rhs)) ;
+	} //}}}
+	
 	void predictor_step() //{{{
 	{
 		for( size_type i = 0 ; i < m_n ; ++i )
@@ -328,17 +717,15 @@ class FrishNewton
 			m_dxi.z[i] = m_iq[i] * m_dxi.s[i] ;
 		}
 		
-		m_lu = PLUMatrix(m_A.transpose() * m_iq.matrix().asDiagonal() * m_A) ;
-		if( !m_lu.isInvertible() )
+		if( !factorize() )
 		{
 			m_state = unfeasible ;
 			return ;
 		}
-		m_iAQA = m_lu.inverse() ;
-		m_rhs = m_b - (m_A.transpose() * m_xi.x.matrix()).array() ;
-		m_rhs += (m_A.transpose() * m_dxi.z.matrix()).array() ;
-		m_dxi.y = m_iAQA * m_rhs.matrix() ;
-		m_dxi.s = ( m_A * m_dxi.y.matrix() ).array() - m_dxi.s ;
+		m_rhs = m_b - At_mul( m_xi.x.matrix() ).array() ;
+		m_rhs += At_mul( m_dxi.z.matrix() ).array() ;
+		m_dxi.y = solve_normal( m_rhs.matrix() ) ;
+		m_dxi.s = A_mul( m_dxi.y.matrix() ).array() - m_dxi.s ;
 		
 		m_alphaP = std::numeric_limits<value_type>::max() ;
 		m_alphaD = std::numeric_limits<value_type>::max() ;
@@ -381,9 +768,9 @@ class FrishNewton
 			m_dr[i] = m_iq[i] * ( m_mu * ( 1. / m_xi.s[i] - 1. / m_xi.x[i] ) + m_dxi.x[i] * m_dxi.z[i] / m_xi.x[i] - m_dxi.s[i] * m_dxi.w[i] / m_xi.s[i] ) ;
 		}
 		std::swap( m_dxi.y , m_rhs ) ;
-		m_dxi.y += ( m_A.transpose() * m_dr.matrix() ).array() ;
-		m_dxi.y = m_iAQA * m_dxi.y.matrix() ;
-		m_u = m_A * m_dxi.y.matrix() ;
+		m_dxi.y += At_mul( m_dr.matrix() ).array() ;
+		m_dxi.y = solve_normal( m_dxi.y.matrix() ) ;
+		m_u = A_mul( m_dxi.y.matrix() ).array() ;
 		
 		m_alphaP = std::numeric_limits<value_type>::max() ;
 		m_alphaD = std::numeric_limits<value_type>::max() ;
@@ -433,9 +820,21 @@ class FrishNewton
 	value_type m_beta             ;
 	size_type  m_p                ;
 	size_type  m_n                ;
-	Matrix     m_A                ;
+	Design     m_X                ;
+	Matrix     m_W                ;
 	PLUMatrix  m_lu               ;
 	Matrix     m_iAQA             ;
+	Matrix     m_iAtA             ;
+	Matrix     m_AQA              ;
+	LLTMatrix  m_llt              ;
+	LDLTMatrix m_ldlt             ;
+	bool       m_use_ldlt         ;
+	bool       m_cholesky         ;
+	bool       m_sparse           ;
+	SpMatrix   m_S                ;
+	SpMatrix   m_sAQA             ;
+	SparseLDLT m_sldlt            ;
+	SparseLDLT m_sldlt0           ;
 	Xi         m_xi               ;
 	Xi         m_dxi              ;
 	value_type m_alphaP           ;
@@ -448,6 +847,10 @@ class FrishNewton
 	Array      m_dr               ;
 	Array      m_rhs              ;
 	Array      m_coef             ;
+	Array      m_sA               ;
+	Vector     m_y0               ;
+	bool       m_design_ok        ;
+	size_type  m_nit              ;
 	qrstate_t  m_state            ;
 	//}}}
 	
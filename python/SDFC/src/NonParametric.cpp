@@ -87,6 +87,7 @@
 
 #include <pybind11/pybind11.h>
 #include <pybind11/eigen.h>
+#include <pybind11/numpy.h>
 
 #include "QuantileRegression.hpp"
 
@@ -119,16 +120,18 @@ PYBIND11_MODULE( __NonParametric_cpp , m )
 	.def( py::init<py::list>()                    , py::arg("ltau") )
 	.def( py::init<Eigen::Ref<Eigen::VectorXd>>() , py::arg("ltau") )
 	.def( "__repr__"       , &QuantileRegression::repr )
-	.def( "fit"            , &QuantileRegression::fit , py::arg("Y") , py::arg("X") )
+	.def( "fit"            , &QuantileRegression::fit , py::arg("Y") , py::arg("X") , py::arg("quantiles") = true )
+	.def( "fit_many"       , &QuantileRegression::fit_many , py::arg("Y") , py::arg("X") )
 	.def( "is_fitted"      , &QuantileRegression::is_fitted     )
 	.def( "is_success"     , &QuantileRegression::is_success    )
 	.def( "is_unfeasible"  , &QuantileRegression::is_unfeasible )
-	.def( "set_fit_params" , &QuantileRegression::set_fit_params , py::arg("maxit") = 50 , py::arg("tol") = 1e-6 , py::arg("beta") = 0.99995 )
+	.def( "set_fit_params" , &QuantileRegression::set_fit_params , py::arg("maxit") = 50 , py::arg("tol") = 1e-6 , py::arg("beta") = 0.99995 , py::arg("warm_start") = true , py::arg("cholesky") = true , py::arg("n_threads") = 1 , py::arg("preprocessing") = false )
 	.def( "set_ltau"       , (void (QuantileRegression::*) (double))                      &QuantileRegression::set_ltau , py::arg("ltau") )
 	.def( "set_ltau"       , (void (QuantileRegression::*) (py::list))                    &QuantileRegression::set_ltau , py::arg("ltau") )
 	.def( "set_ltau"       , (void (QuantileRegression::*) (Eigen::Ref<Eigen::VectorXd>)) &QuantileRegression::set_ltau , py::arg("ltau") )
-	.def_readwrite( "coef_"     , &QuantileRegression::m_coef      )
-	.def_readwrite( "quantiles" , &QuantileRegression::m_quantiles )
+	.def_property( "coef_"              , &QuantileRegression::coef , &QuantileRegression::set_coef )
+	.def_property_readonly( "quantiles" , &QuantileRegression::quantiles )
+	.def_readonly( "n_iter" , &QuantileRegression::m_nit )
 	;
 	
 	//============//
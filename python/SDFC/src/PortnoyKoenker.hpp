@@ -0,0 +1,402 @@
+
+//==============================================================================//
+//==============================================================================//
+//                                                                              //
+// Copyright Yoann Robin, 2019                                                  //
+//                                                                              //
+// yoann.robin.k@gmail.com                                                      //
+//                                                                              //
+// This software is a computer program that is part of the SDFC (Statistical    //
+// Distribution Fit with Covariates) library. This library makes it possible    //
+// to regress the parameters of some statistical law with co-variates.          //
+//                                                                              //
+// This software is governed by the CeCILL-C license under French law and       //
+// abiding by the rules of distribution of free software.  You can  use,        //
+// modify and/ or redistribute the software under the terms of the CeCILL-C     //
+// license as circulated by CEA, CNRS and INRIA at the following URL            //
+// "http://www.cecill.info".                                                    //
+//                                                                              //
+// As a counterpart to the access to the source code and  rights to copy,       //
+// modify and redistribute granted by the license, users are provided only      //
+// with a limited warranty  and the software's author,  the holder of the       //
+// economic rights,  and the successive licensors  have only  limited           //
+// liability.                                                                   //
+//                                                                              //
+// In this respect, the user's attention is drawn to the risks associated       //
+// with loading,  using,  modifying and/or developing or reproducing the        //
+// software by the user in light of its specific status of free software,       //
+// that may mean  that it is complicated to manipulate,  and  that  also        //
+// therefore means  that it is reserved for developers  and  experienced        //
+// professionals having in-depth computer knowledge. Users are therefore        //
+// encouraged to load and test the software's suitability as regards their      //
+// requirements in conditions enabling the security of their systems and/or     //
+// data to be ensured and,  more generally, to use and operate it in the        //
+// same conditions as regards security.                                         //
+//                                                                              //
+// The fact that you are presently reading this means that you have had         //
+// knowledge of the CeCILL-C license and that you accept its terms.             //
+//                                                                              //
+//==============================================================================//
+//==============================================================================//
+
+//==============================================================================//
+//==============================================================================//
+//                                                                              //
+// Copyright Yoann Robin, 2019                                                  //
+//                                                                              //
+// yoann.robin.k@gmail.com                                                      //
+//                                                                              //
+// Ce logiciel est un programme informatique faisant partie de la librairie     //
+// SDFC (Statistical Distribution Fit with Covariates). Cette librairie         //
+// permet de calculer de regresser les parametres de lois statistiques selon    //
+// plusieurs co-variables                                                       //
+//                                                                              //
+// Ce logiciel est régi par la licence CeCILL-C soumise au droit français et    //
+// respectant les principes de diffusion des logiciels libres. Vous pouvez      //
+// utiliser, modifier et/ou redistribuer ce programme sous les conditions       //
+// de la licence CeCILL-C telle que diffusée par le CEA, le CNRS et l'INRIA     //
+// sur le site "http://www.cecill.info".                                        //
+//                                                                              //
+// En contrepartie de l'accessibilité au code source et des droits de copie,    //
+// de modification et de redistribution accordés par cette licence, il n'est    //
+// offert aux utilisateurs qu'une garantie limitée.  Pour les mêmes raisons,    //
+// seule une responsabilité restreinte pèse sur l'auteur du programme, le       //
+// titulaire des droits patrimoniaux et les concédants successifs.              //
+//                                                                              //
+// A cet égard  l'attention de l'utilisateur est attirée sur les risques        //
+// associés au chargement,  à l'utilisation,  à la modification et/ou au        //
+// développement et à la reproduction du logiciel par l'utilisateur étant       //
+// donné sa spécificité de logiciel libre, qui peut le rendre complexe à        //
+// manipuler et qui le réserve donc à des développeurs et des professionnels    //
+// avertis possédant  des  connaissances  informatiques approfondies.  Les      //
+// utilisateurs sont donc invités à charger  et  tester  l'adéquation  du       //
+// logiciel à leurs besoins dans des conditions permettant d'assurer la         //
+// sécurité de leurs systèmes et ou de leurs données et, plus généralement,     //
+// à l'utiliser et l'exploiter dans les mêmes conditions de sécurité.           //
+//                                                                              //
+// Le fait que vous puissiez accéder à cet en-tête signifie que vous avez       //
+// pris connaissance de la licence CeCILL-C, et que vous en avez accepté les    //
+// termes.                                                                      //
+//                                                                              //
+//==============================================================================//
+//==============================================================================//
+
+//==============================================================================//
+// The preprocessing follows Portnoy, S. and Koenker, R. (1997), The Gaussian   //
+// hare and the Laplacian tortoise, Statistical Science, 12, 279-300, and the   //
+// function rq.fit.pfn of the R package "quantreg", see:                        //
+// https://cran.r-project.org/web/packages/quantreg/index.html                  //
+//==============================================================================//
+
+//==============================================================================//
+// Le pretraitement suit Portnoy, S. et Koenker, R. (1997), The Gaussian hare   //
+// and the Laplacian tortoise, Statistical Science, 12, 279-300, et la          //
+// fonction rq.fit.pfn du package R "quantreg", voir:                           //
+// https://cran.r-project.org/web/packages/quantreg/index.html                  //
+//==============================================================================//
+
+
+#ifndef SDFC_NONPARAMETRIC_PORTNOYKOENKER
+#define SDFC_NONPARAMETRIC_PORTNOYKOENKER
+
+//-----------//
+// Libraries //
+//-----------//
+
+
+#include <limits>
+#include <cmath>
+#include <random>
+#include <vector>
+#include <cstdint>
+#include <algorithm>
+
+#include <Eigen/Dense>
+#include <Eigen/Core>
+
+
+#include "FrishNewton.hpp"
+
+//=======//
+// Class //
+//=======//
+
+class PortnoyKoenker
+{
+	public:
+	
+	//=========//
+	// Typedef // 
+	//=========//
+	
+	//{{{
+	typedef unsigned int    size_type          ;
+	typedef double          value_type         ;
+	typedef Eigen::ArrayXd  Array              ;
+	typedef Eigen::VectorXd Vector             ;
+	typedef Eigen::MatrixXd Matrix             ;
+	typedef Eigen::LLT<Matrix>       LLTMatrix ;
+	typedef FrishNewton::YMap        YMap      ;
+	//}}}
+	
+	//=============//
+	// Constructor //
+	//=============//
+	
+	PortnoyKoenker( value_type factor = 0.8 , value_type max_fixup = 0.1 ): //{{{
+		m_factor(factor),
+		m_max_fixup(max_fixup),
+		m_n(),
+		m_p(),
+		m_As(),
+		m_Ys(),
+		m_Xr(),
+		m_Yr(),
+		m_one(),
+		m_B(),
+		m_t(),
+		m_work(),
+		m_label(),
+		m_coef(),
+		m_nit(0),
+		m_state(not_fitted)
+	{} //}}}
+	
+	~PortnoyKoenker() //{{{
+	{} //}}}
+	
+	//===========//
+	// Accessors //
+	//===========//
+	
+	qrstate_t state() //{{{
+	{ return m_state ; } //}}}
+	
+	const Array& coef() //{{{
+	{ return m_coef ; } //}}}
+	
+	size_type n_iter() //{{{
+	{ return m_nit ; } //}}}
+	
+	
+	//=========//
+	// Methods //
+	//=========//
+	
+	qrstate_t fit( FrishNewton& frishNewton , const YMap& Y , const Design& X , value_type tau , std::uint64_t seed ) //{{{
+	{
+		// Fit the quantile tau with the FrishNewton workspace frishNewton:
+		// 1. the quantile regression is fitted on a random subsample of size m = (np)^(2/3),
+		// 2. the observations far above (resp. below) the fitted quantile, relatively to the standard error of the
+		//    prediction, are replaced by their sum, a single "glob" observation,
+		// 3. the reduced problem is fitted. If the signs of the residuals of the globbed observations are kept, the
+		//    solution is the solution of the full problem. Otherwise, the wrongly globbed observations are put back
+		//    in the reduced problem, or m is doubled if they are too many.
+		// If m reaches n, or if a fit fails, the full problem is fitted. The preprocessing needs a dense design, a
+		// sparse problem is directly fitted.
+		m_n   = Y.size() ;
+		m_p   = X.cols + 1 ;
+		m_nit = 0 ;
+		std::mt19937_64 gen(seed) ;
+		frishNewton.set_tau(tau) ;
+		
+		value_type m = std::round( std::pow( static_cast<value_type>(m_n) * m_p , 2. / 3. ) ) ;
+		while( m < m_n && !X.sparse )
+		{
+			// Pilot fit on the subsample
+			size_type ms = static_cast<size_type>(m) ;
+			subsample( Y , X , ms , gen ) ;
+			frishNewton.fit( YMap( m_Ys.data() , ms , Eigen::InnerStride<>(1) ) , Design( m_As.data() + ms , ms , m_p - 1 , ms , false ) ) ;
+			m_nit += frishNewton.n_iter() ;
+			if( !frishNewton.is_success() || !glob( Y , X , frishNewton.coef() , tau , m_factor * m ) )
+				break ;
+			
+			// Reduced problems, until the signs of the residuals of the globbed observations are verified
+			bool redo = false ;
+			while( !redo )
+			{
+				reduce( X , Y ) ;
+				frishNewton.fit( YMap( m_Yr.data() , m_Yr.size() , Eigen::InnerStride<>(1) ) , Design( m_Xr.data() , m_Xr.rows() , m_p - 1 , m_Xr.rows() , false , m_one.data() ) ) ;
+				m_nit += frishNewton.n_iter() ;
+				if( !frishNewton.is_success() )
+					break ;
+				size_type n_bad = check( Y , X , frishNewton.coef() , m_max_fixup * m_factor * m ) ;
+				if( n_bad == 0 )
+				{
+					m_coef  = frishNewton.coef() ;
+					m_state = success ;
+					return m_state ;
+				}
+				redo = ( n_bad > m_max_fixup * m_factor * m ) ;
+			}
+			if( !redo )
+				break ;
+			m *= 2 ;
+		}
+		
+		// Full problem
+		frishNewton.fit( Y , X ) ;
+		m_nit  += frishNewton.n_iter() ;
+		m_coef  = frishNewton.coef() ;
+		m_state = frishNewton.state() ;
+		return m_state ;
+	} //}}}
+	
+	
+	private:
+	
+	//=========//
+	// Methods //
+	//=========//
+	
+	void subsample( const YMap& Y , const Design& X , size_type m , std::mt19937_64& gen ) //{{{
+	{
+		// Sequential random sampling of m rows without replacement (Knuth, algorithm S), the rows are kept in order.
+		// m_As = [1,X] on the subsample.
+		std::uniform_real_distribution<value_type> unif( 0 , 1 ) ;
+		std::vector<size_type> idx(m) ;
+		size_type k = 0 ;
+		for( size_type i = 0 ; i < m_n && k < m ; ++i )
+		{
+			if( ( m_n - i ) * unif(gen) < m - k )
+				idx[k++] = i ;
+		}
+		
+		m_As.resize( m , m_p ) ;
+		m_Ys.resize( m ) ;
+		m_As.col(0).setOnes() ;
+		X.apply( [&]( const auto& Xf ) {
+			for( size_type k = 0 ; k < m ; ++k )
+				m_As.row(k).tail(m_p-1) = Xf.row(idx[k]) ;
+		} ) ;
+		for( size_type k = 0 ; k < m ; ++k )
+			m_Ys[k] = Y[idx[k]] ;
+	} //}}}
+	
+	bool glob( const YMap& Y , const Design& X , const Array& coef , value_type tau , value_type M ) //{{{
+	{
+		// Standardized residuals t = r / band of the pilot fit, with band the norm of a_i^T in the metric of
+		// (A_s^T A_s)^-1, i.e. the standard error of the prediction up to a constant. The observations with t below
+		// (resp. above) the empirical quantile of level tau - M / 2n (resp. tau + M / 2n) are globbed.
+		const size_type block = 1024 ;
+		const value_type eps  = 1e-6 ;
+		LLTMatrix llt( m_As.transpose() * m_As ) ;
+		if( llt.info() != Eigen::Success )
+			return false ;
+		
+		residuals( Y , X , coef ) ;
+		X.apply( [&]( const auto& Xf ) {
+			for( size_type a = 0 ; a < m_n ; a += block )
+			{
+				size_type b = std::min( block , m_n - a ) ;
+				m_B.resize( m_p , b ) ;
+				m_B.row(0).setOnes() ;
+				m_B.bottomRows(m_p-1) = Xf.middleRows(a,b).transpose() ;
+				llt.matrixL().solveInPlace(m_B) ;
+				m_t.segment(a,b) /= m_B.colwise().norm().transpose().array().max(eps) ;
+			}
+		} ) ;
+		
+		value_type n  = static_cast<value_type>(m_n) ;
+		value_type lo = std::max( 1. / n , tau - M / ( 2. * n ) ) ;
+		value_type hi = std::min( tau + M / ( 2. * n ) , ( n - 1. ) / n ) ;
+		value_type kappa_lo = order_statistic( static_cast<size_type>( lo * ( n - 1 ) ) ) ;
+		value_type kappa_hi = order_statistic( static_cast<size_type>( hi * ( n - 1 ) ) ) ;
+		
+		m_label.resize( m_n ) ;
+		for( size_type i = 0 ; i < m_n ; ++i )
+			m_label[i] = ( m_t[i] < kappa_lo ) ? -1 : ( ( m_t[i] > kappa_hi ) ? 1 : 0 ) ;
+		return true ;
+	} //}}}
+	
+	value_type order_statistic( size_type k ) //{{{
+	{
+		m_work = m_t ;
+		std::nth_element( m_work.data() , m_work.data() + k , m_work.data() + m_n ) ;
+		return m_work[k] ;
+	} //}}}
+	
+	void reduce( const Design& X , const YMap& Y ) //{{{
+	{
+		// Reduced problem: the observations not globbed, and one observation for each glob, the sum of its rows. The
+		// column of the intercept of a glob is its number of observations.
+		size_type n_lo = 0 , n_hi = 0 ;
+		for( size_type i = 0 ; i < m_n ; ++i )
+		{
+			n_lo += ( m_label[i] < 0 ) ;
+			n_hi += ( m_label[i] > 0 ) ;
+		}
+		size_type nk = m_n - n_lo - n_hi ;
+		size_type nr = nk + ( n_lo > 0 ) + ( n_hi > 0 ) ;
+		
+		m_Xr.setZero( nr , m_p - 1 ) ;
+		m_Yr.setZero( nr ) ;
+		m_one.setOnes( nr ) ;
+		size_type k = 0 ;
+		size_type k_lo = nk , k_hi = nk + ( n_lo > 0 ) ;
+		if( n_lo > 0 ) m_one[k_lo] = n_lo ;
+		if( n_hi > 0 ) m_one[k_hi] = n_hi ;
+		X.apply( [&]( const auto& Xf ) {
+			for( size_type i = 0 ; i < m_n ; ++i )
+			{
+				size_type r = ( m_label[i] == 0 ) ? k++ : ( ( m_label[i] < 0 ) ? k_lo : k_hi ) ;
+				m_Xr.row(r) += Xf.row(i) ;
+				m_Yr[r]     += Y[i] ;
+			}
+		} ) ;
+	} //}}}
+	
+	size_type check( const YMap& Y , const Design& X , const Array& coef , value_type max_bad ) //{{{
+	{
+		// Number of globbed observations with a residual of the wrong sign. If they are not too many, they are
+		// removed from their glob.
+		residuals( Y , X , coef ) ;
+		size_type n_bad = 0 ;
+		for( size_type i = 0 ; i < m_n ; ++i )
+			n_bad += ( m_label[i] < 0 && m_t[i] > 0 ) || ( m_label[i] > 0 && m_t[i] < 0 ) ;
+		if( n_bad > 0 && n_bad <= max_bad )
+		{
+			for( size_type i = 0 ; i < m_n ; ++i )
+				if( ( m_label[i] < 0 && m_t[i] > 0 ) || ( m_label[i] > 0 && m_t[i] < 0 ) )
+					m_label[i] = 0 ;
+		}
+		return n_bad ;
+	} //}}}
+	
+	void residuals( const YMap& Y , const Design& X , const Array& coef ) //{{{
+	{
+		// m_t = Y - A coef, with A = [1,X]
+		m_t.resize( m_n ) ;
+		X.apply( [&]( const auto& Xf ) { m_t.matrix().noalias() = Xf * coef.tail(m_p-1).matrix() ; } ) ;
+		m_t = Y.array() - coef[0] - m_t ;
+	} //}}}
+	
+	
+	//===========//
+	// Arguments //
+	//===========//
+	
+	//{{{
+	value_type             m_factor    ;
+	value_type             m_max_fixup ;
+	size_type              m_n         ;
+	size_type              m_p         ;
+	Matrix                 m_As        ;
+	Vector                 m_Ys        ;
+	Matrix                 m_Xr        ;
+	Vector                 m_Yr        ;
+	Vector                 m_one       ;
+	Matrix                 m_B         ;
+	Array                  m_t         ;
+	Array                  m_work      ;
+	std::vector<signed char> m_label   ;
+	Array                  m_coef      ;
+	size_type              m_nit       ;
+	qrstate_t              m_state     ;
+	//}}}
+	
+	
+} ;
+
+
+#endif
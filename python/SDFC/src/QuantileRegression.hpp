@@ -92,12 +92,19 @@
 #include <limits>
 #include <cmath>
 #include <random>
+#include <vector>
+#include <numeric>
+#include <algorithm>
+#include <thread>
+#include <stdexcept>
 #include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
 #include <Eigen/Dense>
 #include <Eigen/Core>
 
 
 #include "FrishNewton.hpp"
+#include "PortnoyKoenker.hpp"
 
 //============//
 // namespaces //
@@ -119,8 +126,14 @@ struct QuantileRegression
 	typedef unsigned int    size_type  ;
 	typedef double          value_type ;
 	typedef Eigen::ArrayXd  Array      ;
+	typedef Eigen::ArrayXi  IArray     ;
 	typedef Eigen::VectorXd Vector     ;
 	typedef Eigen::MatrixXd Matrix     ;
+	typedef Eigen::Stride<Eigen::Dynamic,Eigen::Dynamic> Stride ;
+	typedef Eigen::Map<Matrix,0,Stride> MMap ;
+	typedef FrishNewton::YMap    YMap  ;
+	typedef py::array_t<value_type,py::array::f_style> FArray ;
+	static constexpr py::ssize_t value_size = sizeof(value_type) ;
 	//}}}
 	
 	
@@ -130,17 +143,25 @@ struct QuantileRegression
 	
 	QuantileRegression(): //{{{
 		m_ltau() ,
-		m_coef() ,
-		m_quantiles() ,
+		m_coef( std::vector<py::ssize_t>({0,0}) ) ,
+		m_quantiles( py::none() ) ,
 		m_frishNewton( 0.5 , 50 , 1e-6 , 0.99995 ),
+		m_nit() ,
+		m_warm_start(true) ,
+		m_preprocessing(false) ,
+		m_n_threads(1) ,
 		m_state(not_fitted)
 	{} //}}}
 	
 	QuantileRegression( value_type ltau ): //{{{
 		m_ltau(1) ,
-		m_coef() ,
-		m_quantiles() ,
+		m_coef( std::vector<py::ssize_t>({0,0}) ) ,
+		m_quantiles( py::none() ) ,
 		m_frishNewton( 0.5 , 50 , 1e-6 , 0.99995 ),
+		m_nit() ,
+		m_warm_start(true) ,
+		m_preprocessing(false) ,
+		m_n_threads(1) ,
 		m_state(not_fitted)
 	{
 		m_ltau[0] = ltau ;
@@ -148,9 +169,13 @@ struct QuantileRegression
 	
 	QuantileRegression( py::list ltau ): //{{{
 		m_ltau(py::len(ltau)) ,
-		m_coef() ,
-		m_quantiles() ,
+		m_coef( std::vector<py::ssize_t>({0,0}) ) ,
+		m_quantiles( py::none() ) ,
 		m_frishNewton( 0.5 , 50 , 1e-6 , 0.99995 ),
+		m_nit() ,
+		m_warm_start(true) ,
+		m_preprocessing(false) ,
+		m_n_threads(1) ,
 		m_state(not_fitted)
 	{
 		int s = 0 ;
@@ -160,9 +185,13 @@ struct QuantileRegression
 	
 	QuantileRegression( Eigen::Ref<Vector> ltau ): //{{{
 		m_ltau(ltau) ,
-		m_coef() ,
-		m_quantiles() ,
+		m_coef( std::vector<py::ssize_t>({0,0}) ) ,
+		m_quantiles( py::none() ) ,
 		m_frishNewton( 0.5 , 50 , 1e-6 , 0.99995 ),
+		m_nit() ,
+		m_warm_start(true) ,
+		m_preprocessing(false) ,
+		m_n_threads(1) ,
 		m_state(not_fitted)
 	{} //}}}
 	
@@ -175,7 +204,7 @@ struct QuantileRegression
 		std::string _repr("") ;
 		_repr += "SDFC.NonParametric.QuantileRegression\n" ;
 		_repr += "=====================================\n" ;
-		_repr += "* Method    : Frish-Newton\n" ;
+		_repr += "* Method    : Frish-Newton" + std::string( m_preprocessing ? " with preprocessing" : "" ) + "\n" ;
 		_repr += "* Fitted    : " + ( is_fitted()     ? True : False ) + "\n" ;
 		_repr += "* Success   : " + ( is_success()    ? True : False ) + "\n" ;
 		_repr += "* Unfeasible: " + ( is_unfeasible() ? True : False ) + "\n" ;
@@ -188,11 +217,15 @@ struct QuantileRegression
 	// Accessors //
 	//===========//
 	
-	void set_fit_params( size_type maxit , value_type tol , value_type beta ) //{{{
+	void set_fit_params( size_type maxit , value_type tol , value_type beta , bool warm_start , bool cholesky , int n_threads , bool preprocessing ) //{{{
 	{
-		m_frishNewton.m_maxit = maxit ;
-		m_frishNewton.m_tol   = tol ;
-		m_frishNewton.m_beta  = beta ;
+		m_frishNewton.m_maxit    = maxit ;
+		m_frishNewton.m_tol      = tol ;
+		m_frishNewton.m_beta     = beta ;
+		m_frishNewton.m_cholesky = cholesky ;
+		m_warm_start             = warm_start ;
+		m_preprocessing          = preprocessing ;
+		m_n_threads              = n_threads ;
 	}
 	//}}}
 	
@@ -215,9 +248,24 @@ struct QuantileRegression
 		m_ltau = ltau ;
 	} //}}}
 	
-	Matrix coef() //{{{
+	FArray coef() //{{{
 	{ return m_coef ; } //}}}
 	
+	void set_coef( py::object coef ) //{{{
+	{
+		FArray c = FArray::ensure(coef) ;
+		if( !c )
+			throw std::invalid_argument( "SDFC.NonParametric.QuantileRegression: coef_ must be an array of float" ) ;
+		m_coef = c ;
+	} //}}}
+	
+	py::object quantiles() //{{{
+	{
+		if( m_quantiles.is_none() )
+			throw std::runtime_error( "SDFC.NonParametric.QuantileRegression: the quantiles are not computed, fit with quantiles = True" ) ;
+		return m_quantiles ;
+	} //}}}
+	
 	qrstate_t state() //{{{
 	{ return m_state ; } //}}}
 	
@@ -240,43 +288,309 @@ struct QuantileRegression
 	// Methods //
 	//=========//
 	
-	void fit( Vector& Y , Matrix& X ) //{{{
+	void fit( py::array_t<value_type> Y , py::object X , bool quantiles ) //{{{
+	{
+		// The numpy arrays are read in place, in C or Fortran order (they are copied only if they are not of type
+		// double, or have no unit stride along the rows or the columns). X can also be a scipy.sparse matrix, in CSC
+		// or CSR format (other formats are converted to CSC). The coefficients and the quantiles are written in new
+		// numpy arrays, so coef_ and quantiles are views, not copies. The GIL is released during the fit.
+		if( Y.ndim() > 2 || ( Y.ndim() == 2 && Y.shape(1) != 1 ) )
+			throw std::invalid_argument( "SDFC.NonParametric.QuantileRegression: Y must be a vector and X a matrix" ) ;
+		py::ssize_t n     = Y.size() ;
+		py::list buffers ;
+		Design Xm         = design( X , n , buffers ) ;
+		py::ssize_t n_cov = Xm.cols ;
+		if( Y.ndim() > 0 && !positive_strides(Y) )
+			Y = FArray::ensure(Y) ;
+		YMap Ym( Y.data() , n , Eigen::InnerStride<>( ( Y.ndim() > 0 ) ? Y.strides(0) / value_size : 1 ) ) ;
+		
+		py::ssize_t n_tau = m_ltau.size() ;
+		m_coef      = FArray( std::vector<py::ssize_t>({n_tau,n_cov+1}) ) ;
+		m_quantiles = py::none() ;
+		FArray Yq   = FArray( std::vector<py::ssize_t>({quantiles ? n : 0,n_tau}) ) ;
+		MMap coef( m_coef.mutable_data() , n_tau , n_cov + 1 , Stride( n_tau , 1 ) ) ;
+		MMap Q( Yq.mutable_data() , quantiles ? n : 0 , n_tau , Stride( quantiles ? n : 0 , 1 ) ) ;
+		coef.setConstant( std::numeric_limits<value_type>::quiet_NaN() ) ;
+		{
+			py::gil_scoped_release release ;
+			solve( Ym , Xm , coef ) ;
+			if( quantiles )
+			{
+				auto predict = [&]( const auto& X ) { Q.noalias() = X * coef.rightCols(n_cov).transpose() ; } ;
+				if( Xm.sparse )
+					Xm.apply_sparse( predict ) ;
+				else
+					Xm.apply( predict ) ;
+				Q.rowwise() += coef.col(0).transpose() ;
+			}
+		}
+		if( quantiles )
+			m_quantiles = Yq ;
+	} //}}}
+	
+	void fit_many( py::array_t<value_type> Y , py::object X ) //{{{
+	{
+		// Fit of each column of Y (n_samples x n_series) with the same covariates X. The design, and the inverse of
+		// A^T A for the starting points, are computed once, and the series are split between the threads. Y and X are
+		// read in place as in fit. coef_ is of shape (n_series,n_tau,n_features+1), the quantiles are not computed,
+		// and n_iter is the sum over the series of the numbers of iterations.
+		if( Y.ndim() != 2 )
+			throw std::invalid_argument( "SDFC.NonParametric.QuantileRegression: Y must be a matrix (n_samples,n_series)" ) ;
+		py::ssize_t n        = Y.shape(0) ;
+		py::ssize_t n_series = Y.shape(1) ;
+		py::list buffers ;
+		Design Xm            = design( X , n , buffers ) ;
+		if( !positive_strides(Y) )
+			Y = FArray::ensure(Y) ;
+		
+		py::ssize_t n_tau = m_ltau.size() ;
+		m_coef      = FArray( std::vector<py::ssize_t>({n_series,n_tau,Xm.cols+1}) ) ;
+		m_quantiles = py::none() ;
+		std::fill( m_coef.mutable_data() , m_coef.mutable_data() + m_coef.size() , std::numeric_limits<value_type>::quiet_NaN() ) ;
+		{
+			py::gil_scoped_release release ;
+			solve_many( Y.data() , n , n_series , Y.strides(0) / value_size , Y.strides(1) / value_size , Xm , m_coef.mutable_data() ) ;
+		}
+	} //}}}
+	
+	void solve( const YMap& Y , const Design& X , MMap& coef ) //{{{
 	{
 		size_type n_tau = m_ltau.size() ;
-		size_type n_cov = X.cols() + 1 ;
-		m_coef.resize( n_tau , n_cov ) ;
-		for( size_type i = 0 ; i < n_tau ; ++i )
+		m_nit.setZero( n_tau ) ;
+		std::vector<size_type> order = sorted_tau() ;
+		
+		// With several threads, the sorted tau are split in contiguous blocks, each fitted by a thread with its own
+		// FrishNewton workspace
+		size_type n_threads = std::max<size_type>( 1 , std::min( threads() , n_tau ) ) ;
+		if( n_threads == 1 )
 		{
-			m_frishNewton.set_tau( m_ltau[i] ) ;
-			m_frishNewton.fit( Y , X ) ;
-			m_state = m_frishNewton.state() ;
-			if( m_state == unfeasible )
-				break ;
-			m_coef.row(i) = m_frishNewton.m_coef ;
+			if( !m_preprocessing )
+				m_frishNewton.set_design( X ) ;
+			m_state = fit_block( m_frishNewton , Y , X , coef , m_nit , order , 0 , n_tau ) ;
+			return ;
+		}
+		
+		std::vector<FrishNewton> workspaces = workspaces_design( X , n_threads ) ;
+		std::vector<qrstate_t>   states( n_threads , not_fitted ) ;
+		std::vector<std::thread> pool ;
+		for( size_type t = 0 ; t < n_threads ; ++t )
+		{
+			size_type a = ( t * n_tau ) / n_threads ;
+			size_type b = ( ( t + 1 ) * n_tau ) / n_threads ;
+			pool.emplace_back( [&,t,a,b]() { states[t] = fit_block( workspaces[t] , Y , X , coef , m_nit , order , a , b ) ; } ) ;
 		}
-		m_quantiles = predict() ;
+		for( auto& thread : pool )
+			thread.join() ;
+		m_state = success ;
+		for( auto state : states )
+			if( state == unfeasible )
+				m_state = unfeasible ;
 	} //}}}
 	
-	Matrix predict() //{{{
+	void solve_many( const value_type* Y , py::ssize_t n , py::ssize_t n_series , py::ssize_t row_stride , py::ssize_t col_stride , const Design& X , value_type* coef ) //{{{
 	{
+		// The series s, s + n_threads, s + 2 * n_threads, ... are fitted by the thread s, all the tau of a series are
+		// fitted by the same thread (with warm start). The coefficients of the series s are coef[s,:,:], of a Fortran
+		// ordered array.
 		size_type n_tau = m_ltau.size() ;
-		Matrix& A(m_frishNewton.m_A) ;
-		Matrix Yq( A.rows() , n_tau ) ;
-		Yq = A * m_coef.transpose() ;
-		return Yq ;
+		size_type p     = X.cols + 1 ;
+		m_nit.setZero( n_tau ) ;
+		std::vector<size_type> order = sorted_tau() ;
+		
+		size_type n_threads = static_cast<size_type>( std::max<py::ssize_t>( 1 , std::min<py::ssize_t>( threads() , n_series ) ) ) ;
+		std::vector<FrishNewton> workspaces = workspaces_design( X , n_threads ) ;
+		std::vector<qrstate_t>   states( n_threads , success ) ;
+		std::vector<IArray>      nits( n_threads , IArray::Zero(n_tau) ) ;
+		auto fit_series = [&]( size_type t ) {
+			IArray nit(n_tau) ;
+			for( py::ssize_t s = t ; s < n_series ; s += n_threads )
+			{
+				YMap Ys( Y + s * col_stride , n , Eigen::InnerStride<>(row_stride) ) ;
+				MMap coef_s( coef + s , n_tau , p , Stride( n_series * n_tau , n_series ) ) ;
+				nit.setZero() ;
+				if( fit_block( workspaces[t] , Ys , X , coef_s , nit , order , 0 , n_tau ) == unfeasible )
+					states[t] = unfeasible ;
+				nits[t] += nit ;
+			}
+		} ;
+		
+		if( n_threads == 1 )
+		{
+			fit_series(0) ;
+		}
+		else
+		{
+			std::vector<std::thread> pool ;
+			for( size_type t = 0 ; t < n_threads ; ++t )
+				pool.emplace_back( fit_series , t ) ;
+			for( auto& thread : pool )
+				thread.join() ;
+		}
+		m_state = success ;
+		for( size_type t = 0 ; t < n_threads ; ++t )
+		{
+			m_nit += nits[t] ;
+			if( states[t] == unfeasible )
+				m_state = unfeasible ;
+		}
 	} //}}}
 	
+	qrstate_t fit_block( FrishNewton& frishNewton , const YMap& Y , const Design& X , MMap& coef , IArray& nit , const std::vector<size_type>& order , size_type a , size_type b ) //{{{
+	{
+		// Fit the tau order[a] to order[b-1], each one started from the previous one if warm start. The design X must
+		// be set in frishNewton. With the preprocessing, each tau is fitted on its own reduced problem, so neither the
+		// design nor the warm start are used.
+		qrstate_t state = not_fitted ;
+		PortnoyKoenker portnoyKoenker ;
+		for( size_type k = a ; k < b ; ++k )
+		{
+			size_type i = order[k] ;
+			if( m_preprocessing )
+			{
+				state  = portnoyKoenker.fit( frishNewton , Y , X , m_ltau[i] , i ) ;
+				nit[i] = portnoyKoenker.n_iter() ;
+				if( state == unfeasible )
+					break ;
+				coef.row(i) = portnoyKoenker.coef() ;
+				continue ;
+			}
+			if( k == a || !m_warm_start )
+			{
+				frishNewton.set_tau( m_ltau[i] ) ;
+				frishNewton.fit( Y ) ;
+			}
+			else
+			{
+				frishNewton.fit_next( m_ltau[i] ) ;
+			}
+			state  = frishNewton.state() ;
+			nit[i] = frishNewton.n_iter() ;
+			if( state == unfeasible )
+				break ;
+			coef.row(i) = frishNewton.coef() ;
+		}
+		return state ;
+	} //}}}
+	
+	std::vector<size_type> sorted_tau() //{{{
+	{
+		// Indexes of the tau by increasing order. With warm start, the starting point is built once, and each tau
+		// starts from the solution of the previous one.
+		std::vector<size_type> order( m_ltau.size() ) ;
+		std::iota( order.begin() , order.end() , 0 ) ;
+		std::sort( order.begin() , order.end() , [this]( size_type i , size_type j ) { return m_ltau[i] < m_ltau[j] ; } ) ;
+		return order ;
+	} //}}}
+	
+	std::vector<FrishNewton> workspaces_design( const Design& X , size_type n_threads ) //{{{
+	{
+		// n_threads copies of a workspace where the design X is set (not needed with the preprocessing)
+		FrishNewton frishNewton = workspace() ;
+		if( !m_preprocessing )
+			frishNewton.set_design( X ) ;
+		std::vector<FrishNewton> workspaces( n_threads - 1 , frishNewton ) ;
+		workspaces.push_back( std::move(frishNewton) ) ;
+		return workspaces ;
+	} //}}}
+	
+	Design design( py::object X , py::ssize_t n , py::list& buffers ) //{{{
+	{
+		// View on X. The arrays read by the view are appended to buffers, which must be kept by the caller during the
+		// fit.
+		if( py::hasattr( X , "tocsc" ) )
+			return sparse_design( X , n , buffers ) ;
+		
+		// Dense X, in its storage order. X is replaced by a Fortran ordered copy if it has no unit stride along the
+		// rows or the columns
+		py::array_t<value_type> Xa = X.cast<py::array_t<value_type>>() ;
+		if( Xa.ndim() > 2 )
+			throw std::invalid_argument( "SDFC.NonParametric.QuantileRegression: Y must be a vector and X a matrix" ) ;
+		if( Xa.ndim() == 0 || Xa.shape(0) != n )
+			throw std::invalid_argument( "SDFC.NonParametric.QuantileRegression: X and Y must have the same number of samples" ) ;
+		py::ssize_t n_cov = ( Xa.ndim() == 2 ) ? Xa.shape(1) : 1 ;
+		py::ssize_t srow  = Xa.strides(0) ;
+		py::ssize_t scol  = ( Xa.ndim() == 2 ) ? Xa.strides(1) : value_size ;
+		bool row_major    = ( n_cov == 1 || scol == value_size ) && srow > 0 && srow % value_size == 0 ;
+		bool col_major    = ( n == 1 || srow == value_size ) && scol > 0 && scol % value_size == 0 ;
+		if( !row_major && !col_major )
+		{
+			Xa   = FArray::ensure(Xa) ;
+			srow = value_size ;
+			scol = ( Xa.ndim() == 2 ) ? Xa.strides(1) : value_size * n ;
+		}
+		buffers.append( Xa ) ;
+		return Design( Xa.data() , n , n_cov , ( row_major ? srow : scol ) / value_size , row_major ) ;
+	} //}}}
+	
+	Design sparse_design( py::object X , py::ssize_t n , py::list& buffers ) //{{{
+	{
+		// scipy.sparse X, read in place in CSR or CSC format. Other formats are converted to CSC, and the indexes
+		// are sorted and the duplicates summed if needed (on a copy).
+		typedef py::array_t<value_type,py::array::c_style | py::array::forcecast> ValueArray ;
+		typedef py::array_t<int,py::array::c_style | py::array::forcecast>        IndexArray ;
+		std::string format = X.attr("format").cast<std::string>() ;
+		if( format != "csr" && format != "csc" )
+		{
+			X      = X.attr("tocsc")() ;
+			format = "csc" ;
+		}
+		if( !X.attr("has_canonical_format").cast<bool>() )
+		{
+			X = X.attr("copy")() ;
+			X.attr("sum_duplicates")() ;
+		}
+		py::tuple shape = X.attr("shape") ;
+		if( shape[0].cast<py::ssize_t>() != n )
+			throw std::invalid_argument( "SDFC.NonParametric.QuantileRegression: X and Y must have the same number of samples" ) ;
+		
+		ValueArray values = X.attr("data").cast<ValueArray>() ;
+		IndexArray outer  = X.attr("indptr").cast<IndexArray>() ;
+		IndexArray inner  = X.attr("indices").cast<IndexArray>() ;
+		buffers.append( X ) ;
+		buffers.append( values ) ;
+		buffers.append( outer ) ;
+		buffers.append( inner ) ;
+		return Design( values.data() , outer.data() , inner.data() , n , shape[1].cast<py::ssize_t>() , values.size() , format == "csr" ) ;
+	} //}}}
+	
+	static bool positive_strides( const py::array_t<value_type>& Y ) //{{{
+	{
+		for( py::ssize_t d = 0 ; d < Y.ndim() ; ++d )
+			if( Y.strides(d) <= 0 || Y.strides(d) % value_size != 0 )
+				return false ;
+		return true ;
+	} //}}}
+	
+	FrishNewton workspace() //{{{
+	{
+		// A new FrishNewton, without data, with the parameters of m_frishNewton
+		FrishNewton frishNewton( 0.5 , m_frishNewton.m_maxit , m_frishNewton.m_tol , m_frishNewton.m_beta ) ;
+		frishNewton.m_cholesky = m_frishNewton.m_cholesky ;
+		return frishNewton ;
+	} //}}}
+	
+	size_type threads() //{{{
+	{
+		// Numbers of threads, all the cores if m_n_threads < 1
+		if( m_n_threads > 0 )
+			return m_n_threads ;
+		return std::max<size_type>( 1 , std::thread::hardware_concurrency() ) ;
+	} //}}}
 	
 	//===========//
 	// Arguments //
 	//===========//
 	
 	//{{{
-	Array       m_ltau        ;
-	Matrix      m_coef        ;
-	Matrix      m_quantiles   ;
-	FrishNewton m_frishNewton ;
-	qrstate_t   m_state       ;
+	Array       m_ltau          ;
+	FArray      m_coef          ;
+	py::object  m_quantiles     ;
+	FrishNewton m_frishNewton   ;
+	IArray      m_nit           ;
+	bool        m_warm_start    ;
+	bool        m_preprocessing ;
+	int         m_n_threads     ;
+	qrstate_t   m_state         ;
 	//}}}
 	
 	
@@ -86,6 +86,7 @@
 ## Libraries ##
 ###############
 
+import copy
 import numpy as np
 from SDFC.tools.__Link import IdLink
 
@@ -113,9 +114,24 @@ class AbstractParam:##{{{
 	def gradient( self ):
 		return self.link.gradient(self.fit_)
 	
+	def hessian( self ):
+		return self.link.hessian(self.fit_)
+	
 	def set_coef( self , coef ):
 		pass
 	
+	def restrict( self , idx ):
+		"""
+		Copy of the param restricted to the observations idx (boolean mask)
+		"""
+		out = copy.copy(self)
+		out.n_samples = int(np.sum(idx))
+		out.coef_     = None if self.coef_ is None else self.coef_.copy()
+		out.fit_      = None if self.fit_  is None else self.fit_.reshape(self.n_samples,-1)[idx,:]
+		if getattr( self , "design_" , None ) is not None:
+			out.design_ = self.design_[idx,:]
+		return out
+	
 ##}}}
 
 class CovariateParam(AbstractParam):##{{{
@@ -273,6 +289,17 @@ class LawParams:##{{{
 		self.merge_coef()
 	##}}}
 	
+	def restrict( self , idx ):##{{{
+		"""
+		Copy of the params restricted to the observations idx (boolean mask), the coefficients are copied
+		"""
+		out = LawParams( kinds = self.kinds )
+		for k in self._dparams:
+			out._dparams[k] = self._dparams[k].restrict(idx)
+		out.merge_coef()
+		return out
+	##}}}
+	
 	def infer_configuration( self , **kwargs ):##{{{
 		has_c = False
 		has_s = False
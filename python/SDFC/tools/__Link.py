@@ -122,6 +122,12 @@ class AbstractLink:##{{{
 		"""
 		pass
 	
+	def hessian( self , x ):
+		"""
+		Second derivative of link function
+		"""
+		pass
+	
 	def inverse( self , x ):
 		"""
 		Inverse of link function
@@ -153,6 +159,9 @@ class ChainLink(AbstractLink): ##{{{
 	def gradient( self , x ):
 		return self.link0.gradient(x) * self.link1.gradient( self.link0(x) )
 	
+	def hessian( self , x ):
+		return self.link0.hessian(x) * self.link1.gradient( self.link0(x) ) + self.link0.gradient(x)**2 * self.link1.hessian( self.link0(x) )
+	
 	def inverse( self , x ):
 		return self.link0.inverse( self.link1.inverse( x ) )
 ##}}}
@@ -181,6 +190,9 @@ class IdLink(AbstractLink): ##{{{
 	def gradient( self , x ):
 		return np.ones( x.shape )
 	
+	def hessian( self , x ):
+		return np.zeros( x.shape )
+	
 	def inverse( self , x ):
 		return x
 ##}}}
@@ -194,6 +206,7 @@ class InverseLink(AbstractLink): ##{{{
 		f(x) = 1/x
 		f^{-1}(x) = 1/x
 		df(x) = - 1 / x**2
+		d2f(x) = 2 / x**3
 	
 	"""
 	def __init__(self):
@@ -211,6 +224,9 @@ class InverseLink(AbstractLink): ##{{{
 	def gradient( self , x ):
 		return - 1. / x**2
 	
+	def hessian( self , x ):
+		return 2. / x**3
+	
 	def inverse( self , x ):
 		return 1. / x
 ##}}}
@@ -224,6 +240,7 @@ class ExpLink(AbstractLink):##{{{
 		f(x) = exp(s*x) + b
 		f^{-1}(x) = log(x-b) / s
 		df(x) = s*exp(s*x)
+		d2f(x) = s**2*exp(s*x)
 	This function is used to bound a variable into level b, by upper if s > 0 or lower if s < 0.
 	"""
 	def __init__( self , b = 0 , s = 1 ):
@@ -242,6 +259,9 @@ class ExpLink(AbstractLink):##{{{
 	def gradient( self , x ):
 		return self.s * np.exp(self.s * x)
 	
+	def hessian( self , x ):
+		return self.s**2 * np.exp(self.s * x)
+	
 	def inverse( self , x ):
 		return np.log(x - self.b) / self.s
 ##}}}
@@ -278,6 +298,10 @@ class LogitLink(AbstractLink):##{{{
 		e = np.exp( - self.s * x )
 		return self.s * (self.b - self.a) * e / ( 1 + e )**2
 	
+	def hessian( self , x ):
+		e = np.exp( - self.s * x )
+		return self.s**2 * (self.b - self.a) * e * ( e - 1 ) / ( 1 + e )**3
+	
 	def inverse( self , x ):
 		x = np.array( [x] ).ravel()
 		idx_lo = x < self.a
@@ -326,6 +350,9 @@ class SemiBoundedLink(AbstractLink):##{{{
 	def gradient( self , x ):
 		return np.where( x < self.b , self.s , 0. )
 	
+	def hessian( self , x ):
+		return np.zeros( np.shape(x) )
+	
 	def inverse( self , x ):
 		return self.__call__(x)
 ##}}}
@@ -363,6 +390,9 @@ class BoundedLink(AbstractLink):##{{{
 	def gradient( self , x ):
 		return np.where( (self.a < x) &  (x < self.b) , 1. , 0. )
 	
+	def hessian( self , x ):
+		return np.zeros( np.shape(x) )
+	
 	def inverse( self , x ):
 		return self.__call__(x)
 ##}}}
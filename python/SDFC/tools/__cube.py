@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## This software is a computer program that is part of the SDFC (Statistical    ##
+## Distribution Fit with Covariates) library. This library makes it possible    ##
+## to regress the parameters of some statistical law with co-variates.          ##
+##                                                                              ##
+## This software is governed by the CeCILL-C license under French law and       ##
+## abiding by the rules of distribution of free software.  You can  use,        ##
+## modify and/ or redistribute the software under the terms of the CeCILL-C     ##
+## license as circulated by CEA, CNRS and INRIA at the following URL            ##
+## "http://www.cecill.info".                                                    ##
+##                                                                              ##
+## As a counterpart to the access to the source code and  rights to copy,       ##
+## modify and redistribute granted by the license, users are provided only      ##
+## with a limited warranty  and the software's author,  the holder of the       ##
+## economic rights,  and the successive licensors  have only  limited           ##
+## liability.                                                                   ##
+##                                                                              ##
+## In this respect, the user's attention is drawn to the risks associated       ##
+## with loading,  using,  modifying and/or developing or reproducing the        ##
+## software by the user in light of its specific status of free software,       ##
+## that may mean  that it is complicated to manipulate,  and  that  also        ##
+## therefore means  that it is reserved for developers  and  experienced        ##
+## professionals having in-depth computer knowledge. Users are therefore        ##
+## encouraged to load and test the software's suitability as regards their      ##
+## requirements in conditions enabling the security of their systems and/or     ##
+## data to be ensured and,  more generally, to use and operate it in the        ##
+## same conditions as regards security.                                         ##
+##                                                                              ##
+## The fact that you are presently reading this means that you have had         ##
+## knowledge of the CeCILL-C license and that you accept its terms.             ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## Ce logiciel est un programme informatique faisant partie de la librairie     ##
+## SDFC (Statistical Distribution Fit with Covariates). Cette librairie         ##
+## permet de calculer de regresser les parametres de lois statistiques selon    ##
+## plusieurs co-variables                                                       ##
+##                                                                              ##
+## Ce logiciel est régi par la licence CeCILL-C soumise au droit français et    ##
+## respectant les principes de diffusion des logiciels libres. Vous pouvez      ##
+## utiliser, modifier et/ou redistribuer ce programme sous les conditions       ##
+## de la licence CeCILL-C telle que diffusée par le CEA, le CNRS et l'INRIA     ##
+## sur le site "http://www.cecill.info".                                        ##
+##                                                                              ##
+## En contrepartie de l'accessibilité au code source et des droits de copie,    ##
+## de modification et de redistribution accordés par cette licence, il n'est    ##
+## offert aux utilisateurs qu'une garantie limitée.  Pour les mêmes raisons,    ##
+## seule une responsabilité restreinte pèse sur l'auteur du programme, le       ##
+## titulaire des droits patrimoniaux et les concédants successifs.              ##
+##                                                                              ##
+## A cet égard  l'attention de l'utilisateur est attirée sur les risques        ##
+## associés au chargement,  à l'utilisation,  à la modification et/ou au        ##
+## développement et à la reproduction du logiciel par l'utilisateur étant       ##
+## donné sa spécificité de logiciel libre, qui peut le rendre complexe à        ##
+## manipuler et qui le réserve donc à des développeurs et des professionnels    ##
+## avertis possédant  des  connaissances  informatiques approfondies.  Les      ##
+## utilisateurs sont donc invités à charger  et  tester  l'adéquation  du       ##
+## logiciel à leurs besoins dans des conditions permettant d'assurer la         ##
+## sécurité de leurs systèmes et ou de leurs données et, plus généralement,     ##
+## à l'utiliser et l'exploiter dans les mêmes conditions de sécurité.           ##
+##                                                                              ##
+## Le fait que vous puissiez accéder à cet en-tête signifie que vous avez       ##
+## pris connaissance de la licence CeCILL-C, et que vous en avez accepté les    ##
+## termes.                                                                      ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+###############
+## Libraries ##
+###############
+
+import os
+import contextlib
+import numpy as np
+
+from SDFC.tools.__LawParams import LawParams
+from SDFC.tools.__grid      import _fit_series
+from SDFC.tools.__grid      import _fit_chunk
+from SDFC.tools.__grid      import _shared_executor
+from SDFC.tools.__grid      import _split_kwargs
+
+
+###############
+## Functions ##
+###############
+
+def _open_output( path , shape , dtype , fill ):##{{{
+	"""
+	Open the memory-mapped .npy file path if it exists (resume), otherwise create it, filled with fill
+	"""
+	if os.path.exists(path):
+		X = np.lib.format.open_memmap( path , mode = "r+" )
+		if X.shape != tuple(shape) or X.dtype != np.dtype(dtype):
+			raise ValueError( "SDFC: the output {} exists, but does not match the fit".format(path) )
+		return X
+	X = np.lib.format.open_memmap( path , mode = "w+" , dtype = dtype , shape = tuple(shape) )
+	X[...] = fill
+	X.flush()
+	return X
+##}}}
+
+def fit_cube( law_class , Y , output , tile_size = 1024 , n_jobs = 1 , blas_threads = 1 , law_kwargs = None , **kwargs ):##{{{
+	"""
+	SDFC.tools.fit_cube
+	===================
+	
+	Fit a law on each series of a cube (time x space) too large for the memory, e.g. a np.memmap or a .npy file. The
+	spatial points are cut in tiles, read sequentially, and the series of each tile are fitted (with a pool of n_jobs
+	processes if n_jobs > 1, see SDFC.tools.fit_grid). The results are written in memory-mapped .npy files of the
+	directory output:
+	- coef.npy   : shape = space + (n_coef,), coefficients fitted (nan if not fitted)
+	- ci.npy     : shape = space + (2,n_coef), confidence intervals, only if law_kwargs gives n_bootstrap > 0
+	- status.npy : shape = space, 0 = not fitted, 1 = fitted, 2 = fit failed, 3 = series with non finite values
+	- tiles.npy  : shape = (n_tiles,), True if the tile is fitted, this is the checkpoint.
+	Each tile is marked as fitted once its results are flushed to the disk, so if the job is interrupted, calling again
+	fit_cube with the same output resumes it, without refitting the tiles already done.
+	
+	Parameters
+	----------
+	law_class    : class
+		A law of SDFC, e.g. SDFC.GEV
+	Y            : np.array or str
+		Cube of data, the first axis is the time (the samples of each series), other axes are the space. If a str, the
+		path of a .npy file, opened as a memmap.
+	output       : str
+		Directory of the outputs, created if it does not exist
+	tile_size    : integer
+		Numbers of spatial points of each tile, default is 1024
+	n_jobs       : integer
+		Numbers of processes fitting each tile, default is 1 (sequential)
+	blas_threads : None or integer
+		Numbers of BLAS threads of each worker, default is 1
+	law_kwargs   : None or dict
+		Arguments given to the initialization of the law
+	**kwargs     :
+		Arguments of the fit (c_<param>, f_<param>, l_<param>, ...), common to all series
+	
+	Returns
+	-------
+	coef_               : np.memmap[ shape = space + (n_coef,) ]
+	confidence_interval : np.memmap[ shape = space + (2,n_coef) ] or None
+	status              : np.memmap[ shape = space ]
+	"""
+	law_kwargs = {} if law_kwargs is None else law_kwargs
+	if isinstance(Y,str):
+		Y = np.load( Y , mmap_mode = "r" )
+	n_samples = Y.shape[0]
+	space     = Y.shape[1:]
+	Y         = Y.reshape(n_samples,-1)
+	n_series  = Y.shape[1]
+	n_tiles   = int(np.ceil( n_series / tile_size ))
+	n_jobs    = os.cpu_count() if n_jobs == -1 else max( n_jobs , 1 )
+	
+	## Numbers of coefficients, from the params of the law
+	params = LawParams( kinds = law_class( **law_kwargs ).kinds_params )
+	params.add_params( n_samples = n_samples , resample = None , **kwargs )
+	n_coef = sum( p.n_features for p in params._dparams.values() if not p.is_fix() )
+	
+	## Outputs
+	os.makedirs( output , exist_ok = True )
+	bootstrap = law_kwargs.get("n_bootstrap") is not None and law_kwargs.get("n_bootstrap") > 0
+	coef      = _open_output( os.path.join( output , "coef.npy" ) , space + (n_coef,) , np.float64 , np.nan )
+	ci        = _open_output( os.path.join( output , "ci.npy" ) , space + (2,n_coef) , np.float64 , np.nan ) if bootstrap else None
+	status    = _open_output( os.path.join( output , "status.npy" ) , space , np.int8 , 0 )
+	done      = _open_output( os.path.join( output , "tiles.npy" ) , (n_tiles,) , np.bool_ , False )
+	f_coef    = coef.reshape(n_series,n_coef)
+	f_ci      = None if ci is None else ci.reshape(n_series,2,n_coef)
+	f_status  = status.reshape(n_series)
+	
+	arrays,static_kwargs = _split_kwargs(kwargs)
+	with ( _shared_executor( arrays , n_jobs , blas_threads ) if n_jobs > 1 else contextlib.nullcontext() ) as executor:
+		for t in range(n_tiles):
+			if done[t]:
+				continue
+			a,b = t * tile_size,min( (t + 1) * tile_size , n_series )
+			
+			## Read the tile, series with non finite values are not fitted
+			tile = np.array( Y[:,a:b] , dtype = float )
+			cols = np.flatnonzero( np.all( np.isfinite(tile) , axis = 0 ) )
+			tile = tile[:,cols]
+			
+			## Fit
+			if executor is None:
+				coefs,cis = _fit_series( law_class , law_kwargs , tile , kwargs , range(cols.size) )
+			else:
+				size   = max( 1 , int(np.ceil( cols.size / ( 4 * n_jobs ) )) )
+				bounds = list(range(0,cols.size,size)) + [cols.size]
+				tasks  = [ (law_class,law_kwargs,static_kwargs,range(e-s),tile[:,s:e]) for s,e in zip(bounds[:-1],bounds[1:]) ]
+				coefs,cis = [],[]
+				for c,ci_ in executor.map( _fit_chunk , *zip(*tasks) ):
+					coefs.extend(c)
+					cis.extend(ci_)
+			
+			## Write the tile, and then the checkpoint
+			f_status[a:b] = 3
+			for i,c in zip(cols + a,coefs):
+				f_status[i] = 2 if c is None or c.size != n_coef else 1
+				if f_status[i] == 1:
+					f_coef[i,:] = c
+			if f_ci is not None:
+				for i,c in zip(cols + a,cis):
+					if c is not None:
+						f_ci[i,:,:] = c
+			for X in [coef,ci,status]:
+				if X is not None:
+					X.flush()
+			done[t] = True
+			done.flush()
+	
+	return coef,ci,status
+##}}}
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## This software is a computer program that is part of the SDFC (Statistical    ##
+## Distribution Fit with Covariates) library. This library makes it possible    ##
+## to regress the parameters of some statistical law with co-variates.          ##
+##                                                                              ##
+## This software is governed by the CeCILL-C license under French law and       ##
+## abiding by the rules of distribution of free software.  You can  use,        ##
+## modify and/ or redistribute the software under the terms of the CeCILL-C     ##
+## license as circulated by CEA, CNRS and INRIA at the following URL            ##
+## "http://www.cecill.info".                                                    ##
+##                                                                              ##
+## As a counterpart to the access to the source code and  rights to copy,       ##
+## modify and redistribute granted by the license, users are provided only      ##
+## with a limited warranty  and the software's author,  the holder of the       ##
+## economic rights,  and the successive licensors  have only  limited           ##
+## liability.                                                                   ##
+##                                                                              ##
+## In this respect, the user's attention is drawn to the risks associated       ##
+## with loading,  using,  modifying and/or developing or reproducing the        ##
+## software by the user in light of its specific status of free software,       ##
+## that may mean  that it is complicated to manipulate,  and  that  also        ##
+## therefore means  that it is reserved for developers  and  experienced        ##
+## professionals having in-depth computer knowledge. Users are therefore        ##
+## encouraged to load and test the software's suitability as regards their      ##
+## requirements in conditions enabling the security of their systems and/or     ##
+## data to be ensured and,  more generally, to use and operate it in the        ##
+## same conditions as regards security.                                         ##
+##                                                                              ##
+## The fact that you are presently reading this means that you have had         ##
+## knowledge of the CeCILL-C license and that you accept its terms.             ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## Ce logiciel est un programme informatique faisant partie de la librairie     ##
+## SDFC (Statistical Distribution Fit with Covariates). Cette librairie         ##
+## permet de calculer de regresser les parametres de lois statistiques selon    ##
+## plusieurs co-variables                                                       ##
+##                                                                              ##
+## Ce logiciel est régi par la licence CeCILL-C soumise au droit français et    ##
+## respectant les principes de diffusion des logiciels libres. Vous pouvez      ##
+## utiliser, modifier et/ou redistribuer ce programme sous les conditions       ##
+## de la licence CeCILL-C telle que diffusée par le CEA, le CNRS et l'INRIA     ##
+## sur le site "http://www.cecill.info".                                        ##
+##                                                                              ##
+## En contrepartie de l'accessibilité au code source et des droits de copie,    ##
+## de modification et de redistribution accordés par cette licence, il n'est    ##
+## offert aux utilisateurs qu'une garantie limitée.  Pour les mêmes raisons,    ##
+## seule une responsabilité restreinte pèse sur l'auteur du programme, le       ##
+## titulaire des droits patrimoniaux et les concédants successifs.              ##
+##                                                                              ##
+## A cet égard  l'attention de l'utilisateur est attirée sur les risques        ##
+## associés au chargement,  à l'utilisation,  à la modification et/ou au        ##
+## développement et à la reproduction du logiciel par l'utilisateur étant       ##
+## donné sa spécificité de logiciel libre, qui peut le rendre complexe à        ##
+## manipuler et qui le réserve donc à des développeurs et des professionnels    ##
+## avertis possédant  des  connaissances  informatiques approfondies.  Les      ##
+## utilisateurs sont donc invités à charger  et  tester  l'adéquation  du       ##
+## logiciel à leurs besoins dans des conditions permettant d'assurer la         ##
+## sécurité de leurs systèmes et ou de leurs données et, plus généralement,     ##
+## à l'utiliser et l'exploiter dans les mêmes conditions de sécurité.           ##
+##                                                                              ##
+## Le fait que vous puissiez accéder à cet en-tête signifie que vous avez       ##
+## pris connaissance de la licence CeCILL-C, et que vous en avez accepté les    ##
+## termes.                                                                      ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+###############
+## Libraries ##
+###############
+
+import os
+import contextlib
+import multiprocessing        as mp
+import concurrent.futures     as cf
+from multiprocessing          import shared_memory
+import numpy as np
+
+try:
+	import threadpoolctl
+except ImportError:
+	threadpoolctl = None
+
+
+###############
+## Functions ##
+###############
+
+## Environment variables read by the BLAS libraries at their initialization
+_BLAS_THREADS_VARIABLES = [ "OMP_NUM_THREADS" , "OPENBLAS_NUM_THREADS" , "MKL_NUM_THREADS" , "BLIS_NUM_THREADS" , "VECLIB_MAXIMUM_THREADS" , "NUMEXPR_NUM_THREADS" ]
+
+## Arrays attached by each worker
+_worker_arrays = {}
+_worker_shm    = []
+
+def _to_shared( X ):##{{{
+	"""
+	Copy the array X in a new shared memory block, return the block and its description (name,shape,dtype)
+	"""
+	X   = np.ascontiguousarray(X)
+	shm = shared_memory.SharedMemory( create = True , size = max( X.nbytes , 1 ) )
+	np.ndarray( X.shape , dtype = X.dtype , buffer = shm.buf )[...] = X
+	return shm,(shm.name,X.shape,X.dtype.str)
+##}}}
+
+def _init_worker( descriptions , blas_threads ):##{{{
+	"""
+	Initializer of the workers: cap the BLAS threads, and attach the arrays in shared memory
+	"""
+	if threadpoolctl is not None and blas_threads is not None:
+		threadpoolctl.threadpool_limits( limits = blas_threads )
+	for key in descriptions:
+		name,shape,dtype = descriptions[key]
+		shm = shared_memory.SharedMemory( name = name )
+		_worker_shm.append(shm)
+		_worker_arrays[key] = np.ndarray( shape , dtype = np.dtype(dtype) , buffer = shm.buf )
+##}}}
+
+def _fit_series( law_class , law_kwargs , Y , kwargs , columns ):##{{{
+	"""
+	Fit law_class on the columns of Y, return the coef_ and the confidence intervals (nan if the fit fails)
+	"""
+	coefs,cis = [],[]
+	for s in columns:
+		law = law_class( **law_kwargs )
+		try:
+			law.fit( Y[:,s] , **kwargs )
+			coefs.append( np.array(law.coef_ , dtype = float).ravel() )
+			cis.append( None if law.confidence_interval is None else np.array(law.confidence_interval) )
+		except Exception:
+			coefs.append(None)
+			cis.append(None)
+	return coefs,cis
+##}}}
+
+def _fit_chunk( law_class , law_kwargs , static_kwargs , columns , Y = None ):##{{{
+	"""
+	Task of a worker, the arrays are read from the shared memory. If Y is given, its columns are fitted instead of the
+	columns of the Y in shared memory.
+	"""
+	kwargs = dict(static_kwargs)
+	for key in _worker_arrays:
+		if key != "Y":
+			kwargs[key] = _worker_arrays[key]
+	if Y is None:
+		Y = _worker_arrays["Y"]
+	return _fit_series( law_class , law_kwargs , Y , kwargs , columns )
+##}}}
+
+@contextlib.contextmanager
+def _shared_executor( arrays , n_jobs , blas_threads ):##{{{
+	"""
+	Context manager of a pool of n_jobs spawned workers, with the arrays (dict) in shared memory and the BLAS threads
+	capped to blas_threads. The shared memory and the environment are cleaned at the exit.
+	"""
+	l_shm,descriptions = [],{}
+	env = { k : os.environ.get(k) for k in _BLAS_THREADS_VARIABLES }
+	try:
+		for key in arrays:
+			shm,descriptions[key] = _to_shared(arrays[key])
+			l_shm.append(shm)
+		
+		## The workers are new processes (spawn), so they read the caps of the BLAS threads at their start
+		if blas_threads is not None:
+			for k in _BLAS_THREADS_VARIABLES:
+				os.environ[k] = str(blas_threads)
+		with cf.ProcessPoolExecutor( max_workers = n_jobs , mp_context = mp.get_context("spawn") , initializer = _init_worker , initargs = (descriptions,blas_threads) ) as executor:
+			yield executor
+	finally:
+		for k in env:
+			if env[k] is None:
+				os.environ.pop( k , None )
+			else:
+				os.environ[k] = env[k]
+		for shm in l_shm:
+			shm.close()
+			shm.unlink()
+##}}}
+
+def _split_kwargs( kwargs ):##{{{
+	"""
+	Split kwargs between the arrays (sent in shared memory) and the others (links, scalars, sent with the tasks)
+	"""
+	arrays = { k : kwargs[k] for k in kwargs if isinstance(kwargs[k],np.ndarray) }
+	static = { k : kwargs[k] for k in kwargs if k not in arrays }
+	return arrays,static
+##}}}
+
+def _stack( values ):##{{{
+	"""
+	Stack the list values, the None are replaced by nan with the shape of the first value not None
+	"""
+	ref = next( ( v for v in values if v is not None ) , None )
+	if ref is None:
+		return None
+	return np.array( [ np.zeros_like(ref) + np.nan if v is None else v for v in values ] )
+##}}}
+
+def fit_grid( law_class , Y , n_jobs = -1 , chunk_size = None , blas_threads = 1 , law_kwargs = None , **kwargs ):##{{{
+	"""
+	SDFC.tools.fit_grid
+	===================
+	
+	Fit a law independently on many series (e.g. the cells of a grid) sharing the same covariates, with a pool of
+	processes. Y and the array arguments (covariates and fixed values) are placed in shared memory, so they are not
+	sent with each task, and each worker fits chunks of series with the law class. The numbers of BLAS threads of each
+	worker is capped, so that the workers do not oversubscribe the cores.
+	
+	Parameters
+	----------
+	law_class    : class
+		A law of SDFC, e.g. SDFC.GEV
+	Y            : np.array[ shape = (n_samples,n_series) ]
+		Dataset, one series per column
+	n_jobs       : integer
+		Numbers of processes, default is -1 (all cpus). If 1, the series are fitted sequentially, without pool.
+	chunk_size   : None or integer
+		Numbers of series fitted by task, default is n_series / (4 * n_jobs)
+	blas_threads : None or integer
+		Numbers of BLAS threads of each worker, default is 1. If None, the threads are not capped.
+	law_kwargs   : None or dict
+		Arguments given to the initialization of the law, e.g. { "method" : "lmoments" , "n_bootstrap" : 100 }
+	**kwargs     :
+		Arguments of the fit (c_<param>, f_<param>, l_<param>, ...), common to all series
+	
+	Returns
+	-------
+	coef_               : np.array[ shape = (n_series,n_coef) ]
+		Coefficients fitted, nan if the fit of a series fails
+	confidence_interval : np.array[ shape = (n_series,2,n_coef) ] or None
+		Confidence intervals, None if the law has no bootstrap
+	"""
+	law_kwargs = {} if law_kwargs is None else law_kwargs
+	Y          = Y.reshape(Y.shape[0],-1)
+	n_series   = Y.shape[1]
+	n_jobs     = os.cpu_count() if n_jobs == -1 else max( n_jobs , 1 )
+	chunk_size = max( 1 , int(np.ceil( n_series / ( 4 * n_jobs ) )) ) if chunk_size is None else chunk_size
+	chunks     = [ range(a,min(a+chunk_size,n_series)) for a in range(0,n_series,chunk_size) ]
+	
+	if n_jobs == 1:
+		coefs,cis = _fit_series( law_class , law_kwargs , Y , kwargs , range(n_series) )
+		return _stack(coefs),_stack(cis)
+	
+	## Arrays in shared memory, other arguments (links, scalars) are sent with the tasks
+	arrays,static_kwargs = _split_kwargs(kwargs)
+	arrays["Y"] = Y
+	coefs,cis = [],[]
+	with _shared_executor( arrays , n_jobs , blas_threads ) as executor:
+		for c,ci in executor.map( _fit_chunk , *zip( *[ (law_class,law_kwargs,static_kwargs,chunk) for chunk in chunks ] ) ):
+			coefs.extend(c)
+			cis.extend(ci)
+	
+	return _stack(coefs),_stack(cis)
+##}}}
@@ -96,6 +96,11 @@ from SDFC.tools.__Link    import LogitLink
 from SDFC.tools.__Link    import SemiBoundedLink
 from SDFC.tools.__Link    import BoundedLink
 from SDFC.tools.__plot_confidences_intervals import plot_confidences_intervals
+from SDFC.tools.__streaming import RunningMoments
+from SDFC.tools.__streaming import P2Quantile
+from SDFC.tools.__grid import fit_grid
+from SDFC.tools.__cube import fit_cube
+from SDFC.tools.__threshold import threshold_sweep
 
 
 
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## This software is a computer program that is part of the SDFC (Statistical    ##
+## Distribution Fit with Covariates) library. This library makes it possible    ##
+## to regress the parameters of some statistical law with co-variates.          ##
+##                                                                              ##
+## This software is governed by the CeCILL-C license under French law and       ##
+## abiding by the rules of distribution of free software.  You can  use,        ##
+## modify and/ or redistribute the software under the terms of the CeCILL-C     ##
+## license as circulated by CEA, CNRS and INRIA at the following URL            ##
+## "http://www.cecill.info".                                                    ##
+##                                                                              ##
+## As a counterpart to the access to the source code and  rights to copy,       ##
+## modify and redistribute granted by the license, users are provided only      ##
+## with a limited warranty  and the software's author,  the holder of the       ##
+## economic rights,  and the successive licensors  have only  limited           ##
+## liability.                                                                   ##
+##                                                                              ##
+## In this respect, the user's attention is drawn to the risks associated       ##
+## with loading,  using,  modifying and/or developing or reproducing the        ##
+## software by the user in light of its specific status of free software,       ##
+## that may mean  that it is complicated to manipulate,  and  that  also        ##
+## therefore means  that it is reserved for developers  and  experienced        ##
+## professionals having in-depth computer knowledge. Users are therefore        ##
+## encouraged to load and test the software's suitability as regards their      ##
+## requirements in conditions enabling the security of their systems and/or     ##
+## data to be ensured and,  more generally, to use and operate it in the        ##
+## same conditions as regards security.                                         ##
+##                                                                              ##
+## The fact that you are presently reading this means that you have had         ##
+## knowledge of the CeCILL-C license and that you accept its terms.             ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## Ce logiciel est un programme informatique faisant partie de la librairie     ##
+## SDFC (Statistical Distribution Fit with Covariates). Cette librairie         ##
+## permet de calculer de regresser les parametres de lois statistiques selon    ##
+## plusieurs co-variables                                                       ##
+##                                                                              ##
+## Ce logiciel est régi par la licence CeCILL-C soumise au droit français et    ##
+## respectant les principes de diffusion des logiciels libres. Vous pouvez      ##
+## utiliser, modifier et/ou redistribuer ce programme sous les conditions       ##
+## de la licence CeCILL-C telle que diffusée par le CEA, le CNRS et l'INRIA     ##
+## sur le site "http://www.cecill.info".                                        ##
+##                                                                              ##
+## En contrepartie de l'accessibilité au code source et des droits de copie,    ##
+## de modification et de redistribution accordés par cette licence, il n'est    ##
+## offert aux utilisateurs qu'une garantie limitée.  Pour les mêmes raisons,    ##
+## seule une responsabilité restreinte pèse sur l'auteur du programme, le       ##
+## titulaire des droits patrimoniaux et les concédants successifs.              ##
+##                                                                              ##
+## A cet égard  l'attention de l'utilisateur est attirée sur les risques        ##
+## associés au chargement,  à l'utilisation,  à la modification et/ou au        ##
+## développement et à la reproduction du logiciel par l'utilisateur étant       ##
+## donné sa spécificité de logiciel libre, qui peut le rendre complexe à        ##
+## manipuler et qui le réserve donc à des développeurs et des professionnels    ##
+## avertis possédant  des  connaissances  informatiques approfondies.  Les      ##
+## utilisateurs sont donc invités à charger  et  tester  l'adéquation  du       ##
+## logiciel à leurs besoins dans des conditions permettant d'assurer la         ##
+## sécurité de leurs systèmes et ou de leurs données et, plus généralement,     ##
+## à l'utiliser et l'exploiter dans les mêmes conditions de sécurité.           ##
+##                                                                              ##
+## Le fait que vous puissiez accéder à cet en-tête signifie que vous avez       ##
+## pris connaissance de la licence CeCILL-C, et que vous en avez accepté les    ##
+## termes.                                                                      ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+###############
+## Libraries ##
+###############
+
+import numpy as np
+
+
+#############
+## Classes ##
+#############
+
+class RunningMoments:##{{{
+	"""
+	SDFC.tools.RunningMoments
+	=========================
+	
+	Mean and covariance matrix of a stream of vectors, updated one vector at a time with the Welford algorithm, so
+	the stream does not need to be stored.
+	
+	Attributes
+	----------
+	n_samples : integer
+		Numbers of vectors seen
+	mean      : np.array or None
+		Mean of the vectors seen
+	cov       : np.array or None
+		Covariance matrix (unbiased) of the vectors seen
+	"""
+	def __init__( self ):
+		self.n_samples = 0
+		self.mean      = None
+		self._M2       = None
+	
+	def __str__(self):
+		return "SDFC.tools.RunningMoments ({} samples)".format(self.n_samples)
+	
+	def __repr__(self):
+		return self.__str__()
+	
+	def update( self , x ):
+		"""
+		Add the vector x to the stream
+		"""
+		x = np.array( [x] , dtype = float ).ravel()
+		if self.mean is None:
+			self.mean = np.zeros_like(x)
+			self._M2  = np.zeros( (x.size,x.size) )
+		self.n_samples += 1
+		delta      = x - self.mean
+		self.mean += delta / self.n_samples
+		self._M2  += np.outer( delta , x - self.mean )
+	
+	@property
+	def cov(self):
+		if self.n_samples < 2:
+			return None
+		return self._M2 / ( self.n_samples - 1 )
+##}}}
+
+class P2Quantile:##{{{
+	"""
+	SDFC.tools.P2Quantile
+	=====================
+	
+	Estimation of a quantile of each component of a stream of vectors, without storing the stream, with the P²
+	algorithm (Jain and Chlamtac, 1985). Five markers are kept by component, and their heights are updated with a
+	piecewise parabolic interpolation. The five first vectors are stored, and the quantile is exact until then.
+	
+	Attributes
+	----------
+	p         : float
+		Level of the quantile, between 0 and 1
+	n_samples : integer
+		Numbers of vectors seen
+	quantile  : np.array or None
+		Current estimation of the quantile
+	"""
+	def __init__( self , p ):
+		self.p         = p
+		self.n_samples = 0
+		self._init     = []
+		self._q        = None
+		self._n        = None
+		self._np       = None
+		self._dn       = np.array( [ 0 , p / 2 , p , (1 + p) / 2 , 1 ] ).reshape(-1,1)
+	
+	def __str__(self):
+		return "SDFC.tools.P2Quantile ({}, {} samples)".format(self.p,self.n_samples)
+	
+	def __repr__(self):
+		return self.__str__()
+	
+	def update( self , x ):
+		"""
+		Add the vector x to the stream
+		"""
+		x = np.array( [x] , dtype = float ).ravel()
+		self.n_samples += 1
+		
+		## Initialization with the five first vectors
+		if self._q is None:
+			self._init.append(x)
+			if len(self._init) == 5:
+				self._q  = np.sort( np.array(self._init) , axis = 0 )
+				self._n  = np.repeat( np.arange( 1. , 6. ) , x.size ).reshape(5,-1)
+				self._np = 1 + 4 * self._dn * np.ones( (1,x.size) )
+				self._init = []
+			return
+		
+		q,n = self._q,self._n
+		
+		## Extreme markers, and positions of markers above x
+		q[0,:] = np.minimum( q[0,:] , x )
+		q[4,:] = np.maximum( q[4,:] , x )
+		n[1:4,:] += x < q[1:4,:]
+		n[4,:]   += 1
+		self._np += self._dn
+		
+		## Adjust the three middle markers
+		for i in range(1,4):
+			d    = self._np[i,:] - n[i,:]
+			move = ( ( d >= 1 ) & ( n[i+1,:] - n[i,:] > 1 ) ) | ( ( d <= -1 ) & ( n[i-1,:] - n[i,:] < -1 ) )
+			if not np.any(move):
+				continue
+			d  = np.sign(d)
+			qp = q[i,:] + d / ( n[i+1,:] - n[i-1,:] ) * ( ( n[i,:] - n[i-1,:] + d ) * ( q[i+1,:] - q[i,:] ) / ( n[i+1,:] - n[i,:] ) + ( n[i+1,:] - n[i,:] - d ) * ( q[i,:] - q[i-1,:] ) / ( n[i,:] - n[i-1,:] ) )
+			j  = np.where( d > 0 , i + 1 , i - 1 )
+			cols = np.arange(q.shape[1])
+			ql = q[i,:] + d * ( q[j,cols] - q[i,:] ) / ( n[j,cols] - n[i,:] )
+			qp = np.where( ( q[i-1,:] < qp ) & ( qp < q[i+1,:] ) , qp , ql )
+			q[i,:] = np.where( move , qp , q[i,:] )
+			n[i,:] = np.where( move , n[i,:] + d , n[i,:] )
+	
+	@property
+	def quantile(self):
+		if self._q is not None:
+			return self._q[2,:].copy()
+		if len(self._init) == 0:
+			return None
+		return np.quantile( np.array(self._init) , self.p , axis = 0 )
+##}}}
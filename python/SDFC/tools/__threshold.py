@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## This software is a computer program that is part of the SDFC (Statistical    ##
+## Distribution Fit with Covariates) library. This library makes it possible    ##
+## to regress the parameters of some statistical law with co-variates.          ##
+##                                                                              ##
+## This software is governed by the CeCILL-C license under French law and       ##
+## abiding by the rules of distribution of free software.  You can  use,        ##
+## modify and/ or redistribute the software under the terms of the CeCILL-C     ##
+## license as circulated by CEA, CNRS and INRIA at the following URL            ##
+## "http://www.cecill.info".                                                    ##
+##                                                                              ##
+## As a counterpart to the access to the source code and  rights to copy,       ##
+## modify and redistribute granted by the license, users are provided only      ##
+## with a limited warranty  and the software's author,  the holder of the       ##
+## economic rights,  and the successive licensors  have only  limited           ##
+## liability.                                                                   ##
+##                                                                              ##
+## In this respect, the user's attention is drawn to the risks associated       ##
+## with loading,  using,  modifying and/or developing or reproducing the        ##
+## software by the user in light of its specific status of free software,       ##
+## that may mean  that it is complicated to manipulate,  and  that  also        ##
+## therefore means  that it is reserved for developers  and  experienced        ##
+## professionals having in-depth computer knowledge. Users are therefore        ##
+## encouraged to load and test the software's suitability as regards their      ##
+## requirements in conditions enabling the security of their systems and/or     ##
+## data to be ensured and,  more generally, to use and operate it in the        ##
+## same conditions as regards security.                                         ##
+##                                                                              ##
+## The fact that you are presently reading this means that you have had         ##
+## knowledge of the CeCILL-C license and that you accept its terms.             ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+##################################################################################
+##################################################################################
+##                                                                              ##
+## Copyright Yoann Robin, 2019                                                  ##
+##                                                                              ##
+## yoann.robin.k@gmail.com                                                      ##
+##                                                                              ##
+## Ce logiciel est un programme informatique faisant partie de la librairie     ##
+## SDFC (Statistical Distribution Fit with Covariates). Cette librairie         ##
+## permet de calculer de regresser les parametres de lois statistiques selon    ##
+## plusieurs co-variables                                                       ##
+##                                                                              ##
+## Ce logiciel est régi par la licence CeCILL-C soumise au droit français et    ##
+## respectant les principes de diffusion des logiciels libres. Vous pouvez      ##
+## utiliser, modifier et/ou redistribuer ce programme sous les conditions       ##
+## de la licence CeCILL-C telle que diffusée par le CEA, le CNRS et l'INRIA     ##
+## sur le site "http://www.cecill.info".                                        ##
+##                                                                              ##
+## En contrepartie de l'accessibilité au code source et des droits de copie,    ##
+## de modification et de redistribution accordés par cette licence, il n'est    ##
+## offert aux utilisateurs qu'une garantie limitée.  Pour les mêmes raisons,    ##
+## seule une responsabilité restreinte pèse sur l'auteur du programme, le       ##
+## titulaire des droits patrimoniaux et les concédants successifs.              ##
+##                                                                              ##
+## A cet égard  l'attention de l'utilisateur est attirée sur les risques        ##
+## associés au chargement,  à l'utilisation,  à la modification et/ou au        ##
+## développement et à la reproduction du logiciel par l'utilisateur étant       ##
+## donné sa spécificité de logiciel libre, qui peut le rendre complexe à        ##
+## manipuler et qui le réserve donc à des développeurs et des professionnels    ##
+## avertis possédant  des  connaissances  informatiques approfondies.  Les      ##
+## utilisateurs sont donc invités à charger  et  tester  l'adéquation  du       ##
+## logiciel à leurs besoins dans des conditions permettant d'assurer la         ##
+## sécurité de leurs systèmes et ou de leurs données et, plus généralement,     ##
+## à l'utiliser et l'exploiter dans les mêmes conditions de sécurité.           ##
+##                                                                              ##
+## Le fait que vous puissiez accéder à cet en-tête signifie que vous avez       ##
+## pris connaissance de la licence CeCILL-C, et que vous en avez accepté les    ##
+## termes.                                                                      ##
+##                                                                              ##
+##################################################################################
+##################################################################################
+
+###############
+## Libraries ##
+###############
+
+import os
+import numpy       as np
+import scipy.stats as sc
+
+from SDFC.tools.__grid import _worker_arrays
+from SDFC.tools.__grid import _shared_executor
+from SDFC.tools.__grid import _split_kwargs
+from SDFC.tools.__grid import _stack
+
+
+###############
+## Functions ##
+###############
+
+def _stability( law , u ):##{{{
+	"""
+	Shape and modified scale (scale - shape * u) of a GPD fitted above the threshold u, and their standard deviations
+	given by law.cov (delta method). The modified scale is nan if u is None (threshold varying with the samples), and
+	the standard deviation of a statistic is nan if a param it depends on has covariates.
+	"""
+	shape  = float(law.shape[0,0])
+	mscale = np.nan if u is None else float(law.scale[0,0]) - shape * u
+	if law.cov is None:
+		return np.array( [shape,np.nan,mscale,np.nan] )
+	
+	## Jacobians with respect to coef_, nan for the non stationary params
+	J = { "scale" : np.zeros(law.coef_.size) , "shape" : np.zeros(law.coef_.size) }
+	a = 0
+	for kind,X,G in law._free_params(None):
+		if kind in J:
+			J[kind][a:a+X.shape[1]] = G[0,0] if X.shape[1] == 1 else np.nan
+		a += X.shape[1]
+	J_mscale = J["scale"] - ( np.nan if u is None else u ) * J["shape"]
+	cov      = np.array(law.cov)
+	return np.array( [shape,np.sqrt( J["shape"] @ cov @ J["shape"] ),mscale,np.sqrt( J_mscale @ cov @ J_mscale )] )
+##}}}
+
+def _sweep( law_kwargs , Y , thresholds , kwargs , columns ):##{{{
+	"""
+	Fit a GPD above each threshold of columns, in this order, each fit is started from the coef_ of the previous one.
+	If thresholds is 1d, Y and the arrays of kwargs are sorted by decreasing Y, so the exceedances of a threshold are
+	the first observations. Return the lists of coef_, confidence intervals and stability statistics (see _stability),
+	None if the fit fails.
+	"""
+	from SDFC.__GPD import GPD
+	
+	coefs,cis,stabs = [],[],[]
+	init = None
+	for j in columns:
+		if thresholds.ndim == 1:
+			u   = thresholds[j]
+			n   = int(np.searchsorted( -Y , -u , side = "left" ))
+			Y_  = Y[:n]
+			loc = u
+			kw  = { k : kwargs[k][:n] if isinstance(kwargs[k],np.ndarray) and kwargs[k].ndim > 0 and kwargs[k].shape[0] == Y.size else kwargs[k] for k in kwargs }
+		else:
+			u   = None
+			Y_  = Y
+			loc = thresholds[:,j]
+			kw  = kwargs
+		law = GPD( **law_kwargs )
+		try:
+			law.fit( Y_ , f_loc = loc , init = init , **kw )
+			coef_ = np.array( law.coef_ , dtype = float ).ravel()
+			if not np.all(np.isfinite(coef_)):
+				raise ValueError
+			
+			## Confidence interval of the bootstrap, otherwise the normal approximation given by law.cov
+			if law.confidence_interval is not None:
+				ci = np.array(law.confidence_interval)
+			elif law.cov is not None:
+				z  = sc.norm.ppf( 1 - law.alpha / 2 )
+				sd = np.sqrt( np.diag( np.array(law.cov) ) )
+				ci = np.array( [coef_ - z * sd,coef_ + z * sd] )
+			else:
+				ci = None
+			coefs.append(coef_)
+			cis.append(ci)
+			stabs.append( _stability( law , u ) )
+			init = coef_
+		except Exception:
+			coefs.append(None)
+			cis.append(None)
+			stabs.append(None)
+	return coefs,cis,stabs
+##}}}
+
+def _sweep_chunk( law_kwargs , static_kwargs , columns ):##{{{
+	"""
+	Task of a worker, Y, the thresholds and the arrays of kwargs are read from the shared memory
+	"""
+	kwargs = dict(static_kwargs)
+	for key in _worker_arrays:
+		if key not in ["Y","thresholds"]:
+			kwargs[key] = _worker_arrays[key]
+	return _sweep( law_kwargs , _worker_arrays["Y"] , _worker_arrays["thresholds"] , kwargs , columns )
+##}}}
+
+def _mean_excess( Y , thresholds , alpha ):##{{{
+	"""
+	Numbers of exceedances, mean excess (mean residual life) and its confidence interval (normal approximation) above
+	each threshold. If thresholds is 1d, Y is sorted by decreasing values, and all the means are given by cumulative
+	sums.
+	"""
+	z = sc.norm.ppf( 1 - alpha / 2 )
+	if thresholds.ndim == 1:
+		n  = np.searchsorted( -Y , -thresholds , side = "left" )
+		c  = Y[Y.size // 2] if Y.size > 0 else 0. ## Shift, against the cancellation in the variance
+		S1 = np.hstack( ( [0.] , np.cumsum( Y - c ) ) )[n]
+		S2 = np.hstack( ( [0.] , np.cumsum( ( Y - c )**2 ) ) )[n]
+		with np.errstate( divide = "ignore" , invalid = "ignore" ):
+			mean = S1 / n
+			var  = np.maximum( S2 / n - mean**2 , 0 ) * n / ( n - 1 )
+			mean = mean + c - thresholds
+	else:
+		E = Y.reshape(-1,1) - thresholds
+		W = E > 0
+		n = np.sum( W , axis = 0 )
+		with np.errstate( divide = "ignore" , invalid = "ignore" ):
+			mean = np.sum( np.where( W , E , 0 ) , axis = 0 ) / n
+			var  = np.sum( np.where( W , E - mean , 0 )**2 , axis = 0 ) / ( n - 1 )
+	with np.errstate( divide = "ignore" , invalid = "ignore" ):
+		hw = z * np.sqrt( var / n )
+	hw   = np.where( n > 1 , hw , np.nan )
+	mean = np.where( n > 0 , mean , np.nan )
+	return n,mean,np.stack( (mean - hw,mean + hw) , axis = 1 )
+##}}}
+
+def threshold_sweep( Y , thresholds , n_jobs = -1 , blas_threads = 1 , law_kwargs = None , **kwargs ):##{{{
+	"""
+	SDFC.tools.threshold_sweep
+	==========================
+	
+	Fit a GPD above each threshold of a sequence, to select the threshold with the stability of the shape and of the
+	modified scale, and the linearity of the mean excess (mean residual life). For constant thresholds, the data are
+	sorted once, so the exceedances of each threshold are a prefix of the sorted data and the mean excesses are given
+	by cumulative sums. Each fit is started from the coef_ of the fit of the previous threshold. The thresholds are
+	split in n_jobs contiguous blocks fitted in parallel, with the data in shared memory (see SDFC.tools.fit_grid).
+	
+	Parameters
+	----------
+	Y            : np.array[ shape = (n_samples,) ]
+		Dataset
+	thresholds   : np.array[ shape = (n_thresholds,) or (n_samples,n_thresholds) ]
+		Constant thresholds, or thresholds varying with the samples (e.g. fitted by quantile regression), one per
+		column
+	n_jobs       : integer
+		Numbers of processes, default is -1 (all cpus). If 1, the thresholds are fitted sequentially, without pool.
+	blas_threads : None or integer
+		Numbers of BLAS threads of each worker, default is 1. If None, the threads are not capped.
+	law_kwargs   : None or dict
+		Arguments given to the initialization of the GPD, e.g. { "n_bootstrap" : 100 }
+	**kwargs     :
+		Arguments of the fit (c_scale, l_shape, ...), common to all thresholds. The loc is given by the thresholds.
+	
+	Returns
+	-------
+	sweep : dict
+		"n_exceedances"       : np.array[ shape = (n_thresholds,) ], numbers of exceedances
+		"coef_"               : np.array[ shape = (n_thresholds,n_coef) ], coefficients fitted, nan if a fit fails
+		"confidence_interval" : np.array[ shape = (n_thresholds,2,n_coef) ], from the bootstrap if law_kwargs has
+		                        n_bootstrap, otherwise the normal approximation given by the covariance of the MLE
+		"shape"               : np.array[ shape = (n_thresholds,) ]
+		"shape_ci"            : np.array[ shape = (n_thresholds,2) ]
+		"modified_scale"      : np.array[ shape = (n_thresholds,) ], scale - shape * threshold, nan for thresholds
+		                        varying with the samples
+		"modified_scale_ci"   : np.array[ shape = (n_thresholds,2) ]
+		"mean_excess"         : np.array[ shape = (n_thresholds,) ], mean of the exceedances minus the threshold
+		"mean_excess_ci"      : np.array[ shape = (n_thresholds,2) ]
+		The confidence intervals of the shape and of the modified scale are given by the delta method, nan if they
+		depend on a param with covariates.
+	"""
+	if "f_loc" in kwargs or "c_loc" in kwargs:
+		raise ValueError( "SDFC: the loc of the GPD is given by the thresholds" )
+	law_kwargs = {} if law_kwargs is None else law_kwargs
+	alpha      = law_kwargs.get("alpha") if law_kwargs.get("alpha") is not None else 0.05
+	Y          = np.array( Y , dtype = float ).ravel()
+	thresholds = np.array( thresholds , dtype = float )
+	n_samples  = Y.size
+	
+	## Constant thresholds: the data and the arrays of kwargs are sorted once, the thresholds are fitted by increasing
+	## values. Otherwise in the order of the columns.
+	if thresholds.ndim == 1:
+		order   = np.argsort( -Y , kind = "stable" )
+		Y       = Y[order]
+		kwargs  = { k : np.asarray(kwargs[k])[order] if k[:2] in ["c_","f_"] and np.ndim(kwargs[k]) > 0 and np.shape(kwargs[k])[0] == n_samples else kwargs[k] for k in kwargs }
+		columns = np.argsort( thresholds , kind = "stable" )
+	else:
+		thresholds = thresholds.reshape(n_samples,-1)
+		columns    = np.arange(thresholds.shape[1])
+	n_thresholds = columns.size
+	n_jobs       = os.cpu_count() if n_jobs == -1 else max( n_jobs , 1 )
+	blocks       = [ b for b in np.array_split( columns , min( n_jobs , max( n_thresholds , 1 ) ) ) if b.size > 0 ]
+	
+	if n_jobs == 1 or len(blocks) == 1:
+		coefs,cis,stabs = _sweep( law_kwargs , Y , thresholds , kwargs , columns )
+	else:
+		arrays,static_kwargs = _split_kwargs(kwargs)
+		arrays["Y"]          = Y
+		arrays["thresholds"] = thresholds
+		coefs,cis,stabs = [],[],[]
+		with _shared_executor( arrays , n_jobs , blas_threads ) as executor:
+			for c,ci,s in executor.map( _sweep_chunk , *zip( *[ (law_kwargs,static_kwargs,block) for block in blocks ] ) ):
+				coefs.extend(c)
+				cis.extend(ci)
+				stabs.extend(s)
+	
+	## Back to the order of the thresholds
+	inv = np.argsort(columns)
+	coefs,cis,stabs = [ [ l[i] for i in inv ] for l in (coefs,cis,stabs) ]
+	coef_ = _stack(coefs)
+	ci    = _stack(cis)
+	stab  = _stack(stabs)
+	if stab is None:
+		stab = np.zeros( (n_thresholds,4) ) + np.nan
+	n,mean,mean_ci = _mean_excess( Y , thresholds , alpha )
+	
+	z = sc.norm.ppf( 1 - alpha / 2 )
+	return { "n_exceedances"       : n,
+	         "coef_"               : coef_,
+	         "confidence_interval" : ci,
+	         "shape"               : stab[:,0],
+	         "shape_ci"            : np.stack( (stab[:,0] - z * stab[:,1],stab[:,0] + z * stab[:,1]) , axis = 1 ),
+	         "modified_scale"      : stab[:,2],
+	         "modified_scale_ci"   : np.stack( (stab[:,2] - z * stab[:,3],stab[:,2] + z * stab[:,3]) , axis = 1 ),
+	         "mean_excess"         : mean,
+	         "mean_excess_ci"      : mean_ci
+	       }
+##}}}
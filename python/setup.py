@@ -192,10 +192,14 @@ class BuildExt(build_ext):##{{{
 			opts.append(cpp_flag(self.compiler))
 			if has_flag(self.compiler, '-fvisibility=hidden'):
 				opts.append('-fvisibility=hidden')
+			if has_flag(self.compiler, '-pthread'):
+				opts.append('-pthread')
 		elif ct == 'msvc':
 			opts.append('/DVERSION_INFO=\\"%s\\"' % self.distribution.get_version())
 		for ext in self.extensions:
 			ext.extra_compile_args = opts
+			if "-pthread" in opts:
+				ext.extra_link_args = ["-pthread"]
 		build_ext.build_extensions(self)
 ##}}}
 
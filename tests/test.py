@@ -10,6 +10,7 @@
 ###############
 
 import sys,os
+import tempfile
 import pickle as pk
 import multiprocessing as mp
 
@@ -18,6 +19,7 @@ import sklearn.datasets as skd
 import pandas as pd
 import scipy.stats as sc
 import scipy.optimize as sco
+import scipy.sparse as ssp
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -147,9 +149,256 @@ def test_gpd( method , size ):##{{{
 ##}}}
 
 
+## Tests for MLE
+##==============
+
+def test_hessian( size = 2500 ):##{{{
+	
+	print( "Test of analytic Hessians" )
+	
+	_,X_loc,X_scale,_ = sdt.Dataset.covariates(size)
+	laws = [ ( sd.Normal      , np.random.normal( loc = 1. + 0.8 * X_loc , scale = 0.2 ) , { "c_loc" : X_loc , "c_scale" : X_scale , "l_scale" : sdt.ExpLink() } ),
+	         ( sd.Exponential , np.random.exponential( scale = 1. + 0.2 * X_scale )     , { "c_scale" : X_scale } ),
+	         ( sd.Gamma       , np.random.gamma( 2. , scale = 1. + 0.2 * X_scale )      , { "c_scale" : X_scale } ),
+	         ( sd.GEV         , sc.genextreme.rvs( loc = 1. + 0.8 * X_loc , scale = 0.2 , c = -0.1 ) , { "c_loc" : X_loc , "l_scale" : sdt.ExpLink() } ),
+	         ( sd.GPD         , sc.genpareto.rvs( scale = 0.2 , c = 0.2 , size = size ) , { "f_loc" : np.zeros(size) , "c_scale" : X_scale } ) ]
+	for law,Y,kwargs in laws:
+		try:
+			l0 = law()
+			l0.fit( Y , **kwargs )
+			l1 = law()
+			l1.fit( Y , optimizer = "trust-exact" , **kwargs )
+			
+			## Hessian against finite differences of the gradient
+			l1._Y = Y.reshape(-1,1)
+			coef  = l1.coef_.copy()
+			H     = l1._hessian_nlll(coef)
+			eps   = 1e-6
+			Hd    = np.array( [ ( l1._gradient_nlll( coef + eps * e ) - l1._gradient_nlll( coef - eps * e ) ) / ( 2 * eps ) for e in np.identity(coef.size) ] ).T
+			ok = np.allclose( H , Hd , rtol = 1e-4 , atol = 1e-4 * np.abs(Hd).max() ) and np.allclose( l0.coef_ , l1.coef_ , atol = 1e-3 )
+			
+			## Fused negative log-likelihood and gradient
+			value,grad = l1._value_and_grad(coef)
+			ok = ok and np.isclose( value , l1._negloglikelihood(coef) ) and np.allclose( grad , l1._gradient_nlll(coef) )
+			print( "......{} ({})".format( "OK  " if ok else "FAIL" , law.__name__ ) )
+		except:
+			print( "......FAIL ({})".format(law.__name__) )
+##}}}
+
+def test_gpd_exceedances( size = 2500 ):##{{{
+	
+	print( "Test of GPD fit on the exceedances" )
+	
+	_,_,X_scale,_ = sdt.Dataset.covariates(size)
+	Y   = sc.genpareto.rvs( scale = 0.2 + 0.1 * X_scale , c = 0.2 )
+	loc = np.zeros(size) + np.quantile( Y , 0.9 )
+	idx = Y > loc
+	try:
+		law = sd.GPD()
+		law.fit( Y , f_loc = loc , c_scale = X_scale )
+		ref = sd.GPD()
+		ref.fit( Y[idx] , f_loc = loc[idx] , c_scale = X_scale[idx] )
+		ok = law.scale.shape == (size,1) and np.allclose( law.coef_ , ref.coef_ , atol = 1e-4 )
+		print( "......{} (Compacted)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Compacted)" )
+	
+	## fit_many with one series, the exceedances are masked as for several series
+	try:
+		coef_,_,success = sd.GPD().fit_many( Y.reshape(-1,1) , f_loc = loc , c_scale = X_scale )
+		ok = np.all(success) and np.allclose( coef_[0,:] , law.coef_ , atol = 1e-4 )
+		print( "......{} (fit_many, one series)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (fit_many, one series)" )
+##}}}
+
+def test_gev_shape_solver():##{{{
+	
+	print( "Test of the GEV shape solver" )
+	
+	try:
+		from SDFC.__GEV import _shape_from_tau3
+		tau3  = np.linspace( -0.9 , 0.9 , 19 )
+		shape = _shape_from_tau3(tau3)
+		ok = np.allclose( ( 1 - 3**shape ) / ( 1 - 2**shape ) , ( 3 + tau3 ) / 2 , rtol = 1e-10 )
+		print( "......{} (tau3)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (tau3)" )
+##}}}
+
+def test_fit_many( size = 2500 , n_series = 20 ):##{{{
+	
+	print( "Test of fit_many" )
+	
+	_,X_loc,X_scale,_ = sdt.Dataset.covariates(size)
+	Y = np.stack( [ sc.genextreme.rvs( loc = 1. + 0.8 * X_loc , scale = 0.2 , c = -0.1 ) for _ in range(n_series) ] , axis = 1 )
+	try:
+		coef_,cov,success = sd.GEV().fit_many( Y , c_loc = X_loc , l_scale = sdt.ExpLink() )
+		law = sd.GEV()
+		law.fit( Y[:,0] , c_loc = X_loc , l_scale = sdt.ExpLink() )
+		ok = np.all(success) and coef_.shape == (n_series,4) and cov.shape == (n_series,4,4) and np.allclose( coef_[0,:] , law.coef_ , atol = 1e-3 )
+		print( "......{} (GEV)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (GEV)" )
+##}}}
+
+def test_fit_grid( size = 2500 , n_series = 8 ):##{{{
+	
+	print( "Test of fit_grid" )
+	
+	_,X_loc,_,_ = sdt.Dataset.covariates(size)
+	Y = np.stack( [ np.random.normal( loc = 1. + 0.8 * X_loc , scale = 0.2 ) for _ in range(n_series) ] , axis = 1 )
+	try:
+		coef0,_  = sdt.fit_grid( sd.Normal , Y , n_jobs = 1 , c_loc = X_loc )
+		coef1,ci = sdt.fit_grid( sd.Normal , Y , n_jobs = 2 , law_kwargs = { "n_bootstrap" : 10 } , c_loc = X_loc )
+		ok = coef0.shape == (n_series,3) and ci.shape == (n_series,2,3) and np.allclose( coef0 , coef1 )
+		print( "......{} (Normal)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Normal)" )
+##}}}
+
+def test_fit_cube( size = 2500 ):##{{{
+	
+	print( "Test of fit_cube" )
+	
+	_,X_loc,_,_ = sdt.Dataset.covariates(size)
+	Y = np.random.normal( loc = 1. + 0.8 * X_loc.reshape(-1,1,1) , scale = 0.2 , size = (size,3,4) )
+	Y[:,0,0] = np.nan
+	try:
+		with tempfile.TemporaryDirectory() as output:
+			np.save( os.path.join( output , "Y.npy" ) , Y )
+			coef,_,status = sdt.fit_cube( sd.Normal , os.path.join( output , "Y.npy" ) , os.path.join( output , "fit" ) , tile_size = 5 , c_loc = X_loc )
+			
+			## Resume after an interruption of the last tile
+			tiles = np.lib.format.open_memmap( os.path.join( output , "fit" , "tiles.npy" ) , mode = "r+" )
+			tiles[-1] = False
+			tiles.flush()
+			coef2,_,status2 = sdt.fit_cube( sd.Normal , os.path.join( output , "Y.npy" ) , os.path.join( output , "fit" ) , tile_size = 5 , c_loc = X_loc )
+			ok = coef.shape == (3,4,3) and status[0,0] == 3 and np.all(status.ravel()[1:] == 1) and np.allclose( coef[1:,:] , coef2[1:,:] )
+			del coef,status,coef2,status2,tiles
+		print( "......{} (Normal)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Normal)" )
+##}}}
+
+def test_threshold_sweep( size = 2500 ):##{{{
+	
+	print( "Test of threshold_sweep" )
+	
+	Y  = sc.genpareto.rvs( scale = 0.5 , c = 0.1 , size = size )
+	us = np.quantile( Y , [0.5,0.7,0.9] )
+	try:
+		sweep = sdt.threshold_sweep( Y , us , n_jobs = 1 )
+		law   = sd.GPD()
+		law.fit( Y , f_loc = np.zeros(size) + us[1] )
+		ok = np.allclose( sweep["coef_"][1,:] , law.coef_ , atol = 1e-4 ) and np.allclose( sweep["mean_excess"][1] , np.mean( Y[Y > us[1]] - us[1] ) )
+		ok = ok and np.all( sweep["shape_ci"][:,0] < sweep["shape"] ) and np.all( sweep["modified_scale"] < sweep["modified_scale_ci"][:,1] )
+		print( "......{} (GPD)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (GPD)" )
+##}}}
+
+
+## Tests for bootstrap
+##====================
+
+def test_bootstrap( size = 2500 ):##{{{
+	
+	print( "Test of bootstrap" )
+	
+	_,X_loc,_,_ = sdt.Dataset.covariates(size)
+	Y = np.random.normal( loc = 1. + 0.8 * X_loc , scale = 0.2 )
+	
+	## Parallel
+	try:
+		law0 = sd.Normal( n_bootstrap = 20 , seed = 42 )
+		law0.fit( Y , c_loc = X_loc )
+		law1 = sd.Normal( n_bootstrap = 20 , seed = 42 , n_jobs = 2 )
+		law1.fit( Y , c_loc = X_loc )
+		print( "......{} (Parallel)".format( "OK  " if np.allclose( law0.coefs_bootstrap , law1.coefs_bootstrap ) else "FAIL" ) )
+	except:
+		print( "......FAIL (Parallel)" )
+	
+	## Bootstrap with observation weights
+	for kind in ["multinomial","poisson"]:
+		try:
+			law = sd.Normal( n_bootstrap = 20 , bootstrap = kind )
+			law.fit( Y , c_loc = X_loc )
+			print( "......{} (Weights, {})".format( "OK  " if np.all( law.confidence_interval[0,:] < law.confidence_interval[1,:] ) else "FAIL" , kind ) )
+		except:
+			print( "......FAIL (Weights, {})".format(kind) )
+	
+	## Closed-form methods, all replicates at once, against the replicates fitted one by one with the same seeds
+	try:
+		from SDFC.__AbstractLaw import _bootstrap_replicates
+		law = sd.GEV( method = "lmoments" , n_bootstrap = 200 , seed = 42 )
+		law.fit( Y )
+		seeds = np.random.SeedSequence(42).spawn(200)
+		coefs = np.array( _bootstrap_replicates( sd.GEV( method = "lmoments" ) , Y , seeds , "resample" , {} ) )
+		print( "......{} (Batched lmoments)".format( "OK  " if law.coefs_bootstrap.shape == (200,3) and np.allclose( law.coefs_bootstrap , coefs ) else "FAIL" ) )
+	except:
+		print( "......FAIL (Batched lmoments)" )
+	
+	## Newton steps approximation
+	try:
+		law0 = sd.Normal( n_bootstrap = 20 , seed = 42 )
+		law0.fit( Y , c_loc = X_loc )
+		law1 = sd.Normal( n_bootstrap = 20 , seed = 42 , n_newton = 3 )
+		law1.fit( Y , c_loc = X_loc )
+		print( "......{} (Newton steps)".format( "OK  " if np.allclose( law0.coefs_bootstrap , law1.coefs_bootstrap , atol = 1e-3 ) else "FAIL" ) )
+	except:
+		print( "......FAIL (Newton steps)" )
+	
+	## Bag of Little Bootstraps
+	try:
+		law = sd.Normal( n_bootstrap = 20 , bootstrap = "blb" , blb_subsets = 4 )
+		law.fit( Y , c_loc = X_loc )
+		print( "......{} (Bag of Little Bootstraps)".format( "OK  " if np.all( law.confidence_interval[0,:] < law.confidence_interval[1,:] ) else "FAIL" ) )
+	except:
+		print( "......FAIL (Bag of Little Bootstraps)" )
+	
+	## Streaming summaries, without storing the replicates
+	try:
+		law0 = sd.Normal( n_bootstrap = 200 , seed = 42 )
+		law0.fit( Y , c_loc = X_loc )
+		law1 = sd.Normal( n_bootstrap = 200 , seed = 42 , store_bootstrap = False )
+		law1.fit( Y , c_loc = X_loc )
+		ok = law1.coefs_bootstrap is None and np.allclose( law0.cov_bootstrap , np.cov( law0.coefs_bootstrap.T ) ) and np.allclose( law0.confidence_interval , law1.confidence_interval , rtol = 0.05 )
+		print( "......{} (Streaming summaries)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Streaming summaries)" )
+	
+	## Adaptive numbers of replicates
+	try:
+		law = sd.Normal( n_bootstrap = 2000 , bootstrap_tol = 0.2 , bootstrap_batch = 50 )
+		law.fit( Y , c_loc = X_loc )
+		ok = law.info.n_bootstrap < 2000 and law.coefs_bootstrap.shape[0] == law.info.n_bootstrap and law.info.mc_error.shape == (2,3)
+		print( "......{} (Adaptive bootstrap)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Adaptive bootstrap)" )
+	
+	## Parametric bootstrap
+	for law in [sd.Normal,sd.GEV]:
+		try:
+			l = law( n_bootstrap = 20 , bootstrap = "parametric" )
+			l.fit( Y , c_loc = X_loc )
+			print( "......{} (Parametric, {})".format( "OK  " if np.all( l.confidence_interval[0,:] < l.confidence_interval[1,:] ) else "FAIL" , law.__name__ ) )
+		except:
+			print( "......FAIL (Parametric, {})".format(law.__name__) )
+##}}}
+
 ## Tests for non-parametric tools
 ##===============================
 
+def check_loss( reg , Y , X , ltau ):##{{{
+	"""
+	Check loss of the fitted coefficients of a QuantileRegression, one value per tau. The minimizers are not unique if
+	the data are near degenerate, so the fits are compared through their loss.
+	"""
+	R = Y.reshape(-1,1) - reg.coef_[:,0] - X @ reg.coef_[:,1:].T
+	return np.sum( R * ( ltau - (R < 0) ) , axis = 0 )
+##}}}
+
 def test_quantile_regression( size = 2500 ):##{{{
 	
 	print( "Test of QuantileRegression" )
@@ -168,6 +417,134 @@ def test_quantile_regression( size = 2500 ):##{{{
 		print( "......OK   (Fit)" )
 	except:
 		print( "......FAIL (Fit)" )
+	
+	## Tau fitted from the solution of the previous one, against independent fits (same check loss)
+	try:
+		reg0 = sdnp.QuantileRegression( ltau = ltau[::-1].copy() )
+		reg0.fit( Y , X )
+		reg1 = sdnp.QuantileRegression( ltau = ltau[::-1].copy() )
+		reg1.set_fit_params( warm_start = False )
+		reg1.fit( Y , X )
+		ok = reg0.is_success() and np.allclose( check_loss( reg0 , Y , X , ltau[::-1] ) , check_loss( reg1 , Y , X , ltau[::-1] ) , rtol = 1e-6 ) and reg0.n_iter.sum() < reg1.n_iter.sum()
+		print( "......{} (Warm start)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Warm start)" )
+	
+	## Cholesky solves of the normal equations, against the LU path, on seeded data with a unique solution
+	try:
+		rng = np.random.default_rng(42)
+		Xc  = rng.normal( size = (size,2) )
+		Yc  = 1. + Xc @ np.array([0.8,-0.5]) + rng.normal( scale = 0.3 , size = size )
+		reg1 = sdnp.QuantileRegression( ltau = ltau )
+		reg1.set_fit_params( cholesky = True )
+		reg1.fit( Yc , Xc )
+		reg2 = sdnp.QuantileRegression( ltau = ltau )
+		reg2.set_fit_params( cholesky = False )
+		reg2.fit( Yc , Xc )
+		ok = reg1.is_success() and reg2.is_success() and np.allclose( reg1.coef_ , reg2.coef_ , atol = 1e-5 )
+		print( "......{} (Cholesky)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Cholesky)" )
+	
+	## Tau fitted by blocks on several threads
+	try:
+		reg1 = sdnp.QuantileRegression( ltau = ltau )
+		reg1.set_fit_params( n_threads = 3 )
+		reg1.fit( Y , X )
+		ok = reg1.is_success() and np.allclose( check_loss( reg0 , Y , X , ltau[::-1] )[::-1] , check_loss( reg1 , Y , X , ltau ) , rtol = 1e-6 )
+		print( "......{} (Threads)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Threads)" )
+	
+	## Covariates read in place in C and Fortran order, quantiles not computed
+	try:
+		reg0 = sdnp.QuantileRegression( ltau = ltau )
+		reg0.fit( Y , np.ascontiguousarray(X) )
+		reg1 = sdnp.QuantileRegression( ltau = ltau )
+		reg1.fit( Y , np.asfortranarray(X) , quantiles = False )
+		ok = np.allclose( reg0.coef_ , reg1.coef_ ) and reg0.quantiles.shape == (size,ltau.size)
+		try:
+			reg1.quantiles
+			ok = False
+		except RuntimeError:
+			pass
+		print( "......{} (Zero copy)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Zero copy)" )
+	
+	## Preprocessing (subsample and globbing) against the full problem, on seeded data. The minimizers are compared
+	## through their check loss, the coefficients are not unique if the data are near degenerate
+	try:
+		rng = np.random.default_rng(42)
+		Xp  = rng.normal( size = (size,2) )
+		Yp  = 1. + Xp @ np.array([0.8,-0.5]) + rng.normal( scale = 0.3 , size = size )
+		reg0 = sdnp.QuantileRegression( ltau = ltau )
+		reg0.fit( Yp , Xp )
+		reg1 = sdnp.QuantileRegression( ltau = ltau )
+		reg1.set_fit_params( preprocessing = True )
+		reg1.fit( Yp , Xp )
+		ok = reg1.is_success() and np.allclose( check_loss( reg0 , Yp , Xp , ltau ) , check_loss( reg1 , Yp , Xp , ltau ) , rtol = 1e-6 ) and np.allclose( sdnp.quantile( Yp , ltau , Xp , preprocessing = True ) , reg0.quantiles , atol = 1e-4 )
+		print( "......{} (Preprocessing)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Preprocessing)" )
+	
+	## Several series with the same covariates, against a fit by series
+	try:
+		Ys  = np.stack( [ np.random.normal( loc = loc , scale = scale ) for _ in range(5) ] , axis = 1 )
+		reg = sdnp.QuantileRegression( ltau = ltau )
+		reg.set_fit_params( n_threads = 2 )
+		reg.fit_many( Ys , X )
+		ok = reg.is_success() and reg.coef_.shape == (5,ltau.size,3)
+		for s in range(5):
+			reg0 = sdnp.QuantileRegression( ltau = ltau )
+			reg0.fit( Ys[:,s] , X )
+			ok = ok and np.allclose( reg.coef_[s,:,:] , reg0.coef_ )
+		lmom = sdnp.lmoments( Ys , c_Y = X , axis = 0 )
+		ok = ok and lmom.shape == (size,4,5) and np.allclose( lmom[:,:,0] , sdnp.lmoments( Ys[:,0] , c_Y = X ) )
+		print( "......{} (Many series)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Many series)" )
+	
+	## Sparse design, indicators of 10 groups and a covariate, against the dense design
+	try:
+		group = np.random.choice( 10 , size = size )
+		Xs    = ssp.hstack( [ ssp.csc_matrix( X_loc.reshape(-1,1) ) , ssp.csc_matrix( ( np.ones(size) , (np.arange(size),group) ) , shape = (size,10) )[:,1:] ] ).tocsc()
+		Yg    = np.random.normal( loc = loc + group / 10 , scale = scale )
+		reg0  = sdnp.QuantileRegression( ltau = ltau )
+		reg0.fit( Yg , Xs.toarray() )
+		reg1  = sdnp.QuantileRegression( ltau = ltau )
+		reg1.fit( Yg , Xs )
+		ok = reg1.is_success() and np.allclose( reg0.quantiles , reg1.quantiles , atol = 1e-5 ) and np.allclose( sdnp.quantile( Yg , ltau , Xs.tocsr() ) , reg0.quantiles , atol = 1e-5 )
+		print( "......{} (Sparse)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Sparse)" )
+##}}}
+
+def test_lmoments( size = 2500 , n_series = 20 ):##{{{
+	
+	print( "Test of lmoments" )
+	
+	Y = np.random.normal( size = (size,n_series) )
+	try:
+		lmom = sdnp.lmoments( Y , axis = 0 )
+		M    = sdnp.lmoments_matrix(size)
+		ok   = lmom.shape == (4,n_series) and np.allclose( lmom , M.T @ np.sort( Y , axis = 0 ) ) and np.allclose( sdnp.lmoments( Y[:,0] ) , lmom[:,0] )
+		print( "......{} (Axis)".format( "OK  " if ok else "FAIL" ) )
+	except:
+		print( "......FAIL (Axis)" )
+	
+	## Non-stationary L-Moments from the coefficients of the quantile regression, against the L-Moments of the quantiles
+	_,X_loc,X_scale,_ = sdt.Dataset.covariates(size)
+	Y  = np.random.normal( loc = 0.8 * X_loc , scale = 0.08 * X_scale )
+	lq = np.arange( 0.05 , 0.96 , 0.01 )
+	for X in [X_loc,np.stack( (X_loc,X_scale) ).T]:
+		try:
+			lmom = sdnp.lmoments( Y , c_Y = X , lq = lq )
+			M    = sdnp.lmoments_matrix(lq.size)
+			ok   = lmom.shape == (size,4) and np.allclose( lmom , ( M.T @ sdnp.quantile( Y , lq , X ).T ).T )
+			print( "......{} (Covariates, {} feature(s))".format( "OK  " if ok else "FAIL" , X.reshape(size,-1).shape[1] ) )
+		except:
+			print( "......FAIL (Covariates, {} feature(s))".format( X.reshape(size,-1).shape[1] ) )
 ##}}}
 
 ## Test plot
@@ -206,8 +583,21 @@ def run_all_tests( method = "MLE" , size = 2500 ):##{{{
 	test_law( sd.GEV( method = method )         , lambda loc,scale,shape : sc.genextreme.rvs( loc = loc , scale = scale , c = -shape ) , size )
 	test_gpd( method , size )
 	
+	## Test MLE
+	test_hessian( size = size )
+	test_gpd_exceedances( size = size )
+	test_gev_shape_solver()
+	test_fit_many( size = size )
+	test_fit_grid( size = size )
+	test_fit_cube( size = size )
+	test_threshold_sweep( size = size )
+	
+	## Test bootstrap
+	test_bootstrap( size = size )
+	
 	## Test non parametric
 	test_quantile_regression( size = size )
+	test_lmoments( size = size )
 	
 	## Test plot
 	test_plot( show = False )